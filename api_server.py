@@ -0,0 +1,205 @@
+"""
+Headless HTTP API for the RAG application: search, answer and streaming answer.
+
+The endpoints run the async variants of the search and answer core used by
+the Streamlit app and share the process-wide store cache, caches and
+clients. Embedding and LLM calls are awaited on the event loop and shard
+searches run on the shared thread pool, so one worker serves many
+concurrent requests.
+
+Usage:
+    uvicorn api_server:app --host 0.0.0.0 --port 8000 --workers 2
+    python api_server.py
+"""
+import json
+import os
+from typing import List, Literal, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+# Load environment variables from .env file
+load_dotenv()
+
+from utils.clients import get_shared_embeddings, get_shared_llm
+from utils.embedding_cache import aembed_query_cached
+from utils.metrics import render_metrics
+from utils.search_operations import aiter_answer_events, asearch_stores, group_results_by_source
+from utils.stores import configured_stores, resolve_store_ids, serialize_results
+from utils.warmup import is_ready, start_warmup, warmup_status
+
+INDEX_DIR = os.getenv("PATH_INDEX")
+TOP_K = int(os.getenv("TOP_K", "30"))
+MODEL_LLM = os.getenv("MODEL_LLM", "gpt-4o")
+# Modelos que os clientes podem pedir; cada um mantém um cliente e um pool HTTP próprios
+ALLOWED_MODELS = {model.strip() for model in os.getenv("API_ALLOWED_MODELS", MODEL_LLM).split(",") if model.strip()}
+
+app = FastAPI(title="RAG Conscienciologia API")
+
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    stores: Optional[List[str]] = Field(None, description="Nomes (ex.: LO, DAC) ou IDs dos stores; padrão: todos")
+    top_k: int = Field(TOP_K, ge=1, le=200)
+    mode: Optional[Literal["semantic", "hybrid"]] = None
+
+
+class AnswerRequest(SearchRequest):
+    temperature: float = Field(0.0, ge=0.0, le=2.0)
+    model: Optional[str] = None
+
+
+def request_store_ids(stores):
+    """
+    Map store names or IDs from a request to store IDs.
+
+    Only configured stores are accepted, so a request can never point the
+    loader at another directory.
+
+    Args:
+        stores (list): Store names or IDs, or None for every configured store
+
+    Returns:
+        list: Store IDs
+    """
+    if not INDEX_DIR:
+        raise HTTPException(status_code=503, detail="Diretório dos índices não configurado (PATH_INDEX)")
+    try:
+        return resolve_store_ids(stores, INDEX_DIR)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+def resolve_model(model):
+    """
+    Check the LLM model requested by a client against API_ALLOWED_MODELS.
+
+    Args:
+        model (str): Requested model, or None for MODEL_LLM
+
+    Returns:
+        str: Model name
+    """
+    model = model or MODEL_LLM
+    if model not in ALLOWED_MODELS:
+        raise HTTPException(status_code=400, detail=f"Modelo não permitido: {model} (use um de {', '.join(sorted(ALLOWED_MODELS))})")
+    return model
+
+
+def serialize_errors(errors):
+    """Convert per-store exceptions to messages."""
+    return {store_id: f"{type(error).__name__}: {error}" for store_id, error in errors.items()}
+
+
+async def run_search(request):
+    """Run the search core for a request."""
+    store_ids = request_store_ids(request.stores)
+    try:
+        return await asearch_stores(request.query, store_ids, INDEX_DIR, request.top_k,
+                                    get_shared_embeddings(), mode=request.mode)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Erro ao gerar embedding da consulta: {e}")
+
+
+def search_payload(results, errors):
+    """Build the JSON body shared by the search and answer endpoints."""
+    _, sources_sorted = group_results_by_source(results)
+    return {
+        "results": serialize_results(results),
+        "sources": sources_sorted,
+        "errors": serialize_errors(errors),
+    }
+
+
+async def answer_events(request, results, stream):
+    """Run the answer core for a request, yielding its events."""
+    # Já calculado pela busca: vem do cache de embeddings
+    query_vector = await aembed_query_cached(get_shared_embeddings(), request.query)
+    llm = get_shared_llm(resolve_model(request.model))
+    async for event in aiter_answer_events(request.query, results, llm, request.top_k,
+                                           temperature=request.temperature, query_vector=query_vector, stream=stream):
+        yield event
+
+
+@app.on_event("startup")
+async def warmup():
+    # Imports, clientes e stores carregados em segundo plano; /ready indica a conclusão
+    start_warmup(INDEX_DIR)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "warmup": warmup_status()}
+
+
+@app.get("/ready")
+async def ready():
+    """200 once the warm-up finished, 503 while it runs (for load balancers and autoscaling)."""
+    return JSONResponse(warmup_status(), status_code=200 if is_ready() else 503)
+
+
+@app.get("/stores")
+async def stores():
+    return {"stores": configured_stores()}
+
+
+@app.post("/search")
+async def search(request: SearchRequest):
+    results, errors = await run_search(request)
+    return search_payload(results, errors)
+
+
+@app.post("/answer")
+async def answer(request: AnswerRequest):
+    resolve_model(request.model)
+    results, errors = await run_search(request)
+    try:
+        final = None
+        async for event in answer_events(request, results, stream=False):
+            final = event
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Erro ao gerar resposta com LLM: {e}")
+    return dict(search_payload(results, errors), answer=final["result"], timings=final["timings"], cached=final["cached"])
+
+
+@app.post("/answer/stream")
+async def answer_stream(request: AnswerRequest):
+    """Server-sent events: one "results" event, "token" events as they arrive, then "done" (or "error")."""
+    resolve_model(request.model)
+    results, errors = await run_search(request)
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def events():
+        yield sse("results", search_payload(results, errors))
+        try:
+            async for event in answer_events(request, results, stream=True):
+                if "token" in event:
+                    yield sse("token", {"text": event["token"]})
+                else:
+                    yield sse("done", event)
+        except Exception as e:
+            yield sse("error", {"detail": f"Erro ao gerar resposta com LLM: {e}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "api_server:app",
+        host=os.getenv("API_HOST", "127.0.0.1"),
+        port=int(os.getenv("API_PORT", "8000")),
+        workers=int(os.getenv("API_WORKERS", "1")),
+    )
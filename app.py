@@ -2,15 +2,17 @@ import os
 import streamlit as st
 from dotenv import load_dotenv
 from utils.vector_store import load_vectorstore
-from utils.vector_store import initialize_embeddings
-from utils.llm_query import initialize_llm
+from utils.clients import get_shared_embeddings, get_shared_llm
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Import modular components
-from utils.ui_components import apply_custom_css, render_vector_db_selector, render_search_interface, render_results_tab
-from utils.search_operations import perform_search, generate_llm_answer
+from utils.ui_components import apply_custom_css, render_vector_db_selector, render_search_interface, render_results_tab, render_answer
+from utils.search_operations import perform_search, prefetch_selected_stores, show_answer_job, start_answer_job
+from utils.embedding_cache import embed_query_cached
+from utils.metrics import start_metrics_server
+from utils.warmup import start_warmup, warmup_status
 
 # Load configuration
 #config = load_config()
@@ -18,6 +20,17 @@ from utils.search_operations import perform_search, generate_llm_answer
 INDEX_DIR = os.getenv("PATH_INDEX")
 TOP_K = int(os.getenv("TOP_K", "30"))  # Default to 30 if not set
 MODEL_LLM = os.getenv("MODEL_LLM")
+SEARCH_MODE = os.getenv("SEARCH_MODE", "semantic").strip().lower()
+# Valor desconhecido no .env: cai para a busca semântica em vez de quebrar a página
+if SEARCH_MODE not in ("semantic", "hybrid"):
+    SEARCH_MODE = "semantic"
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1").lower() not in ("0", "false", "no")
+
+# Local Prometheus endpoint (/metrics, /ready), started once per process
+start_metrics_server()
+
+# Background warm-up of imports, clients and stores (no-op if run_app.py already started it)
+start_warmup(INDEX_DIR)
 
 # Streamlit page configuration
 st.set_page_config(page_title="RAG Conscienciologia", page_icon="🔍", layout="wide")
@@ -38,13 +51,12 @@ VECTOR_DB_OPTIONS = [
     ("QUEST", "VECTOR_STORE_ID_QUEST"),
 ]
 
-# Initialize embeddings
+# Embeddings and LLM clients shared by every session (one HTTP pool per model)
 if 'embeddings' not in st.session_state:
-    st.session_state.embeddings = initialize_embeddings()
+    st.session_state.embeddings = get_shared_embeddings()
 
-# Initialize LLM
 if 'llm' not in st.session_state:
-    st.session_state.llm = initialize_llm(model_name=MODEL_LLM, temperature=0)
+    st.session_state.llm = get_shared_llm(MODEL_LLM)
 
 # Ensure temperature is in session state
 if 'temperature' not in st.session_state:
@@ -54,13 +66,12 @@ if 'temperature' not in st.session_state:
 if 'top_k' not in st.session_state:
     st.session_state.top_k = TOP_K
 
-# Create column layout
-col1, col2 = st.columns([1, 5])
+# Widget changes rerun only the fragment that owns them (st.experimental_fragment on older Streamlit)
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
 
-# Left column - Vector Database selection and parameters
-with col1:
-    render_vector_db_selector(VECTOR_DB_OPTIONS)
-    
+@fragment
+def parameters_panel():
+    """Search parameters; changing one reruns only this panel."""
     # Adicionar controles para temperature e TOP_K
     st.markdown("### Parâmetros de Busca")
     
@@ -85,76 +96,133 @@ with col1:
         help="Controla a aleatoriedade das respostas do LLM. Valores mais baixos são mais determinísticos."
     )
     st.session_state.temperature = temperature_value
+    
+    # Controle para o modo de busca
+    search_mode_labels = {"semantic": "Semântica", "hybrid": "Híbrida (BM25 + vetorial)"}
+    search_mode_value = st.radio(
+        "Modo de busca",
+        options=list(search_mode_labels),
+        index=list(search_mode_labels).index(SEARCH_MODE),
+        format_func=search_mode_labels.get,
+        help="A busca híbrida combina termos exatos (BM25) com similaridade semântica por fusão de rankings."
+    )
+    st.session_state.search_mode = search_mode_value
 
-# Right column - Main content
-with col2:
-    st.title("RAG Conscienciologia - Consulta de Documentos")
+@fragment
+def store_panel():
+    """Vector store selection; ticking a store reruns only this panel and starts loading it."""
+    selected_ids = render_vector_db_selector(VECTOR_DB_OPTIONS)
+    
+    # Newly ticked stores load in the background while the query is typed
+    previous_ids = st.session_state.get('prefetched_store_ids', [])
+    if selected_ids != previous_ids and INDEX_DIR:
+        prefetch_selected_stores(
+            selected_ids,
+            previous_ids,
+            INDEX_DIR,
+            st.session_state.embeddings,
+            mode=st.session_state.get('search_mode', SEARCH_MODE)
+        )
+        st.session_state.prefetched_store_ids = selected_ids
+
+def results_panel():
+    """Answer and documents of the last search, drawn from session state."""
+    if 'results' not in st.session_state or 'query' not in st.session_state:
+        return
+    
+    # Tabs switch in the browser without a rerun, so an answer being generated keeps streaming
+    tab1, tab2 = st.tabs(["Resposta LLM", "Resultados da Busca"])
+    
+    # Tab 2: Search Results (rendered first so documents show while the answer is generated)
+    with tab2:
+        render_results_tab(
+            st.session_state.query,
+            st.session_state.get('answer'),
+            st.session_state.results,
+            st.session_state.grouped,
+            st.session_state.sources_sorted,
+            show_llm_answer=False,
+            key_suffix="_search_tab"
+        )
     
+    # Tab 1: LLM Answer (documents are rendered once, in the search results tab)
+    with tab1:
+        answer_placeholder = render_results_tab(
+            st.session_state.query,
+            st.session_state.get('answer'),
+            st.session_state.results,
+            st.session_state.grouped,
+            st.session_state.sources_sorted,
+            show_documents=False,
+            key_suffix="_llm_tab"
+        )
+    
+    # Generate LLM answer (streamed into the answer tab as tokens arrive). The job lives in the
+    # session, so a rerun mid-stream resumes showing it instead of calling the LLM again
+    if answer_placeholder is not None:
+        job = st.session_state.get('answer_job')
+        if job is None:
+            job = st.session_state.answer_job = start_answer_job(
+                st.session_state.query,
+                st.session_state.results,
+                st.session_state.llm,
+                st.session_state.top_k,
+                temperature=st.session_state.temperature,
+                query_vector=embed_query_cached(st.session_state.embeddings, st.session_state.query),
+                stream=LLM_STREAMING
+            )
+        answer = show_answer_job(job, answer_placeholder if LLM_STREAMING else None)
+        st.session_state.answer = answer
+        st.session_state.pop('answer_job', None)
+        render_answer(answer_placeholder, answer)
+
+@fragment
+def query_panel():
+    """Search box and results; a search or a change of view reruns only this panel."""
     # Search interface - returns both query and button state
     query, search_clicked = render_search_interface()
     
     # Handle search when button is clicked
     if search_clicked and query:
-            # Get selected vector store IDs
-            selected_vector_store_ids = st.session_state.get('vector_store_ids', [])
-            
-            # Ensure top_k is an integer
-            top_k = int(st.session_state.top_k) if st.session_state.top_k is not None else 30
-            
-            # Perform search across selected vector stores
-            all_results, grouped, sources_sorted = perform_search(
-                query, 
-                selected_vector_store_ids, 
-                INDEX_DIR, 
-                top_k
-            )
-            
-            # Store results in session state
-            if all_results:
-                st.session_state.results = all_results
-                st.session_state.query = query
-                st.session_state.grouped = grouped
-                st.session_state.sources_sorted = sources_sorted
-                
-                #LOG
-                #st.write("All_results: ", all_results)
-                st.write("Query: ",query)
-                
-                # Generate LLM answer
-                answer = generate_llm_answer(query, all_results, st.session_state.llm, st.session_state.top_k, temperature=st.session_state.temperature)
-                st.session_state.answer = answer
-
-                st.write("Answer: ", answer)
-                
-                # Force page reload to show results
-                st.rerun()
-
-    # Display results if they exist in the session
-    if 'results' in st.session_state and 'query' in st.session_state and 'answer' in st.session_state:
-        # Create tabs for results
-        tab1, tab2 = st.tabs(["Resposta LLM", "Resultados da Busca"])
+        # Get selected vector store IDs
+        selected_vector_store_ids = st.session_state.get('vector_store_ids', [])
         
-        # Tab 1: LLM Answer
-        with tab1:
-            render_results_tab(
-                st.session_state.query,
-                st.session_state.answer,
-                st.session_state.results,
-                st.session_state.grouped,
-                st.session_state.sources_sorted,
-                show_documents=False,
-                key_suffix="_llm_tab"
-            )
+        # Ensure top_k is an integer
+        top_k = int(st.session_state.top_k) if st.session_state.top_k is not None else 30
         
-        # Tab 2: Search Results
-        with tab2:
-            render_results_tab(
-                st.session_state.query,
-                st.session_state.answer,
-                st.session_state.results,
-                st.session_state.grouped,
-                st.session_state.sources_sorted,
-                show_llm_answer=False,
-                key_suffix="_search_tab"
-            )
-       
\ No newline at end of file
+        # Perform search across selected vector stores
+        all_results, grouped, sources_sorted = perform_search(
+            query, 
+            selected_vector_store_ids, 
+            INDEX_DIR, 
+            top_k,
+            mode=st.session_state.get('search_mode', SEARCH_MODE)
+        )
+        
+        # Store results in session state; the answer is generated below, after the documents are shown
+        if all_results:
+            st.session_state.results = all_results
+            st.session_state.query = query
+            st.session_state.grouped = grouped
+            st.session_state.sources_sorted = sources_sorted
+            st.session_state.pop('answer', None)
+            st.session_state.pop('answer_job', None)
+            st.session_state.pop('results_visible_search_tab', None)
+    
+    results_panel()
+
+# Create column layout
+col1, col2 = st.columns([1, 5])
+
+# Left column - Vector Database selection and parameters
+with col1:
+    store_panel()
+    parameters_panel()
+
+# Right column - Main content
+with col2:
+    st.title("RAG Conscienciologia - Consulta de Documentos")
+    warmup = warmup_status()
+    if warmup["state"] == "warming":
+        st.caption(f"⏳ Carregando índices em segundo plano ({warmup['stores_loaded']}/{warmup['stores_total']})...")
+    query_panel()
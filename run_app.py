@@ -0,0 +1,37 @@
+"""
+Start the Streamlit app with the warm-up running from server start.
+
+`streamlit run app.py` only runs app.py, and so only starts the warm-up, when
+the first browser session connects. This launcher starts the metrics
+exporter and the background warm-up first and then runs Streamlit in the
+same process, so the stores are loaded before the first user arrives and
+/ready on the metrics port tells when they are.
+
+Usage:
+    python run_app.py [streamlit options, e.g. --server.port 8501]
+"""
+import os
+import sys
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+from utils.metrics import start_metrics_server
+from utils.warmup import start_warmup
+
+
+def main():
+    start_metrics_server()
+    start_warmup(os.getenv("PATH_INDEX"))
+
+    from streamlit.web import cli as streamlit_cli
+
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    sys.argv = ["streamlit", "run", app_path] + sys.argv[1:]
+    sys.exit(streamlit_cli.main())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Shared fixtures: offline hash embeddings, small stores in a temporary
+directory and fresh process-wide caches for every test.
+"""
+import pytest
+from langchain_core.documents import Document
+
+from utils import answer_cache, context_packer, embedding_cache, index_cache
+from utils.embedding_providers import HashEmbeddings
+from utils.index_builder import build_store
+
+DIMENSION = 32
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(monkeypatch, tmp_path):
+    """Give each test empty caches, no embedding cache on disk and the offline token estimate."""
+    monkeypatch.setattr(index_cache, "_cache", index_cache.VectorStoreCache(64 * 1024 * 1024))
+    monkeypatch.setattr(embedding_cache, "_cache", embedding_cache.EmbeddingCache(128))
+    monkeypatch.setattr(answer_cache, "_cache", answer_cache.AnswerCache(64, 3600))
+    # O tokenizador do tiktoken baixa arquivos na primeira vez; os testes usam a estimativa
+    monkeypatch.setattr(context_packer, "tiktoken", None)
+    context_packer.get_encoding.cache_clear()
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "hash")
+    monkeypatch.setenv("EMBEDDING_DIM", str(DIMENSION))
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def embeddings():
+    return HashEmbeddings(dimension=DIMENSION)
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    return str(tmp_path / "indexes")
+
+
+def make_docs(source, texts):
+    """Build one Document per paragraph of a source."""
+    return [
+        Document(page_content=text, metadata={"source": source, "paragraph_number": number})
+        for number, text in enumerate(texts, start=1)
+    ]
+
+
+TOPICS = ("proéxis", "holomaturidade", "cosmoética", "assistencialidade", "evolução", "tenepes")
+
+
+def sample_texts(prefix, n):
+    """Return n distinct paragraphs mixing a few topics."""
+    return [f"{prefix} parágrafo {i} sobre {TOPICS[i % len(TOPICS)]} e {TOPICS[(i * 7 + 3) % len(TOPICS)]}" for i in range(n)]
+
+
+@pytest.fixture
+def make_store(index_dir, embeddings):
+    """Build a store in index_dir; returns its directory."""
+    def make(store_id, texts=None, spec=None, n=40):
+        docs = make_docs(store_id, texts or sample_texts(store_id, n))
+        build_store(store_id, docs, index_dir, embeddings=embeddings, index_spec=spec or {"type": "flat"})
+        return f"{index_dir}/{store_id}"
+    return make
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import sample_texts
+from utils import ann_index, clients
+from utils.ann_index import build_ann_index, evaluate_ann, exact_store_vectors, read_index_spec, resolve_nlist
+from utils.embedding_cache import embedding_model_name
+from utils.index_builder import checkpoint_path
+from utils.vector_store import load_faiss_store
+
+PQ_SPEC = {"type": "ivf_pq", "nlist": 1, "nprobe": 1, "pq_m": 4, "pq_nbits": 4}
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(clients, "_embeddings", None)
+    monkeypatch.setattr(sys, "argv", ["ann_index", *args])
+    ann_index.main()
+
+
+def test_nlist_keeps_enough_training_points():
+    assert resolve_nlist({"nlist": 0}, 100000) == 1264
+    assert resolve_nlist({"nlist": 0}, 10000) == 256
+    assert resolve_nlist({"nlist": 100}, 390) == 10
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw", "sq_fp16"])
+def test_every_type_finds_the_stored_vectors(index_type):
+    vectors = np.random.default_rng(0).standard_normal((400, 16)).astype(np.float32)
+    spec = dict(ann_index.index_spec_from_env(), type=index_type, nlist=4, nprobe=4)
+
+    rows = evaluate_ann(vectors, [spec], k=5, n_queries=50)
+
+    assert build_ann_index(vectors, spec).ntotal == 400
+    assert rows[0]["recall"] >= (1.0 if index_type == "flat" else 0.8)
+
+
+def test_lossy_store_vectors_come_from_the_build_checkpoint(make_store, index_dir, embeddings):
+    texts = sample_texts("A", 80)
+    path = make_store("A", texts, spec=PQ_SPEC)
+    vectorstore, _ = load_faiss_store(path, embeddings)
+
+    vectors = exact_store_vectors(vectorstore, path, checkpoint_path(index_dir, "A"), embedding_model_name(embeddings))
+
+    np.testing.assert_array_equal(vectors, np.array(embeddings.embed_documents(texts), dtype=np.float32))
+    assert exact_store_vectors(vectorstore, path) is None
+
+
+def test_apply_rebuilds_a_pq_store_from_exact_vectors(make_store, index_dir, embeddings, monkeypatch):
+    texts = sample_texts("A", 80)
+    path = make_store("A", texts, spec=PQ_SPEC)
+
+    run_main(monkeypatch, "--index-dir", index_dir, "--store", "A", "--apply", "flat")
+
+    vectorstore, _ = load_faiss_store(path, embeddings)
+    assert read_index_spec(path)["type"] == "flat"
+    np.testing.assert_array_equal(
+        vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal),
+        np.array(embeddings.embed_documents(texts), dtype=np.float32),
+    )
+
+
+def test_apply_refuses_a_pq_store_without_exact_vectors(make_store, index_dir, monkeypatch):
+    path = make_store("A", sample_texts("A", 80), spec=PQ_SPEC)
+    os.remove(checkpoint_path(index_dir, "A"))
+
+    with pytest.raises(SystemExit):
+        run_main(monkeypatch, "--index-dir", index_dir, "--store", "A", "--apply", "flat")
+    assert read_index_spec(path)["type"] == "ivf_pq"
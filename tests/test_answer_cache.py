@@ -0,0 +1,83 @@
+import time
+
+import numpy as np
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from conftest import make_docs
+from utils.answer_cache import AnswerCache
+from utils.search_operations import SYSTEM_PROMPT, iter_answer_events
+
+
+def docs_from(store_id, texts):
+    docs = make_docs(store_id, texts)
+    for number, doc in enumerate(docs):
+        doc.metadata.update(store_id=store_id, doc_id=f"{store_id}#{number}")
+    return docs
+
+
+def key(query, docs, model="m", temperature=0.2):
+    return AnswerCache.make_key(model, temperature, SYSTEM_PROMPT, query, docs)
+
+
+def test_key_ignores_case_and_spacing_of_the_query():
+    docs = docs_from("A", ["um", "dois"])
+
+    assert key("O que é  Proéxis?", docs) == key("o que é proéxis?", docs)
+    assert key("o que é proéxis?", docs) != key("o que é tenepes?", docs)
+    assert key("pergunta", docs) != key("pergunta", docs[::-1])
+    assert key("pergunta", docs) != key("pergunta", docs, temperature=0.7)
+
+
+def test_get_put_and_expiry():
+    cache = AnswerCache(8, ttl_seconds=0.05)
+    entry_key = key("pergunta", docs_from("A", ["um"]))
+    cache.put(entry_key, {"result": "resposta"})
+
+    assert cache.get(entry_key) == {"result": "resposta"}
+    time.sleep(0.06)
+    assert cache.get(entry_key) is None
+
+
+def test_similar_query_needs_the_same_context():
+    cache = AnswerCache(8, 3600, similarity_threshold=0.9)
+    docs = docs_from("A", ["um", "dois"])
+    cache.put(key("o que é proéxis", docs), {"result": "resposta"}, query_vector=np.array([1.0, 0.0]))
+
+    near = np.array([0.99, 0.05])
+    assert cache.get(key("que é a proéxis", docs), query_vector=near) == {"result": "resposta"}
+    assert cache.get(key("que é a proéxis", docs[:1]), query_vector=near) is None
+    assert cache.get(key("outra coisa", docs), query_vector=np.array([0.0, 1.0])) is None
+    assert cache.stats()["similar_hits"] == 1
+
+
+def test_invalidate_store_drops_its_answers():
+    cache = AnswerCache(8, 3600)
+    a_key, b_key = key("p", docs_from("A", ["um"])), key("p", docs_from("B", ["um"]))
+    cache.put(a_key, {"result": "a"})
+    cache.put(b_key, {"result": "b"})
+
+    cache.invalidate_store("A")
+
+    assert cache.get(a_key) is None and cache.get(b_key) == {"result": "b"}
+
+
+def test_lru_bound():
+    cache = AnswerCache(2, 3600)
+    keys = [key(f"pergunta {i}", docs_from("A", ["um"])) for i in range(3)]
+    for entry_key in keys:
+        cache.put(entry_key, {"result": "x"})
+
+    assert cache.get(keys[0]) is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_second_answer_comes_from_the_cache():
+    results = [(doc, 0.0) for doc in docs_from("A", ["contexto"])]
+    llm = FakeListChatModel(responses=["primeira", "segunda"])
+
+    first = list(iter_answer_events("pergunta", results, llm, 5))[-1]
+    second = list(iter_answer_events("Pergunta ", results, llm, 5))
+
+    assert not first["cached"]
+    assert second[0] == {"token": "primeira"}
+    assert second[-1]["cached"] and second[-1]["result"] == "primeira"
@@ -0,0 +1,61 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from conftest import make_docs
+from utils.search_operations import iter_answer_events, start_answer_job
+
+
+class FailingChatModel(FakeListChatModel):
+    def _call(self, *args, **kwargs):
+        raise RuntimeError("API indisponível")
+
+
+def results_for(texts):
+    return [(doc, float(i)) for i, doc in enumerate(make_docs("A", texts))]
+
+
+def test_stream_yields_tokens_then_the_final_answer():
+    llm = FakeListChatModel(responses=["Resposta curta."])
+
+    events = list(iter_answer_events("o que é proéxis?", results_for(["proéxis é ..."]), llm, 5))
+
+    tokens = [event["token"] for event in events[:-1]]
+    assert len(tokens) > 1 and "".join(tokens) == "Resposta curta."
+    final = events[-1]
+    assert final["result"] == "Resposta curta." and not final["cached"]
+    assert 0 <= final["timings"]["ttft_s"] <= final["timings"]["total_s"]
+
+
+def test_invoke_yields_one_token():
+    llm = FakeListChatModel(responses=["Resposta completa."])
+
+    events = list(iter_answer_events("pergunta", results_for(["contexto"]), llm, 5, stream=False))
+
+    assert events[0] == {"token": "Resposta completa."}
+    assert events[-1]["result"] == "Resposta completa."
+
+
+def test_no_results_skips_the_model():
+    events = list(iter_answer_events("pergunta", [], FailingChatModel(responses=[""]), 5))
+
+    assert events == [{"result": "Nenhum resultado encontrado.", "timings": {"ttft_s": 0.0, "total_s": 0.0}, "cached": False}]
+
+
+def test_model_errors_propagate():
+    with pytest.raises(RuntimeError):
+        list(iter_answer_events("pergunta", results_for(["contexto"]), FailingChatModel(responses=[""]), 5, stream=False))
+
+
+def test_answer_job_collects_tokens_in_the_background():
+    job = start_answer_job("pergunta", results_for(["contexto"]), FakeListChatModel(responses=["abc"]), 5)
+
+    assert job["done"].wait(5)
+    assert job["error"] is None
+    assert "".join(job["chunks"]) == "abc" and job["result"]["result"] == "abc"
+
+
+def test_answer_job_keeps_the_error():
+    job = start_answer_job("pergunta", results_for(["contexto"]), FailingChatModel(responses=[""]), 5, stream=False)
+
+    assert job["done"].wait(5)
+    assert isinstance(job["error"], RuntimeError)
@@ -0,0 +1,99 @@
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import api_server
+from utils import clients
+
+
+@pytest.fixture
+def api(make_store, index_dir, embeddings, monkeypatch):
+    """API over stores A and B, with the hash embeddings and a fake LLM as the shared clients."""
+    for key in [key for key in os.environ if key.startswith("VECTOR_STORE_ID_")]:
+        monkeypatch.delenv(key)
+    for name in ("A", "B"):
+        make_store(name)
+    monkeypatch.setenv("VECTOR_STORE_ID_LO", "A")
+    monkeypatch.setenv("VECTOR_STORE_ID_DAC", "B")
+    monkeypatch.setattr(api_server, "INDEX_DIR", index_dir)
+    monkeypatch.setattr(api_server, "MODEL_LLM", "modelo-teste")
+    monkeypatch.setattr(api_server, "ALLOWED_MODELS", {"modelo-teste"})
+    monkeypatch.setattr(clients, "_embeddings", embeddings)
+    monkeypatch.setattr(clients, "_llms", {"modelo-teste": FakeListChatModel(responses=["Resposta do modelo."])})
+    # Sem o bloco with, o TestClient não dispara o aquecimento do startup
+    return TestClient(api_server.app)
+
+
+def test_stores_lists_the_configured_stores(api):
+    assert api.get("/stores").json() == {"stores": {"LO": "A", "DAC": "B"}}
+
+
+def test_search_by_store_name(api):
+    response = api.post("/search", json={"query": "proéxis", "stores": ["lo"], "top_k": 4})
+
+    body = response.json()
+    assert response.status_code == 200
+    assert len(body["results"]) == 4 and body["errors"] == {}
+    assert {result["metadata"]["store_id"] for result in body["results"]} == {"A"}
+
+
+def test_search_defaults_to_every_store(api):
+    body = api.post("/search", json={"query": "proéxis", "top_k": 50}).json()
+
+    assert {result["metadata"]["store_id"] for result in body["results"]} == {"A", "B"}
+
+
+@pytest.mark.parametrize("store", ["XYZ", "../A", "/tmp"])
+def test_unknown_store_is_404(api, store):
+    response = api.post("/search", json={"query": "proéxis", "stores": [store]})
+
+    assert response.status_code == 404
+    assert "não encontrado" in response.json()["detail"]
+
+
+def test_missing_index_dir_is_503(api, monkeypatch):
+    monkeypatch.setattr(api_server, "INDEX_DIR", None)
+
+    assert api.post("/search", json={"query": "proéxis"}).status_code == 503
+
+
+def test_invalid_request_is_422(api):
+    assert api.post("/search", json={"query": ""}).status_code == 422
+    assert api.post("/search", json={"query": "proéxis", "top_k": 0}).status_code == 422
+
+
+def test_answer_uses_the_default_model(api):
+    body = api.post("/answer", json={"query": "proéxis", "stores": ["LO"], "top_k": 3}).json()
+
+    assert body["answer"] == "Resposta do modelo."
+    assert len(body["results"]) == 3 and not body["cached"]
+
+
+def test_model_outside_the_allow_list_is_400(api):
+    response = api.post("/answer", json={"query": "proéxis", "model": "gpt-4-32k"})
+
+    assert response.status_code == 400
+    assert "não permitido" in response.json()["detail"]
+    assert "gpt-4-32k" not in clients._llms
+
+
+def test_stream_sends_results_tokens_and_done(api):
+    response = api.post("/answer/stream", json={"query": "proéxis", "stores": ["DAC"], "top_k": 3})
+
+    events = [(block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+              for block in response.text.strip().split("\n\n")]
+    names = [name for name, _ in events]
+    assert names[0] == "results" and names[-1] == "done"
+    assert set(names[1:-1]) == {"token"}
+    assert "".join(data["text"] for name, data in events if name == "token") == "Resposta do modelo."
+    assert events[-1][1]["result"] == "Resposta do modelo."
+
+
+def test_metrics_endpoint(api):
+    response = api.get("/metrics")
+
+    assert response.status_code == 200
+    assert "rag_stage_seconds" in response.text
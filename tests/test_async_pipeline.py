@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from conftest import make_docs
+from utils.search_operations import agenerate_llm_answer, aiter_answer_events, asearch_stores, iter_answer_events, search_stores
+
+
+class FailingChatModel(FakeListChatModel):
+    def _call(self, *args, **kwargs):
+        raise RuntimeError("API indisponível")
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+@pytest.mark.parametrize("mode", ["semantic", "hybrid"])
+def test_async_search_matches_search(make_store, index_dir, embeddings, mode):
+    make_store("A")
+    make_store("B")
+
+    expected, _ = search_stores("proéxis e tenepes", ["A", "B", "X"], index_dir, 6, embeddings, mode=mode)
+    results, errors = asyncio.run(asearch_stores("proéxis e tenepes", ["A", "B", "X"], index_dir, 6, embeddings, mode=mode))
+
+    assert set(errors) == {"X"}
+    assert [(doc.page_content, score) for doc, score in results] == [(doc.page_content, score) for doc, score in expected]
+
+
+def test_async_answer_events_match_the_sync_ones():
+    results = [(doc, 0.1) for doc in make_docs("A", ["proéxis é ..."])]
+
+    events = asyncio.run(collect(aiter_answer_events("pergunta", results, FakeListChatModel(responses=["abc"]), 5)))
+
+    assert [event["token"] for event in events[:-1]] == ["a", "b", "c"]
+    assert events[-1]["result"] == "abc" and not events[-1]["cached"]
+    # A resposta foi para o cache compartilhado com o caminho síncrono
+    cached = list(iter_answer_events("pergunta", results, FakeListChatModel(responses=["outra"]), 5))
+    assert cached[-1]["result"] == "abc" and cached[-1]["cached"]
+
+
+def test_async_answer_reads_the_cache_of_the_sync_path():
+    results = [(doc, 0.1) for doc in make_docs("A", ["contexto"])]
+    list(iter_answer_events("pergunta", results, FakeListChatModel(responses=["resposta"]), 5))
+
+    final = asyncio.run(agenerate_llm_answer("pergunta", results, FakeListChatModel(responses=["outra"]), 5))
+
+    assert final["result"] == "resposta" and final["cached"]
+
+
+def test_async_model_errors_propagate():
+    results = [(doc, 0.1) for doc in make_docs("A", ["contexto"])]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(agenerate_llm_answer("pergunta", results, FailingChatModel(responses=[""]), 5))
+
+
+def test_async_answer_without_results():
+    final = asyncio.run(agenerate_llm_answer("pergunta", [], FailingChatModel(responses=[""]), 5))
+
+    assert final["result"] == "Nenhum resultado encontrado."
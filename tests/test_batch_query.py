@@ -0,0 +1,109 @@
+import io
+import json
+import os
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from conftest import DIMENSION
+from utils.batch_query import read_queries, run_batch
+from utils.embedding_cache import embed_query_cached
+from utils.embedding_providers import HashEmbeddings
+from utils.sharded_index import ShardedIndex
+from utils.stores import resolve_store_ids
+
+
+class FlakyEmbeddings(HashEmbeddings):
+    """Fails every batch containing the word "falha"."""
+
+    def embed_documents(self, texts):
+        if any("falha" in text for text in texts):
+            raise ConnectionError("provedor fora do ar")
+        return super().embed_documents(texts)
+
+
+def run(queries, index_dir, embeddings, **kwargs):
+    output = io.StringIO()
+    written = run_batch(queries, output, index_dir, ["A", "B"], 3, embeddings, **kwargs)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert written == len(records)
+    return records
+
+
+@pytest.fixture
+def stores(make_store):
+    make_store("A")
+    make_store("B")
+
+
+def test_records_keep_the_input_order_across_chunks(stores, index_dir, embeddings):
+    queries = [{"id": f"q{i}", "query": f"proéxis {i}"} for i in range(7)]
+
+    records = run(queries, index_dir, embeddings, batch_size=3)
+
+    assert [record["id"] for record in records] == [f"q{i}" for i in range(7)]
+    assert all(len(record["results"]) == 3 and record["errors"] == {} for record in records)
+
+
+def test_batch_results_match_single_searches(stores, index_dir, embeddings):
+    queries = [{"id": 1, "query": "tenepes"}, {"id": 2, "query": "cosmoética e evolução"}]
+
+    records = run(queries, index_dir, embeddings)
+
+    index = ShardedIndex(index_dir, embeddings)
+    for query, record in zip(queries, records):
+        single, _ = index.search(embed_query_cached(embeddings, query["query"]), 3, ["A", "B"])
+        assert [result["score"] for result in record["results"]] == pytest.approx([score for _, score in single])
+
+
+def test_invalid_rows_become_error_records(stores, index_dir, embeddings, tmp_path):
+    path = tmp_path / "consultas.jsonl"
+    path.write_text('{"id": "a", "query": "proéxis"}\n{quebrado\n42\n{"id": "b", "query": "   "}\n"tenepes"\n', encoding="utf-8")
+
+    records = run(read_queries(str(path)), index_dir, embeddings)
+
+    assert [record["id"] for record in records] == ["a", 2, 3, "b", 5]
+    assert "results" in records[0] and "results" in records[4]
+    assert records[1]["error"].startswith("JSON inválido")
+    assert records[2]["error"].startswith("Linha inválida")
+    assert records[3]["error"] == "Consulta vazia"
+
+
+def test_failed_chunk_is_recorded_and_the_run_continues(stores, index_dir):
+    queries = [{"id": i, "query": text} for i, text in enumerate(["proéxis", "falha", "tenepes", "evolução"])]
+
+    records = run(queries, index_dir, FlakyEmbeddings(dimension=DIMENSION), batch_size=2)
+
+    assert [record["id"] for record in records] == [0, 1, 2, 3]
+    assert "ConnectionError" in records[0]["error"] and "ConnectionError" in records[1]["error"]
+    assert "results" in records[2] and "results" in records[3]
+
+
+def test_answers_are_added_to_each_record(stores, index_dir, embeddings):
+    queries = [{"id": i, "query": f"proéxis {i}"} for i in range(4)]
+
+    records = run(queries, index_dir, embeddings, llm=FakeListChatModel(responses=["resposta"]), batch_size=2)
+
+    assert [record["id"] for record in records] == [0, 1, 2, 3]
+    assert all(record["answer"] == "resposta" for record in records)
+
+
+def test_csv_queries(tmp_path):
+    path = tmp_path / "consultas.csv"
+    path.write_text("id,pergunta\nx,proéxis\ny,tenepes\n", encoding="utf-8")
+
+    assert list(read_queries(str(path))) == [{"id": "x", "query": "proéxis"}, {"id": "y", "query": "tenepes"}]
+
+
+def test_store_names_resolve_to_configured_ids(make_store, index_dir, monkeypatch):
+    for key in [key for key in os.environ if key.startswith("VECTOR_STORE_ID_")]:
+        monkeypatch.delenv(key)
+    make_store("A")
+    monkeypatch.setenv("VECTOR_STORE_ID_LO", "A")
+    monkeypatch.setenv("VECTOR_STORE_ID_DAC", "B")
+
+    assert resolve_store_ids(["lo", "A"], index_dir) == ["A", "A"]
+    assert sorted(resolve_store_ids(None, index_dir)) == ["A", "B"]
+    for store in ("DAC", "C", "../A"):
+        with pytest.raises(ValueError, match="não encontrado"):
+            resolve_store_ids([store], index_dir)
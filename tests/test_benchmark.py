@@ -0,0 +1,53 @@
+import pytest
+
+from utils.benchmark import build_synthetic_stores, compare_runs, latency_summary, measure_index_quality, run_corpus, synthetic_queries
+
+
+@pytest.fixture
+def corpus(index_dir, embeddings):
+    return build_synthetic_stores(index_dir, 300, 2, embeddings, {"type": "flat"}, vocab_size=500)
+
+
+def test_synthetic_stores_are_reused(corpus, index_dir, embeddings):
+    again = build_synthetic_stores(index_dir, 300, 2, embeddings, {"type": "flat"}, vocab_size=500)
+
+    assert not corpus["reused"] and again["reused"]
+    assert again["store_ids"] == ["bench00", "bench01"]
+
+
+@pytest.mark.parametrize("spec, min_recall", [({"type": "flat"}, 1.0), ({"type": "sq8"}, 0.95)])
+def test_index_quality_reports_recall_and_compression(index_dir, embeddings, spec, min_recall):
+    corpus = build_synthetic_stores(index_dir, 300, 2, embeddings, spec, vocab_size=500)
+
+    quality = measure_index_quality(index_dir, corpus, synthetic_queries(corpus, 10), embeddings, top_k=5)
+
+    assert quality["recall"] >= min_recall
+    assert quality["compression"] >= (3.5 if spec["type"] == "sq8" else 0.99)
+
+
+def test_run_separates_the_cold_query(corpus, index_dir, embeddings):
+    result = run_corpus(index_dir, corpus, synthetic_queries(corpus, 4), embeddings, llm=None, top_k=5, answer=False)
+
+    assert result["queries"] == 3 and result["cold"]["search_ms"] > 0
+    assert result["search"]["p50_ms"] <= result["search"]["p99_ms"]
+    assert "embed_query" in result["stages"]
+
+
+def test_latency_summary():
+    summary = latency_summary([0.001 * i for i in range(1, 101)])
+
+    assert summary["p50_ms"] == pytest.approx(50.5)
+    assert summary["p99_ms"] == pytest.approx(99.01)
+    assert latency_summary([])["p95_ms"] == 0.0
+
+
+def test_comparison_flags_slower_measures():
+    def run(search_p95, stage_p95):
+        summary = lambda p95: {"p50_ms": p95, "p95_ms": p95, "p99_ms": p95, "mean_ms": p95}
+        return {"runs": [{"paragraphs": 300, "stores": 2, "search": summary(search_p95),
+                          "end_to_end": summary(search_p95), "stages": {"faiss_search": summary(stage_p95)}}]}
+
+    rows = compare_runs(run(12.0, 5.0), run(10.0, 5.0))
+
+    flagged = {measure: regression for _, measure, _, _, _, regression in rows}
+    assert flagged == {"search": True, "end_to_end": True, "stage:faiss_search": False}
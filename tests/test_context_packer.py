@@ -0,0 +1,48 @@
+from conftest import make_docs
+from utils.context_packer import annotate_token_counts, count_tokens, document_tokens, pack_context, truncate_at_sentence
+
+MODEL = "gpt-4o"
+
+
+def test_passages_keep_rank_order_within_the_budget():
+    docs = make_docs("A", [f"Trecho {i} " + "palavra " * 20 for i in range(10)])
+
+    passages = pack_context(docs, MODEL, token_budget=150, max_passage_tokens=800)
+
+    # O último trecho é cortado no que sobra do orçamento
+    assert passages[:-1] == [doc.page_content.strip() for doc in docs[:len(passages) - 1]]
+    assert docs[len(passages) - 1].page_content.startswith(passages[-1])
+    assert 1 < len(passages) < 10
+    assert sum(count_tokens(passage, MODEL) + count_tokens("\n\n", MODEL) for passage in passages) <= 150
+
+
+def test_duplicates_and_near_duplicates_are_dropped():
+    base = "A proéxis é a programação existencial específica de cada consciência intrafísica nesta vida."
+    docs = make_docs("A", [base, "  " + base.upper() + " ", base + " Sim.", "Outro assunto: tenepes diária."])
+
+    passages = pack_context(docs, MODEL, near_duplicate_threshold=0.8)
+
+    assert passages == [base, "Outro assunto: tenepes diária."]
+
+
+def test_long_passage_is_cut_at_a_sentence():
+    text = "Primeira frase curta. Segunda frase também curta. " + "Terceira frase muito longa " * 30 + "."
+
+    passages = pack_context(make_docs("A", [text]), MODEL, max_passage_tokens=20)
+
+    assert passages == ["Primeira frase curta. Segunda frase também curta."]
+
+
+def test_truncation_without_sentence_boundary_respects_the_limit():
+    text = "palavra " * 100
+
+    assert count_tokens(truncate_at_sentence(text, 10, MODEL), MODEL) <= 10
+
+
+def test_precomputed_token_counts_are_reused():
+    docs = annotate_token_counts(make_docs("A", ["texto qualquer"]), MODEL)
+    docs[0].metadata["token_count"] = 999
+
+    assert document_tokens(docs[0], MODEL) == 999
+    docs[0].metadata["token_encoding"] = "outro"
+    assert document_tokens(docs[0], MODEL) == count_tokens("texto qualquer", MODEL)
@@ -0,0 +1,99 @@
+import asyncio
+
+import numpy as np
+
+from utils.embedding_cache import (
+    EmbeddingCache,
+    aembed_query_cached,
+    embed_queries_cached,
+    embed_query_cached,
+    embedding_model_name,
+    get_embedding_cache,
+    normalize_query_text,
+)
+
+
+class CountingEmbeddings:
+    """Wraps an embeddings object and counts the texts sent to it."""
+
+    def __init__(self, embeddings):
+        self.inner = embeddings
+        self.model = embeddings.model
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return self.inner.embed_query(text)
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+    def embed_documents(self, texts):
+        self.calls.extend(texts)
+        return self.inner.embed_documents(texts)
+
+
+def test_normalize_query_text():
+    assert normalize_query_text("  o que   é\tproéxis? ") == "o que é proéxis?"
+
+
+def test_query_is_embedded_once(embeddings):
+    counting = CountingEmbeddings(embeddings)
+
+    first = embed_query_cached(counting, "o que é proéxis")
+    second = embed_query_cached(counting, "o  que é proéxis ")
+
+    assert counting.calls == ["o que é proéxis"]
+    np.testing.assert_array_equal(first, second)
+    assert not first.flags.writeable
+
+
+def test_async_query_uses_the_same_cache(embeddings):
+    counting = CountingEmbeddings(embeddings)
+    vector = embed_query_cached(counting, "tenepes")
+
+    cached = asyncio.run(aembed_query_cached(counting, "tenepes"))
+
+    assert counting.calls == ["tenepes"]
+    np.testing.assert_array_equal(vector, cached)
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    db_path = str(tmp_path / "embeddings.sqlite")
+    EmbeddingCache(8, db_path).put("m", "consciência", [1.0, 2.0])
+
+    cache = EmbeddingCache(8, db_path)
+
+    np.testing.assert_array_equal(cache.get("m", "consciência"), np.array([1.0, 2.0], dtype=np.float32))
+    assert cache.get("outro", "consciência") is None
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_memory_tier_is_bounded():
+    cache = EmbeddingCache(2)
+    for text in ("a", "b", "c"):
+        cache.put("m", text, [0.0])
+
+    assert cache.get("m", "a") is None
+    assert cache.stats()["memory_entries"] == 2
+
+
+def test_batch_embeds_only_missing_queries_once(embeddings):
+    counting = CountingEmbeddings(embeddings)
+    embed_query_cached(counting, "proéxis")
+
+    vectors = embed_queries_cached(counting, ["proéxis", "cosmoética", "cosmoética", "tenepes"])
+
+    assert sorted(counting.calls) == ["cosmoética", "proéxis", "tenepes"]
+    assert len(vectors) == 4
+    np.testing.assert_array_equal(vectors[1], vectors[2])
+    assert get_embedding_cache().get(embedding_model_name(counting), "tenepes") is not None
+
+
+def test_model_name_includes_output_dimension(embeddings):
+    class Sized:
+        model = "text-embedding-3-small"
+        dimensions = 256
+
+    assert embedding_model_name(Sized()) == "text-embedding-3-small@256"
+    assert embedding_model_name(embeddings) == embeddings.model
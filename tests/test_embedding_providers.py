@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from utils.embedding_providers import HashEmbeddings, get_embedding_provider
+
+
+def test_hash_vectors_are_deterministic_and_normalized():
+    embeddings = HashEmbeddings(dimension=32)
+    texts = ["proéxis e cosmoética", "tenepes diária", "proéxis e cosmoética"]
+
+    vectors = np.array(embeddings.embed_documents(texts))
+
+    assert vectors.shape == (3, 32)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+    np.testing.assert_array_equal(vectors[0], vectors[2])
+    np.testing.assert_array_equal(vectors[0], HashEmbeddings(dimension=32).embed_query(texts[0]))
+
+
+def test_similar_texts_are_closer_than_unrelated_ones():
+    embeddings = HashEmbeddings(dimension=256)
+    query, similar, unrelated = (np.array(v) for v in embeddings.embed_documents(
+        ["proéxis e cosmoética", "cosmoética na proéxis", "receita de bolo de fubá"]))
+
+    assert query @ similar > query @ unrelated
+
+
+def test_provider_comes_from_the_environment(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "hash")
+    monkeypatch.setenv("EMBEDDING_DIM", "48")
+
+    embeddings = get_embedding_provider()
+
+    assert isinstance(embeddings, HashEmbeddings)
+    assert len(embeddings.embed_query("proéxis")) == 48
+
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(ValueError, match="desconhecido"):
+        get_embedding_provider("inexistente")
+
+
+def test_openai_provider_requires_an_api_key(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    pytest.importorskip("langchain_openai")
+
+    with pytest.raises(ValueError, match="OPENAI_API_KEY"):
+        get_embedding_provider("openai")
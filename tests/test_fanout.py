@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.fanout import afan_out, fan_out
+
+
+def fail():
+    raise ValueError("falhou")
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        yield executor
+
+
+def test_results_and_errors_are_reported_per_task(executor):
+    outcomes = {outcome.key: outcome for outcome in fan_out({"a": lambda: 1, "b": fail}, executor=executor)}
+
+    assert outcomes["a"].result == 1 and outcomes["a"].error is None
+    assert isinstance(outcomes["b"].error, ValueError)
+
+
+def test_outcomes_arrive_in_completion_order(executor):
+    tasks = {"lento": lambda: time.sleep(0.2) or "lento", "rápido": lambda: "rápido"}
+
+    assert [outcome.key for outcome in fan_out(tasks, executor=executor)] == ["rápido", "lento"]
+
+
+def test_slow_task_times_out_without_blocking_the_others(executor):
+    release = threading.Event()
+    tasks = {"preso": lambda: release.wait(5), "ok": lambda: "ok"}
+
+    start = time.perf_counter()
+    outcomes = {outcome.key: outcome for outcome in fan_out(tasks, timeout=0.2, executor=executor)}
+    release.set()
+
+    assert time.perf_counter() - start < 2
+    assert outcomes["ok"].result == "ok"
+    assert isinstance(outcomes["preso"].error, TimeoutError)
+
+
+def test_task_waiting_for_a_worker_times_out():
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        tasks = {"ocupa": lambda: release.wait(5), "na_fila": lambda: "nunca"}
+        outcomes = {outcome.key: outcome for outcome in fan_out(tasks, timeout=0.2, executor=executor)}
+        release.set()
+
+    assert isinstance(outcomes["na_fila"].error, TimeoutError)
+    assert "worker" in str(outcomes["na_fila"].error)
+
+
+def test_async_fan_out_matches_fan_out(executor):
+    release = threading.Event()
+
+    async def collect():
+        tasks = {"a": lambda: 1, "b": fail, "preso": lambda: release.wait(5)}
+        return {outcome.key: outcome async for outcome in afan_out(tasks, timeout=0.2, executor=executor)}
+
+    outcomes = asyncio.run(collect())
+    release.set()
+
+    assert outcomes["a"].result == 1
+    assert isinstance(outcomes["b"].error, ValueError)
+    assert isinstance(outcomes["preso"].error, TimeoutError)
+
+
+@pytest.mark.parametrize("timeout", [None, 1.0])
+def test_empty_task_set(timeout):
+    assert list(fan_out({}, timeout=timeout)) == []
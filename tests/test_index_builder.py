@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+from conftest import make_docs, sample_texts
+from utils import index_builder
+from utils.index_builder import (
+    VectorCheckpoint,
+    assign_document_ids,
+    build_store,
+    checkpoint_path,
+    embed_missing,
+    load_markdown_documents,
+    RateLimiter,
+)
+from utils.vector_store import load_faiss_store
+
+
+class CountingEmbeddings:
+    def __init__(self, embeddings, fail_after=None):
+        self.inner = embeddings
+        self.model = embeddings.model
+        self.dimension = embeddings.dimension
+        self.embedded = []
+        self.fail_after = fail_after
+
+    def embed_documents(self, texts):
+        if self.fail_after is not None and len(self.embedded) >= self.fail_after:
+            raise RuntimeError("limite da API")
+        self.embedded.extend(texts)
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.inner.embed_query(text)
+
+
+def test_markdown_paragraphs_become_documents(tmp_path):
+    (tmp_path / "livro.md").write_text("Primeiro parágrafo.\n\nSegundo\nparágrafo.\n\n\n", encoding="utf-8")
+    (tmp_path / "notas.txt").write_text("ignorado", encoding="utf-8")
+
+    docs = load_markdown_documents(str(tmp_path))
+
+    assert [doc.page_content for doc in docs] == ["Primeiro parágrafo.", "Segundo\nparágrafo."]
+    assert [doc.metadata for doc in docs] == [
+        {"source": "livro", "paragraph_number": 1},
+        {"source": "livro", "paragraph_number": 2},
+    ]
+
+
+def test_repeated_ids_get_a_suffix():
+    docs = make_docs("A", ["um", "dois"]) + make_docs("A", ["três"])
+
+    assert assign_document_ids(docs) == ["A#1", "A#2", "A#1~1"]
+
+
+def test_rebuild_embeds_only_new_or_edited_paragraphs(index_dir, embeddings):
+    texts = sample_texts("A", 20)
+    counting = CountingEmbeddings(embeddings)
+    build_store("A", make_docs("A", texts), index_dir, embeddings=counting, index_spec={"type": "flat"})
+
+    edited = texts[:19] + ["parágrafo editado"] + ["parágrafo novo"]
+    counting.embedded.clear()
+    stats = build_store("A", make_docs("A", edited), index_dir, embeddings=counting, index_spec={"type": "flat"})
+
+    assert sorted(counting.embedded) == ["parágrafo editado", "parágrafo novo"]
+    assert (stats["documents"], stats["reused"], stats["embedded"]) == (21, 19, 2)
+    vectorstore, _ = load_faiss_store(f"{index_dir}/A", embeddings)
+    assert vectorstore.index.ntotal == 21
+
+
+def test_interrupted_build_resumes_from_the_checkpoint(index_dir, embeddings, monkeypatch):
+    monkeypatch.setattr(index_builder, "EMBED_RETRIES", 1)
+    texts = sample_texts("A", 30)
+    failing = CountingEmbeddings(embeddings, fail_after=10)
+    with pytest.raises(RuntimeError):
+        build_store("A", make_docs("A", texts), index_dir, embeddings=failing, batch_size=10, max_workers=1,
+                    index_spec={"type": "flat"})
+
+    resumed = CountingEmbeddings(embeddings)
+    stats = build_store("A", make_docs("A", texts), index_dir, embeddings=resumed, batch_size=10, max_workers=1,
+                        index_spec={"type": "flat"})
+
+    assert stats["reused"] == 10 and len(resumed.embedded) == 20
+
+
+def test_embed_missing_fills_the_checkpoint(index_dir, embeddings):
+    checkpoint = VectorCheckpoint(checkpoint_path(index_dir, "A"), embeddings.model)
+    try:
+        texts = {f"h{i}": text for i, text in enumerate(sample_texts("A", 7))}
+        embedded = embed_missing(texts, embeddings, checkpoint, 3, 2, RateLimiter(6000, 1e6))
+
+        assert embedded == 7
+        assert checkpoint.known_hashes() == set(texts)
+    finally:
+        checkpoint.close()
+
+
+def test_rate_limiter_waits_for_the_budget():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=1e6)
+    limiter._requests = 0.0
+
+    start = time.monotonic()
+    limiter.acquire(1)
+
+    assert time.monotonic() - start >= 0.05
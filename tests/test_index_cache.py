@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from conftest import make_docs, sample_texts
+from utils.index_builder import build_store
+from utils.index_cache import VectorStoreCache, get_vectorstore_cache, store_fingerprint
+
+
+def test_second_get_is_a_hit(make_store, embeddings):
+    path = make_store("A")
+    cache = VectorStoreCache(64 * 1024 * 1024)
+
+    first = cache.get("A", path, embeddings)
+    second = cache.get("A", path, embeddings)
+
+    assert first is second
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert cache.fingerprint("A", path) == store_fingerprint(path)
+
+
+def test_same_store_id_in_two_directories_is_cached_separately(tmp_path, embeddings):
+    first_dir, second_dir = str(tmp_path / "one"), str(tmp_path / "two")
+    build_store("A", make_docs("A", sample_texts("um", 10)), first_dir, embeddings=embeddings, index_spec={"type": "flat"})
+    build_store("A", make_docs("A", sample_texts("dois", 12)), second_dir, embeddings=embeddings, index_spec={"type": "flat"})
+    cache = VectorStoreCache(64 * 1024 * 1024)
+
+    first = cache.get("A", os.path.join(first_dir, "A"), embeddings)
+    second = cache.get("A", os.path.join(second_dir, "A"), embeddings)
+
+    assert first is not second
+    assert (first.index.ntotal, second.index.ntotal) == (10, 12)
+    assert cache.cached_store_ids() == ["A", "A"]
+    assert len(cache.fingerprint("A")) == 2
+
+
+def test_rebuilt_store_is_reloaded_and_listeners_notified(make_store, embeddings):
+    path = make_store("A", n=10)
+    cache = VectorStoreCache(64 * 1024 * 1024)
+    reloaded = []
+    cache.add_reload_listener(reloaded.append)
+    cache.get("A", path, embeddings)
+
+    make_store("A", n=15)
+    vectorstore = cache.get("A", path, embeddings)
+
+    assert vectorstore.index.ntotal == 15
+    assert reloaded == ["A"]
+    assert cache.stats()["reloads"] == 1
+
+
+def test_budget_evicts_least_recently_used(make_store, embeddings):
+    paths = {store_id: make_store(store_id) for store_id in ("A", "B", "C")}
+    probe = VectorStoreCache(64 * 1024 * 1024)
+    probe.get("A", paths["A"], embeddings)
+    cache = VectorStoreCache(int(probe.used_bytes() * 2.5))
+
+    for store_id in ("A", "B"):
+        cache.get(store_id, paths[store_id], embeddings)
+    cache.get("A", paths["A"], embeddings)
+    cache.get("C", paths["C"], embeddings)
+
+    assert cache.cached_store_ids() == ["A", "C"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_demoted_store_is_evicted_first(make_store, embeddings):
+    paths = {store_id: make_store(store_id) for store_id in ("A", "B")}
+    cache = VectorStoreCache(64 * 1024 * 1024)
+    for store_id in ("A", "B"):
+        cache.get(store_id, paths[store_id], embeddings)
+
+    assert cache.demote("B", paths["B"])
+    assert cache.cached_store_ids() == ["B", "A"]
+    assert not cache.demote("C")
+
+
+def test_contains_and_invalidate(make_store, embeddings):
+    path = make_store("A")
+    cache = VectorStoreCache(64 * 1024 * 1024)
+    assert not cache.contains(path)
+
+    cache.get("A", path, embeddings)
+    assert cache.contains(path + os.sep)
+
+    cache.invalidate("A")
+    assert not cache.contains(path)
+
+
+def test_missing_store_raises(index_dir, embeddings):
+    with pytest.raises(FileNotFoundError):
+        get_vectorstore_cache().get("X", os.path.join(index_dir, "X"), embeddings)
@@ -0,0 +1,127 @@
+import json
+import os
+
+import pytest
+
+from conftest import make_docs, sample_texts
+from utils import vector_store
+from utils.embedding_cache import embed_query_cached
+from utils.index_cache import load_consistent
+from utils.index_mutation import (
+    WRITE_LOCK_FILE, StoreWriteLock, compact_store, delete_documents, load_tombstones, upsert_documents
+)
+from utils.sharded_index import ShardedIndex
+from utils.vector_store import SWAP_MARKER, load_faiss_store, read_swap_marker, recover_store_swap, stale_swap
+
+
+def store_contents(path, embeddings):
+    vectorstore, _ = load_faiss_store(path, embeddings)
+    return {doc_id: vectorstore.docstore.search(doc_id).page_content
+            for doc_id in vectorstore.index_to_docstore_id.values()}
+
+
+def test_upsert_adds_and_replaces_by_stable_id(make_store, index_dir, embeddings):
+    path = make_store("A", n=10)
+    docs = make_docs("A", ["texto novo do primeiro parágrafo"])
+    docs += make_docs("B", ["parágrafo de outra fonte"])
+
+    counts = upsert_documents(index_dir, "A", docs, embeddings)
+
+    contents = store_contents(path, embeddings)
+    assert counts == {"added": 1, "replaced": 1}
+    assert len(contents) == 11
+    assert contents["A#1"] == "texto novo do primeiro parágrafo"
+    assert contents["B#1"] == "parágrafo de outra fonte"
+
+
+def test_upsert_without_replace_refuses_existing_ids(make_store, index_dir, embeddings):
+    make_store("A", n=10)
+
+    with pytest.raises(ValueError, match="já existem"):
+        upsert_documents(index_dir, "A", make_docs("A", ["outro texto"]), embeddings, replace=False)
+
+
+def test_deleted_documents_are_not_returned_by_searches(make_store, index_dir, embeddings):
+    path = make_store("A", n=12)
+    deleted = [f"A#{i}" for i in range(1, 7)]
+
+    assert delete_documents(index_dir, "A", deleted) == 6
+
+    results, errors = ShardedIndex(index_dir, embeddings).search(embed_query_cached(embeddings, "proéxis"), 10, ["A"])
+    assert errors == {}
+    assert load_tombstones(path) == frozenset(deleted)
+    assert len(results) == 6
+    assert not {f"A#{doc.metadata['paragraph_number']}" for doc, _ in results} & set(deleted)
+
+
+def test_compaction_drops_tombstoned_vectors(make_store, index_dir, embeddings):
+    path = make_store("A", n=12)
+    delete_documents(index_dir, "A", ["A#2", "A#5"])
+
+    assert compact_store(index_dir, "A", embeddings) == 2
+
+    contents = store_contents(path, embeddings)
+    assert len(contents) == 10 and not {"A#2", "A#5"} & set(contents)
+    assert load_tombstones(path) == frozenset()
+    assert compact_store(index_dir, "A", embeddings) == 0
+
+
+def test_readding_a_deleted_document_clears_its_tombstone(make_store, index_dir, embeddings):
+    path = make_store("A", n=10)
+    delete_documents(index_dir, "A", ["A#1", "A#2"])
+
+    upsert_documents(index_dir, "A", make_docs("A", ["primeiro parágrafo de volta"]), embeddings)
+
+    assert load_tombstones(path) == frozenset({"A#2"})
+
+
+def test_lock_left_by_a_dead_process_is_taken_over(tmp_path):
+    lock_file = tmp_path / WRITE_LOCK_FILE
+    lock_file.write_text("999999999")
+
+    with StoreWriteLock(str(tmp_path), timeout=1):
+        assert lock_file.read_text() == str(os.getpid())
+    assert not lock_file.exists()
+
+
+def test_lock_held_by_a_live_process_times_out(tmp_path):
+    (tmp_path / WRITE_LOCK_FILE).write_text(str(os.getpid()))
+
+    with pytest.raises(RuntimeError, match="andamento"):
+        with StoreWriteLock(str(tmp_path), timeout=0.2):
+            pass
+
+
+def test_failed_swap_is_rolled_forward(make_store, index_dir, embeddings, monkeypatch):
+    path = make_store("A", n=10)
+    move_store_files = vector_store._move_store_files
+
+    def move_one_file_and_fail(source_dir, index_dir):
+        os.replace(os.path.join(source_dir, "index.pkl"), os.path.join(index_dir, "index.pkl"))
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(vector_store, "_move_store_files", move_one_file_and_fail)
+    with pytest.raises(OSError):
+        upsert_documents(index_dir, "A", make_docs("B", ["parágrafo novo"]), embeddings)
+    monkeypatch.setattr(vector_store, "_move_store_files", move_store_files)
+
+    # index.pkl é da versão nova e index.faiss ainda da antiga
+    assert read_swap_marker(path)["state"] == "failed"
+    assert stale_swap(path)
+
+    vectorstore, _, _ = load_consistent(path, embeddings)
+
+    assert not os.path.exists(os.path.join(path, SWAP_MARKER))
+    assert vectorstore.index.ntotal == len(vectorstore.index_to_docstore_id) == 11
+    assert "B#1" in vectorstore.index_to_docstore_id.values()
+
+
+def test_swap_of_a_dead_process_is_stale(make_store):
+    path = make_store("A", n=10)
+    with open(os.path.join(path, SWAP_MARKER), "w", encoding="utf-8") as f:
+        json.dump({"pid": 999999999, "source": None, "state": "swapping"}, f)
+
+    assert stale_swap(path)
+    assert recover_store_swap(path)
+    assert read_swap_marker(path) is None
+    assert not recover_store_swap(path)
@@ -0,0 +1,51 @@
+import pytest
+
+from utils.embedding_cache import embed_query_cached
+from utils.lexical_index import load_lexical_index, reciprocal_rank_fusion, tokenize
+from utils.sharded_index import ShardedIndex
+
+TEXTS = [
+    "A tenepes é a tarefa energética pessoal diária.",
+    "Proéxis significa programação existencial.",
+    "As programações existenciais diferem entre consciências.",
+    "Cosmoética e assistencialidade caminham juntas.",
+]
+
+
+def test_tokenize_folds_accents_plurals_and_compounds():
+    assert tokenize("As Programações da auto-organização") == ["programacao", "auto", "organizacao", "autoorganizacao"]
+
+
+def test_bm25_ranks_documents_with_the_query_terms(make_store):
+    path = make_store("A", TEXTS)
+
+    hits = load_lexical_index(path).search("programação existencial", 3)
+
+    assert [local_id for _, local_id in hits] == [1, 2]
+    assert hits[0][0] >= hits[1][0] > 0
+
+
+def test_unknown_terms_return_nothing(make_store):
+    path = make_store("A", TEXTS)
+
+    assert load_lexical_index(path).search("xyzzy", 5) == []
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]], 3)
+
+    assert [key for key, _ in fused] == ["b", "c", "a"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+
+def test_hybrid_search_finds_exact_terms(make_store, index_dir, embeddings):
+    make_store("A", TEXTS)
+    query = "tenepes"
+
+    results, errors = ShardedIndex(index_dir, embeddings).search(
+        embed_query_cached(embeddings, query), 2, ["A"], query_text=query, mode="hybrid"
+    )
+
+    assert errors == {}
+    assert results[0][0].page_content == TEXTS[0]
+    assert results[0][1] > results[1][1]
@@ -0,0 +1,113 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from utils import clients, metrics, warmup
+from utils.metrics import Counter, Gauge, Histogram, render_metrics
+
+
+@pytest.fixture
+def fresh_warmup(monkeypatch):
+    """Reset the once-per-process warm-up state and the shared clients."""
+    monkeypatch.setattr(warmup, "_status", {"state": "idle", "stores_total": 0, "stores_loaded": 0, "errors": {}, "seconds": None})
+    monkeypatch.setattr(warmup, "_thread", None)
+    monkeypatch.setattr(clients, "_embeddings", None)
+    monkeypatch.setattr(clients, "_llms", {})
+    monkeypatch.setenv("WARMUP", "1")
+
+
+@pytest.fixture
+def exporter():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), metrics._MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def run_warmup(index_dir, store_ids):
+    assert warmup.start_warmup(index_dir, store_ids)
+    warmup._thread.join(10)
+    return warmup.warmup_status()
+
+
+def test_metrics_render_in_prometheus_format():
+    counter, gauge, histogram = Counter("t_total", "Teste"), Gauge("t_gauge", "Teste"), Histogram("t_seconds", "Teste", buckets=(0.1, 1.0))
+    counter.inc(store='a"b')
+    counter.inc(2, store='a"b')
+    gauge.set(5)
+    gauge.dec(2)
+    for value in (0.05, 0.5, 3.0):
+        histogram.observe(value, stage="busca")
+
+    assert 't_total{store="a\\"b"} 3.0' in counter.render()
+    assert "# TYPE t_gauge gauge" in gauge.render() and "t_gauge 3.0" in gauge.render()
+    lines = histogram.render().splitlines()
+    assert 't_seconds_bucket{stage="busca",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{stage="busca",le="1.0"} 2' in lines
+    assert 't_seconds_bucket{stage="busca",le="+Inf"} 3' in lines
+    assert 't_seconds_count{stage="busca"} 3' in lines
+
+
+def test_exposition_includes_stages_and_caches():
+    from utils.profiling import stage
+
+    with stage("teste_metricas"):
+        pass
+
+    text = render_metrics()
+
+    assert 'rag_stage_seconds_count{stage="teste_metricas"}' in text
+    assert 'rag_cache{cache="index",field="hits"}' in text
+
+
+def test_exporter_serves_metrics_and_readiness(exporter, fresh_warmup):
+    with urllib.request.urlopen(f"{exporter}/metrics") as response:
+        assert response.status == 200
+        assert "rag_stage_seconds" in response.read().decode()
+
+    warmup._status["state"] = "warming"
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(f"{exporter}/ready")
+    assert error.value.code == 503
+    assert json.loads(error.value.read())["state"] == "warming"
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(f"{exporter}/outro")
+    assert error.value.code == 404
+
+
+def test_failed_warmup_is_not_ready(fresh_warmup, index_dir, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "inexistente")
+
+    status = run_warmup(index_dir, [])
+
+    assert status["state"] == "failed" and "_" in status["errors"]
+    assert not warmup.is_ready()
+    assert "rag_warmup_ready 0.0" in metrics.WARMUP_READY.render()
+
+
+def test_warmup_loads_stores_and_reports_ready(fresh_warmup, make_store, index_dir, monkeypatch):
+    # O aquecimento importa todos os módulos adiados, inclusive langchain.chains
+    pytest.importorskip("langchain.chains")
+    make_store("A")
+    monkeypatch.setitem(clients._llms, "gpt-4o", FakeListChatModel(responses=["ok"]))
+    monkeypatch.setenv("MODEL_LLM", "gpt-4o")
+
+    status = run_warmup(index_dir, ["A", "X"])
+
+    assert status["state"] == "ready" and status["stores_total"] == 1 and status["stores_loaded"] == 1
+    assert warmup.is_ready()
+    assert "rag_warmup_ready 1.0" in metrics.WARMUP_READY.render()
+
+
+def test_disabled_warmup_is_always_ready(fresh_warmup, monkeypatch):
+    monkeypatch.setenv("WARMUP", "0")
+
+    assert not warmup.start_warmup("indexes", [])
+    assert warmup.is_ready()
@@ -0,0 +1,46 @@
+import os
+
+from utils.index_cache import get_vectorstore_cache
+from utils.search_operations import prefetch_selected_stores
+from utils.sharded_index import ShardedIndex
+
+
+def wait_for_loads(index_dir, embeddings, store_ids):
+    # Uma carga em andamento é devolvida em vez de ser submetida de novo
+    for future in ShardedIndex(index_dir, embeddings).prefetch(store_ids):
+        future.result(10)
+
+
+def test_new_selections_are_loaded_before_the_search(make_store, index_dir, embeddings):
+    make_store("A")
+    make_store("B")
+
+    added = prefetch_selected_stores(["A", "B", "X"], ["B"], index_dir, embeddings)
+    wait_for_loads(index_dir, embeddings, added)
+
+    cache = get_vectorstore_cache()
+    assert added == ["A"]
+    assert cache.contains(os.path.join(index_dir, "A"))
+    assert not cache.contains(os.path.join(index_dir, "B"))
+
+
+def test_deselected_stores_are_demoted(make_store, index_dir, embeddings):
+    make_store("A")
+    make_store("B")
+    wait_for_loads(index_dir, embeddings, ["A", "B"])
+    cache = get_vectorstore_cache()
+    demotions = cache.stats()["demotions"]
+
+    assert prefetch_selected_stores(["B"], ["A", "B"], index_dir, embeddings) == []
+
+    assert cache.stats()["demotions"] == demotions + 1
+    assert cache.contains(os.path.join(index_dir, "A"))
+
+
+def test_hybrid_mode_also_loads_the_lexical_index(make_store, index_dir, embeddings):
+    make_store("A")
+
+    added = prefetch_selected_stores(["A"], [], index_dir, embeddings, mode="hybrid")
+    wait_for_loads(index_dir, embeddings, added)
+
+    assert getattr(ShardedIndex(index_dir, embeddings).load_shard("A"), "lexical_index", None) is not None
@@ -0,0 +1,129 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from conftest import sample_texts
+from utils.ann_index import build_ann_index, exact_store_vectors
+from utils.embedding_cache import embed_query_cached
+from utils.sharded_index import ShardedIndex
+from utils.search_tiers import VECTORS_FILE, rescore_factor, rescored_search, tier_memory, write_full_vectors
+from utils.vector_store import load_faiss_store
+
+
+def brute_force(vectors, queries, k):
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index.search(queries, k)
+
+
+def test_rescore_factor():
+    assert rescore_factor(None) == 0
+    assert rescore_factor({"type": "flat"}) == 0
+    assert rescore_factor({"type": "ivf_pq", "rescore": 8}) == 0
+    assert rescore_factor({"type": "sq8"}) == 4
+    assert rescore_factor({"type": "sq_fp16", "rescore": 2}) == 2
+
+
+@pytest.mark.parametrize("index_type", ["sq8", "sq_fp16"])
+def test_rescoring_returns_exact_distances(index_type):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 32)).astype(np.float32)
+    queries = rng.standard_normal((20, 32)).astype(np.float32)
+    index = build_ann_index(vectors, {"type": index_type})
+
+    scores, ids = rescored_search(index, vectors, 4, queries, 10)
+
+    expected_scores, expected_ids = brute_force(vectors, queries, 10)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-4)
+    assert (ids == expected_ids).mean() >= 0.99
+
+
+def test_without_full_vectors_the_index_is_searched_alone():
+    vectors = np.random.default_rng(0).standard_normal((100, 16)).astype(np.float32)
+    index = build_ann_index(vectors, {"type": "sq8"})
+
+    scores, _ = rescored_search(index, None, 4, vectors[:3], 5)
+
+    assert scores.shape == (3, 5)
+    assert not np.allclose(scores[:, 0], 0.0, atol=1e-9)
+
+
+def test_sq8_store_keeps_codes_resident_and_full_vectors_on_disk(make_store, embeddings):
+    path = make_store("A", spec={"type": "sq8"})
+
+    vectorstore, _ = load_faiss_store(path, embeddings)
+
+    memory = tier_memory(vectorstore)
+    assert vectorstore.rescore_factor == 4
+    assert isinstance(vectorstore.full_vectors, np.memmap)
+    assert memory["index_bytes"] < memory["float32_bytes"]
+    assert memory["full_vectors_bytes"] == memory["float32_bytes"]
+
+
+def test_sq8_store_searches_like_a_flat_store(make_store, index_dir, embeddings):
+    texts = sample_texts("A", 60)
+    make_store("A", texts, spec={"type": "sq8"})
+    make_store("B", texts, spec={"type": "flat"})
+    index = ShardedIndex(index_dir, embeddings)
+    query_vector = embed_query_cached(embeddings, "proéxis e tenepes")
+
+    quantized, _ = index.search(query_vector, 5, ["A"])
+    flat, _ = index.search(query_vector, 5, ["B"])
+
+    np.testing.assert_allclose([score for _, score in quantized], [score for _, score in flat], rtol=1e-5)
+
+
+def test_full_vectors_are_removed_for_a_store_without_tiers(tmp_path):
+    vectors = np.ones((4, 8), dtype=np.float32)
+    write_full_vectors(str(tmp_path), vectors, {"type": "sq8"})
+    assert np.load(tmp_path / VECTORS_FILE).shape == (4, 8)
+
+    write_full_vectors(str(tmp_path), vectors, {"type": "flat"})
+
+    assert not os.path.exists(tmp_path / VECTORS_FILE)
+
+
+def low_rank_vectors(n, d=32, rank=6, seed=0):
+    """Vectors close to a rank-`rank` subspace, as embeddings of related texts are."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, rank)) @ rng.standard_normal((rank, d)) + 0.01 * rng.standard_normal((n, d))
+    return vectors.astype(np.float32)
+
+
+def test_pca_first_pass_is_reranked_at_full_dimension():
+    vectors = low_rank_vectors(600)
+    queries = low_rank_vectors(20, seed=1)
+    index = build_ann_index(vectors, {"type": "flat", "pca_dim": 8})
+
+    scores, ids = rescored_search(index, vectors, 4, queries, 10)
+
+    expected_scores, expected_ids = brute_force(vectors, queries, 10)
+    assert index.d == 32 and faiss.downcast_index(index.index).d == 8
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-4)
+    assert (ids == expected_ids).mean() >= 0.95
+
+
+def test_pca_store_searches_like_a_flat_store(make_store, index_dir, embeddings):
+    texts = sample_texts("A", 60)
+    make_store("A", texts, spec={"type": "flat", "pca_dim": 16, "rescore": 8})
+    make_store("B", texts, spec={"type": "flat"})
+    index = ShardedIndex(index_dir, embeddings)
+    query_vector = embed_query_cached(embeddings, "holomaturidade")
+
+    reduced, _ = index.search(query_vector, 5, ["A"])
+    flat, _ = index.search(query_vector, 5, ["B"])
+
+    assert index.load_shard("A").full_vectors.shape == (60, 32)
+    np.testing.assert_allclose([score for _, score in reduced], [score for _, score in flat], rtol=1e-5)
+
+
+def test_pca_store_vectors_are_read_back_exactly(make_store, embeddings):
+    texts = sample_texts("A", 60)
+    path = make_store("A", texts, spec={"type": "flat", "pca_dim": 8})
+    vectorstore, _ = load_faiss_store(path, embeddings)
+    del vectorstore.full_vectors
+
+    np.testing.assert_array_equal(exact_store_vectors(vectorstore, path),
+                                  np.array(embeddings.embed_documents(texts), dtype=np.float32))
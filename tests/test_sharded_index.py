@@ -0,0 +1,72 @@
+import faiss
+import numpy as np
+
+from conftest import sample_texts
+from utils.embedding_cache import embed_query_cached
+from utils.sharded_index import ShardedIndex, merge_shard_hits
+
+
+def test_merge_keeps_the_global_best():
+    shard_hits = {"A": [(0.1, 0), (0.5, 1)], "B": [(0.2, 7), (0.3, 8)]}
+
+    assert merge_shard_hits(shard_hits, 3) == [("A", 0, 0.1), ("B", 7, 0.2), ("B", 8, 0.3)]
+    assert merge_shard_hits(shard_hits, 1, higher_better=True) == [("A", 1, 0.5)]
+
+
+def test_global_top_k_matches_one_combined_index(make_store, index_dir, embeddings):
+    texts = {"A": sample_texts("A", 30), "B": sample_texts("B", 25)}
+    for store_id, store_texts in texts.items():
+        make_store(store_id, store_texts)
+    query = "proéxis e cosmoética"
+    query_vector = embed_query_cached(embeddings, query)
+
+    results, errors = ShardedIndex(index_dir, embeddings).search(query_vector, 8, ["A", "B"])
+
+    all_texts = texts["A"] + texts["B"]
+    combined = faiss.IndexFlatL2(len(query_vector))
+    combined.add(np.array(embeddings.embed_documents(all_texts), dtype=np.float32))
+    distances, ids = combined.search(np.array([query_vector], dtype=np.float32), 8)
+    assert errors == {}
+    np.testing.assert_allclose([score for _, score in results], distances[0], rtol=1e-5)
+    assert {doc.page_content for doc, _ in results} == {all_texts[i] for i in ids[0]}
+    assert all(doc.metadata["store_id"] in ("A", "B") for doc, _ in results)
+
+
+def test_batch_search_matches_single_searches(make_store, index_dir, embeddings):
+    make_store("A")
+    make_store("B")
+    queries = ["proéxis", "tenepes evolução", "assistencialidade"]
+    index = ShardedIndex(index_dir, embeddings)
+
+    batch, errors = index.search_batch([embed_query_cached(embeddings, q) for q in queries], 5, ["A", "B"])
+
+    assert errors == {}
+    for query, results in zip(queries, batch):
+        single, _ = index.search(embed_query_cached(embeddings, query), 5, ["A", "B"])
+        np.testing.assert_allclose([score for _, score in results], [score for _, score in single], rtol=1e-5)
+
+
+def test_missing_store_is_reported_and_the_others_searched(make_store, index_dir, embeddings):
+    make_store("A")
+
+    results, errors = ShardedIndex(index_dir, embeddings).search(embed_query_cached(embeddings, "proéxis"), 3, ["A", "X"])
+
+    assert len(results) == 3
+    assert set(errors) == {"X"}
+
+
+def test_store_with_another_metric_is_left_out(make_store, index_dir, embeddings):
+    for store_id in ("A", "B", "C"):
+        make_store(store_id)
+    index = ShardedIndex(index_dir, embeddings)
+    # Troca o índice carregado de C por um de produto interno com os mesmos vetores
+    vectorstore = index.load_shard("C")
+    inner_product = faiss.IndexFlatIP(vectorstore.index.d)
+    inner_product.add(vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal))
+    vectorstore.index = inner_product
+
+    results, errors = index.search(embed_query_cached(embeddings, "proéxis"), 5, ["A", "B", "C"])
+
+    assert set(errors) == {"C"}
+    assert "métrica" in str(errors["C"]).lower()
+    assert {doc.metadata["store_id"] for doc, _ in results} <= {"A", "B"}
@@ -0,0 +1,45 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from utils.ann_index import build_ann_index
+from utils.embedding_providers import HashEmbeddings
+from utils.vector_store import index_is_mapped, load_faiss_store, read_faiss_index
+
+
+def test_ivf_index_is_mapped(tmp_path):
+    vectors = np.random.default_rng(0).standard_normal((200, 16)).astype(np.float32)
+    index_file = str(tmp_path / "index.faiss")
+    faiss.write_index(build_ann_index(vectors, {"type": "ivf_flat", "nlist": 4}), index_file)
+
+    index, mapped = read_faiss_index(index_file, mmap=True)
+
+    assert mapped and index.ntotal == 200
+
+
+def test_flat_index_is_mapped_only_with_flat_code_mmap_support():
+    index = faiss.IndexFlatL2(8)
+
+    assert index_is_mapped(index) == hasattr(faiss, "IO_FLAG_MMAP_IFC")
+    assert not index_is_mapped(faiss.IndexHNSWFlat(8, 16))
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_mapped_and_loaded_stores_search_alike(make_store, embeddings, mmap):
+    path = make_store("A")
+
+    vectorstore, status = load_faiss_store(path, embeddings, mmap=mmap)
+
+    assert status == ("mmap" if mmap and hasattr(faiss, "IO_FLAG_MMAP_IFC") else "loaded")
+    hits = vectorstore.similarity_search_with_score("proéxis", k=3)
+    assert len(hits) == 3 and hits[0][1] <= hits[-1][1]
+
+
+def test_dimension_mismatch_is_rejected(make_store):
+    path = make_store("A")
+
+    with pytest.raises(ValueError, match="dimensão"):
+        load_faiss_store(path, HashEmbeddings(dimension=64))
+    assert os.path.exists(os.path.join(path, "index.faiss"))
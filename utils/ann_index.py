@@ -0,0 +1,417 @@
+"""
+Approximate nearest-neighbour index types (IVF-Flat, IVF-PQ, HNSW, scalar-quantized, PCA-reduced) for the RAG application.
+
+Usage:
+    python -m utils.ann_index --store <VECTOR_STORE_ID> --types flat,ivf_flat,ivf_pq,hnsw
+    python -m utils.ann_index --store <VECTOR_STORE_ID> --apply hnsw --ef-search 96
+    python -m utils.ann_index --store <VECTOR_STORE_ID> --types flat,sq8 --pca-dim 256
+"""
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from utils.lazy_imports import lazy_import
+
+faiss = lazy_import("faiss")
+
+ANN_INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "sq8")
+
+# Tipos que guardam vetores comprimidos; a busca os reordena com os vetores completos (utils.search_tiers)
+QUANTIZED_TYPES = ("sq_fp16", "sq8")
+
+# Arquivo, dentro do diretório do store, com o tipo de índice e os parâmetros de busca escolhidos
+SPEC_FILE = "ann.json"
+
+
+def index_spec_from_env():
+    """
+    Build the default index spec from environment variables.
+
+    Returns:
+        dict: type, nlist, nprobe, pq_m, pq_nbits, hnsw_m, ef_construction, ef_search, rescore, pca_dim
+    """
+    return {
+        "type": os.getenv("ANN_INDEX_TYPE", "flat"),
+        "nlist": int(os.getenv("ANN_NLIST", "0")),               # 0 = automático (~4·√n)
+        "nprobe": int(os.getenv("ANN_NPROBE", "16")),
+        "pq_m": int(os.getenv("ANN_PQ_M", "64")),
+        "pq_nbits": int(os.getenv("ANN_PQ_NBITS", "8")),
+        "hnsw_m": int(os.getenv("ANN_HNSW_M", "32")),
+        "ef_construction": int(os.getenv("ANN_EF_CONSTRUCTION", "200")),
+        "ef_search": int(os.getenv("ANN_EF_SEARCH", "128")),
+        "rescore": int(os.getenv("ANN_RESCORE", "4")),           # candidatos por resultado na reordenação exata
+        "pca_dim": int(os.getenv("ANN_PCA_DIM", "0")),           # 0 = busca na dimensão original
+    }
+
+
+def resolve_nlist(spec, n_vectors):
+    """
+    Return the number of IVF lists, keeping at least ~39 training points per list.
+
+    Args:
+        spec (dict): Index spec
+        n_vectors (int): Number of vectors to index
+
+    Returns:
+        int: Number of inverted lists
+    """
+    nlist = spec.get("nlist") or int(4 * math.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // 39))
+
+
+def build_ann_index(vectors, spec, metric=None):
+    """
+    Build and fill a FAISS index of the requested type.
+
+    Vectors are added in order, so index position i still corresponds to
+    row i of `vectors` (and to the store's index_to_docstore_id mapping).
+    With spec["pca_dim"] set below the vector dimension, a PCA projection is
+    learned from `vectors` and the index of the requested type is built in the
+    reduced space; queries are projected by FAISS at search time.
+
+    Args:
+        vectors (numpy.ndarray): (n, d) float32 matrix
+        spec (dict): Index spec (see index_spec_from_env)
+        metric (int, optional): faiss.METRIC_L2 (default) or faiss.METRIC_INNER_PRODUCT
+
+    Returns:
+        faiss.Index: Trained index containing all vectors
+    """
+    metric = faiss.METRIC_L2 if metric is None else metric
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, full_dim = vectors.shape
+    index_type = spec.get("type", "flat")
+    pca_dim = spec.get("pca_dim") or 0
+    dim = pca_dim if 0 < pca_dim < full_dim else full_dim
+
+    if index_type == "flat":
+        index = faiss.IndexFlat(dim, metric)
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = resolve_nlist(spec, n_vectors)
+        quantizer = faiss.IndexFlat(dim, metric)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            if dim % spec["pq_m"] != 0:
+                raise ValueError(f"A dimensão {dim} não é divisível por pq_m={spec['pq_m']}")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, spec["pq_m"], spec["pq_nbits"], metric)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, spec["hnsw_m"], metric)
+        index.hnsw.efConstruction = spec["ef_construction"]
+    elif index_type in QUANTIZED_TYPES:
+        qtype = faiss.ScalarQuantizer.QT_fp16 if index_type == "sq_fp16" else faiss.ScalarQuantizer.QT_8bit
+        index = faiss.IndexScalarQuantizer(dim, qtype, metric)
+    else:
+        raise ValueError(f"Tipo de índice desconhecido: {index_type} (use um de {', '.join(ANN_INDEX_TYPES)})")
+
+    if dim < full_dim:
+        # Projeção aprendida dos próprios vetores do store; nada precisa ser reembutido
+        index = faiss.IndexPreTransform(faiss.PCAMatrix(full_dim, dim), index)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index, spec)
+    return index
+
+
+def apply_search_params(index, spec):
+    """
+    Apply query-time parameters (nprobe for IVF, efSearch for HNSW) to an index.
+
+    Args:
+        index (faiss.Index): Index to configure
+        spec (dict): Index spec; missing keys leave the index unchanged
+    """
+    if not spec:
+        return
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and spec.get("nprobe"):
+        ivf.nprobe = spec["nprobe"]
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    if hasattr(index, "hnsw") and spec.get("ef_search"):
+        index.hnsw.efSearch = spec["ef_search"]
+
+
+def read_index_spec(index_dir):
+    """
+    Read the index spec saved next to a store.
+
+    Args:
+        index_dir (str): Store directory
+
+    Returns:
+        dict: Saved spec, or None if the store uses the default flat index
+    """
+    spec_file = os.path.join(index_dir, SPEC_FILE)
+    if not os.path.exists(spec_file):
+        return None
+    with open(spec_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_index_spec(index_dir, spec):
+    """
+    Save an index spec next to a store.
+
+    Args:
+        index_dir (str): Store directory
+        spec (dict): Index spec
+    """
+    with open(os.path.join(index_dir, SPEC_FILE), "w", encoding="utf-8") as f:
+        json.dump(spec, f, indent=2)
+
+
+def store_vectors(vectorstore):
+    """
+    Read every vector back from a store, in index order.
+
+    Stores with full-precision vectors attached (see utils.search_tiers)
+    return those; otherwise the vectors are reconstructed from the index.
+
+    Args:
+        vectorstore: FAISS vector store
+
+    Returns:
+        numpy.ndarray: (n, d) float32 matrix
+    """
+    full_vectors = getattr(vectorstore, "full_vectors", None)
+    if full_vectors is not None:
+        return np.array(full_vectors, dtype=np.float32)
+    index = vectorstore.index
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def exact_store_vectors(vectorstore, index_dir, checkpoint_file=None, model=None):
+    """
+    Read every vector of a store as it was embedded, in index order.
+
+    IVF-PQ, SQ8 and PCA-reduced indexes only reconstruct approximations, so
+    their vectors come from vectors.npy (attached or next to the index) or,
+    failing that, from the build checkpoint by paragraph hash. Exact index
+    types are read back from the index itself.
+
+    Args:
+        vectorstore: FAISS vector store
+        index_dir (str): Store directory
+        checkpoint_file (str, optional): Build checkpoint of the store (see utils.index_builder)
+        model (str, optional): Embedding model name the checkpoint vectors are keyed by
+
+    Returns:
+        numpy.ndarray: (n, d) float32 matrix, or None if only approximate vectors are available
+    """
+    from utils.search_tiers import VECTORS_FILE, rescore_factor
+
+    index = vectorstore.index
+    if getattr(vectorstore, "full_vectors", None) is not None:
+        return store_vectors(vectorstore)
+    path = os.path.join(index_dir, VECTORS_FILE)
+    if os.path.exists(path):
+        vectors = np.load(path, mmap_mode="r")
+        if vectors.shape == (index.ntotal, index.d):
+            return np.array(vectors, dtype=np.float32)
+    spec = read_index_spec(index_dir)
+    if (spec or {}).get("type") != "ivf_pq" and not rescore_factor(spec):
+        return store_vectors(vectorstore)
+
+    if not checkpoint_file or not model or not os.path.exists(checkpoint_file):
+        return None
+    from utils.index_builder import VectorCheckpoint, content_hash
+
+    hashes = []
+    for position in range(index.ntotal):
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+        if not hasattr(doc, "page_content"):
+            return None
+        hashes.append(content_hash(doc.page_content))
+    checkpoint = VectorCheckpoint(checkpoint_file, model)
+    try:
+        vectors_by_hash = checkpoint.get_many(set(hashes))
+    finally:
+        checkpoint.close()
+    if len(vectors_by_hash) < len(set(hashes)):
+        return None
+    return np.vstack([vectors_by_hash[text_hash] for text_hash in hashes]).astype(np.float32)
+
+
+def rebuild_with_spec(vectorstore, spec):
+    """
+    Replace a store's index by one of another type, keeping its docstore and id mapping.
+
+    Args:
+        vectorstore: FAISS vector store (loaded read/write)
+        spec (dict): Target index spec
+
+    Returns:
+        FAISS: The same vector store with its new index
+    """
+    vectorstore.index = build_ann_index(store_vectors(vectorstore), spec, vectorstore.index.metric_type)
+    return vectorstore
+
+
+def _timed_search(index, queries, k, full_vectors=None, factor=0):
+    """Search queries one at a time, as the app does; return (ids, per-query seconds)."""
+    from utils.search_tiers import rescored_search
+
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids[i] = rescored_search(index, full_vectors, factor, query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+    return ids, np.array(latencies)
+
+
+def evaluate_ann(vectors, specs, queries=None, k=10, n_queries=200, metric=None, seed=0):
+    """
+    Compare approximate index specs against the exact index on recall@k and latency.
+
+    Specs that rescore (quantized or PCA-reduced) are measured with their
+    exact rerank over `vectors`, as they are searched in the app.
+
+    Args:
+        vectors (numpy.ndarray): (n, d) float32 store vectors
+        specs (list): Index specs to evaluate
+        queries (numpy.ndarray, optional): Query vectors; sampled from the store if omitted
+        k (int): Cut-off for recall@k
+        n_queries (int): Number of sampled queries when none are given
+        metric (int, optional): faiss metric of the store (default faiss.METRIC_L2)
+        seed (int): Random seed for query sampling
+
+    Returns:
+        list: One dict per spec with type, params, build_s, recall, p50_ms, p95_ms, speedup
+    """
+    metric = faiss.METRIC_L2 if metric is None else metric
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+        queries = vectors[sample]
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    exact = faiss.IndexFlat(vectors.shape[1], metric)
+    exact.add(vectors)
+    truth, exact_latency = _timed_search(exact, queries, k)
+    exact_p50 = float(np.percentile(exact_latency, 50))
+
+    rows = []
+    from utils.search_tiers import rescore_factor
+
+    for spec in specs:
+        start = time.perf_counter()
+        index = build_ann_index(vectors, spec, metric)
+        build_seconds = time.perf_counter() - start
+        found, latency = _timed_search(index, queries, k, vectors, rescore_factor(spec))
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        p50 = float(np.percentile(latency, 50))
+        rows.append({
+            "type": spec["type"],
+            "params": {key: value for key, value in spec.items() if key != "type"},
+            "build_s": build_seconds,
+            "recall": float(recall),
+            "p50_ms": p50 * 1000,
+            "p95_ms": float(np.percentile(latency, 95)) * 1000,
+            "speedup": exact_p50 / p50 if p50 > 0 else float("inf"),
+        })
+    return rows
+
+
+def format_report(rows, k):
+    """
+    Format evaluate_ann rows as a text table.
+
+    Args:
+        rows (list): Rows returned by evaluate_ann
+        k (int): Cut-off used for recall
+
+    Returns:
+        str: Report table
+    """
+    header = f"{'tipo':<10} {'recall@' + str(k):>10} {'p50 ms':>9} {'p95 ms':>9} {'speedup':>8} {'build s':>9}  parâmetros"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        params = ", ".join(f"{key}={value}" for key, value in row["params"].items())
+        lines.append(
+            f"{row['type']:<10} {row['recall']:>10.4f} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} "
+            f"{row['speedup']:>7.1f}x {row['build_s']:>9.2f}  {params}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    """Command-line entry point: report recall/latency per index type, or apply one to a store."""
+    from dotenv import load_dotenv
+    from utils.clients import get_shared_embeddings
+    from utils.vector_store import load_faiss_store
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Compara tipos de índice ANN com o índice exato de um store.")
+    parser.add_argument("--index-dir", default=os.getenv("PATH_INDEX"), help="Diretório dos índices (PATH_INDEX)")
+    parser.add_argument("--store", required=True, help="ID do vector store")
+    parser.add_argument("--types", default=",".join(ANN_INDEX_TYPES), help="Tipos a comparar, separados por vírgula")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--nprobe", type=int)
+    parser.add_argument("--ef-search", type=int)
+    parser.add_argument("--pca-dim", type=int, help="Dimensão da projeção PCA da primeira passada (0 = desligada)")
+    parser.add_argument("--apply", choices=ANN_INDEX_TYPES, help="Reconstrói o store com este tipo e salva ann.json")
+    args = parser.parse_args()
+
+    base_spec = index_spec_from_env()
+    for key in ("nlist", "nprobe", "ef_search", "pca_dim"):
+        if getattr(args, key) is not None:
+            base_spec[key] = getattr(args, key)
+
+    index_dir = os.path.join(args.index_dir, args.store)
+
+    if args.apply:
+        from utils.embedding_cache import embedding_model_name
+        from utils.index_builder import checkpoint_path
+        from utils.index_mutation import StoreWriteLock
+        from utils.search_tiers import VECTORS_FILE, rescore_factor, write_full_vectors
+        from utils.vector_store import write_and_swap_store
+
+        spec = dict(base_spec, type=args.apply)
+        embeddings = get_shared_embeddings()
+        with StoreWriteLock(index_dir):
+            vectorstore, _ = load_faiss_store(index_dir, embeddings, mmap=False)
+            # Reconstruir de um índice com perdas (PQ, SQ8, PCA) degradaria o novo índice
+            vectors = exact_store_vectors(vectorstore, index_dir, checkpoint_path(args.index_dir, args.store),
+                                          embedding_model_name(embeddings))
+            if vectors is None:
+                parser.error(
+                    f"{args.store}: o índice atual só guarda vetores aproximados e não há {VECTORS_FILE} "
+                    f"nem checkpoint de build; reconstrua o store com utils.index_builder"
+                )
+
+            # Novo índice gravado ao lado do store e trocado no lugar, como nas mutações
+            def write(tmp_dir):
+                write_full_vectors(tmp_dir, vectors, spec)
+                vectorstore.index = build_ann_index(vectors, spec, vectorstore.index.metric_type)
+                vectorstore.save_local(tmp_dir)
+                write_index_spec(tmp_dir, spec)
+
+            write_and_swap_store(index_dir, write)
+            # Tipo sem reordenação: vectors.npy antigo sai depois da troca (mapeamentos abertos seguem válidos)
+            if not rescore_factor(spec) and os.path.exists(os.path.join(index_dir, VECTORS_FILE)):
+                os.remove(os.path.join(index_dir, VECTORS_FILE))
+        print(f"{args.store}: índice reconstruído como {args.apply} ({vectorstore.index.ntotal} vetores)")
+        return
+
+    vectorstore, _ = load_faiss_store(index_dir, get_shared_embeddings(), mmap=False)
+    specs = [dict(base_spec, type=index_type) for index_type in args.types.split(",")]
+    rows = evaluate_ann(store_vectors(vectorstore), specs, k=args.k, n_queries=args.queries,
+                        metric=vectorstore.index.metric_type)
+    print(format_report(rows, args.k))
+
+
+if __name__ == "__main__":
+    main()
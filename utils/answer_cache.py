@@ -0,0 +1,220 @@
+"""
+LLM answer cache keyed by the retrieved context for the RAG application.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.index_cache import get_vectorstore_cache
+
+
+def document_key(doc):
+    """
+    Return a stable identifier for a retrieved document.
+
+    Args:
+        doc: Document returned by the search
+
+    Returns:
+        str: "store_id:doc_id" when known, otherwise a hash of the content
+    """
+    store_id = doc.metadata.get("store_id")
+    doc_id = doc.metadata.get("doc_id")
+    if store_id is not None and doc_id is not None:
+        return f"{store_id}:{doc_id}"
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+    """Return the fingerprints of the loaded versions of the given stores (every cached directory of each id)."""
+def _index_versions(store_ids):
+    """Return the fingerprints of the loaded versions of the given stores."""
+    cache = get_vectorstore_cache()
+    return tuple((store_id, cache.fingerprint(store_id)) for store_id in sorted(store_ids))
+
+
+class AnswerCache:
+    """
+    Thread-safe TTL + LRU cache of LLM answers.
+
+    Answers are keyed by (model, temperature, system prompt, normalized query,
+    ordered ids of the documents in the context) plus the loaded version of
+    every store those documents came from, so rebuilding an index invalidates
+    its answers. Optionally, a miss falls back to the entry with the same
+    context documents whose query embedding has the highest cosine similarity
+    above a threshold.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, similarity_threshold=0.0):
+        """
+        Args:
+            max_entries (int): Maximum number of cached answers
+            ttl_seconds (float): Lifetime of an entry
+            similarity_threshold (float): Minimum cosine similarity for a
+                near-duplicate query match; 0 disables it
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # key -> dict(answer, expires, query_vector, config, stores)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "similar_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(model, temperature, system_prompt, query, docs):
+        """
+        Build the cache key for a generation request.
+
+        Args:
+            model (str): LLM model name
+            temperature (float): Sampling temperature
+            system_prompt (str): System prompt
+            query (str): User question (case and spacing are ignored)
+            docs (list): Documents placed in the context, in order
+
+        Returns:
+            tuple: Hashable cache key
+        """
+        prompt_hash = hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()
+        store_ids = {doc.metadata["store_id"] for doc in docs if doc.metadata.get("store_id")}
+        query_hash = hashlib.sha1(" ".join(query.casefold().split()).encode("utf-8")).hexdigest()
+        return (
+            (model, round(float(temperature), 3), prompt_hash),
+            query_hash,
+            tuple(document_key(doc) for doc in docs),
+            _index_versions(store_ids),
+        )
+
+    def get(self, key, query_vector=None):
+        """
+        Look up an answer, falling back to a near-duplicate query when enabled.
+
+        Args:
+            key (tuple): Key from make_key
+            query_vector (numpy.ndarray, optional): Query embedding for near-duplicate matching
+
+        Returns:
+            dict: Cached answer, or None on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry["answer"]
+
+            if self.similarity_threshold > 0 and query_vector is not None:
+                entry_key = self._most_similar(key, query_vector)
+                if entry_key is not None:
+                    self._entries.move_to_end(entry_key)
+                    self._stats["similar_hits"] += 1
+                    return self._entries[entry_key]["answer"]
+
+            self._stats["misses"] += 1
+            return None
+
+    def _most_similar(self, key, query_vector):
+        """Return the key of the closest current entry above the threshold (caller holds self._lock)."""
+        config, _, docs, versions = key
+        query = _unit(query_vector)
+        best_key, best_score = None, self.similarity_threshold
+        for entry_key, entry in self._entries.items():
+            if entry["config"] != config or entry["query_vector"] is None:
+                continue
+            # Só reaproveita respostas geradas com o mesmo contexto, nas versões atuais dos índices
+            if entry_key[2] != docs or entry_key[3] != versions:
+                continue
+            score = float(np.dot(query, entry["query_vector"]))
+            if score >= best_score:
+                best_key, best_score = entry_key, score
+        return best_key
+
+    def put(self, key, answer, query_vector=None):
+        """
+        Store an answer.
+
+        Args:
+            key (tuple): Key from make_key
+            answer (dict): Answer to cache
+            query_vector (numpy.ndarray, optional): Query embedding for near-duplicate matching
+        """
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "expires": time.monotonic() + self.ttl_seconds,
+                "query_vector": _unit(query_vector) if query_vector is not None else None,
+                "config": key[0],
+                "stores": [store_id for store_id, _ in key[3]],
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate_store(self, store_id):
+        """
+        Drop every answer built from documents of a store.
+
+        Args:
+            store_id (str): Vector store ID
+        """
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if store_id in entry["stores"]]:
+                del self._entries[key]
+
+    def _expire(self, now):
+        """Drop expired entries (caller holds self._lock)."""
+        for key in [key for key, entry in self._entries.items() if entry["expires"] <= now]:
+            del self._entries[key]
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: hits, similar_hits, misses, evictions, entries
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            return stats
+
+
+def _unit(vector):
+    """Return a float32 copy of a vector scaled to unit length."""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """
+    Return the process-wide answer cache.
+
+    Settings are read from ANSWER_CACHE_SIZE (default 512), ANSWER_CACHE_TTL
+    in seconds (default 3600) and ANSWER_CACHE_SIMILARITY (default 0, which
+    disables near-duplicate query matching; e.g. 0.97 enables it).
+
+    Returns:
+        AnswerCache: Shared cache instance
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache(
+                    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+                    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+                    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0")),
+                )
+                # Respostas de um índice reconstruído deixam de valer
+                get_vectorstore_cache().add_reload_listener(_cache.invalidate_store)
+    return _cache
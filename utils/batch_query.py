@@ -0,0 +1,273 @@
+"""
+Batch query mode for the RAG application.
+
+Reads many queries from a JSONL, CSV or text file and writes one JSON line
+per query with its results (and, optionally, its LLM answer). Queries are
+processed in chunks: each chunk is embedded with one batched embed_documents
+call (cached vectors are skipped), every store is searched once per chunk
+with the whole query matrix, and answers are generated with bounded
+concurrency. Output is written in input order as each chunk finishes.
+
+Usage:
+    python -m utils.batch_query perguntas.jsonl --output respostas.jsonl --stores LO --stores DAC --answer
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from utils.embedding_cache import embed_queries_cached
+from utils.profiling import stage
+from utils.sharded_index import ShardedIndex
+from utils.stores import resolve_store_ids, serialize_results
+
+QUERY_FIELDS = ("query", "question", "pergunta")
+
+
+def _query_record(number, row):
+    """Normalize one input row to {"id", "query"}, or {"id", "query", "error"} when it is invalid."""
+    if isinstance(row, str):
+        return {"id": number, "query": row}
+    if not isinstance(row, dict):
+        return {"id": number, "query": "", "error": f"Linha inválida: esperado objeto ou texto, recebido {type(row).__name__}"}
+    query = next((row[field] for field in QUERY_FIELDS if row.get(field)), "")
+    record_id = row.get("id") or number
+    if not isinstance(query, str):
+        return {"id": record_id, "query": "", "error": f"Consulta inválida: esperado texto, recebido {type(query).__name__}"}
+    return {"id": record_id, "query": query}
+
+
+def read_queries(path):
+    """
+    Read queries from a file, lazily.
+
+    JSONL lines may be objects with a "query" (or "question"/"pergunta") and
+    an optional "id", or plain JSON strings; CSV files need a header with one
+    of those columns; any other file has one query per line. Rows without an
+    id are numbered from 1. Rows that cannot be read yield a record with an
+    "error" instead of stopping the run.
+
+    Args:
+        path (str): Input file, or "-" for standard input
+
+    Yields:
+        dict: {"id", "query"}
+    """
+    handle = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+    try:
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".csv":
+            for number, row in enumerate(csv.DictReader(handle), 1):
+                yield _query_record(number, row)
+            return
+        number = 0
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            number += 1
+            if extension not in (".jsonl", ".json"):
+                yield _query_record(number, line)
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield {"id": number, "query": "", "error": f"JSON inválido: {e}"}
+                continue
+            yield _query_record(number, row)
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def search_chunk(queries, sharded_index, store_ids, top_k, embeddings, mode="semantic", timeout=None):
+    """
+    Embed and search one chunk of queries.
+
+    Args:
+        queries (list): {"id", "query"} records
+        sharded_index (ShardedIndex): Index over the stores
+        store_ids (list): Stores to search
+        top_k (int): Results per query
+        embeddings: Embeddings object
+        mode (str): "semantic" or "hybrid"
+        timeout (float, optional): Per-store deadline in seconds
+
+    Returns:
+        tuple: (results per query, errors, query vectors)
+    """
+    texts = [query["query"] for query in queries]
+    with stage("embed_query"):
+        vectors = np.vstack(embed_queries_cached(embeddings, texts))
+    results, errors = sharded_index.search_batch(vectors, top_k, store_ids, timeout=timeout, query_texts=texts, mode=mode)
+    return results, errors, vectors
+
+
+def answer_query(query, results, llm, top_k, temperature, query_vector):
+    """
+    Generate the answer of one query with the shared answer core.
+
+    Returns:
+        dict: answer, timings and cached, or answer_error on failure
+    """
+    from utils.search_operations import iter_answer_events
+
+    try:
+        final = None
+        for event in iter_answer_events(query, results, llm, top_k, temperature=temperature,
+                                        query_vector=query_vector, stream=False):
+            final = event
+        return {"answer": final["result"], "timings": final["timings"], "cached": final["cached"]}
+    except Exception as e:
+        return {"answer_error": f"{type(e).__name__}: {e}"}
+
+
+def _write_chunk(output, chunk, valid, results, errors, answers, chunk_error=None):
+    """Write the records of one chunk, in input order, waiting for its answers."""
+    positions = {id(query): i for i, query in enumerate(valid)}
+    store_errors = {store_id: f"{type(error).__name__}: {error}" for store_id, error in errors.items()}
+    for query in chunk:
+        record = {"id": query["id"], "query": query["query"]}
+        i = positions.get(id(query))
+        if query.get("error"):
+            record["error"] = query["error"]
+        elif i is None:
+            record["error"] = "Consulta vazia"
+        elif chunk_error is not None:
+            record["error"] = chunk_error
+        else:
+            record["results"] = serialize_results(results[i])
+            record["errors"] = store_errors
+            if i in answers:
+                record.update(answers[i].result())
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+    output.flush()
+    return len(chunk)
+
+
+def run_batch(queries, output, index_dir, store_ids, top_k, embeddings, mode="semantic", llm=None,
+              temperature=0.0, batch_size=256, answer_concurrency=8, timeout=None):
+    """
+    Run every query and write one JSON line per query, in input order.
+
+    The answers of one chunk are generated while the next chunk is embedded
+    and searched; a chunk is written once its answers are ready. Invalid rows,
+    and every query of a chunk whose embedding or search fails, get a record
+    with an "error" and the run continues.
+
+    Args:
+        queries (iterable): {"id", "query"} records
+        output (file): Text stream for the JSONL output
+        index_dir (str): Directory containing vector stores
+        store_ids (list): Stores to search
+        top_k (int): Results per query
+        embeddings: Embeddings object
+        mode (str): "semantic" or "hybrid"
+        llm (optional): Chat model; answers are generated only when given
+        temperature (float): LLM temperature
+        batch_size (int): Queries embedded and searched together
+        answer_concurrency (int): Answers generated at the same time
+        timeout (float, optional): Per-store deadline in seconds
+
+    Returns:
+        int: Number of queries written
+    """
+    sharded_index = ShardedIndex(index_dir, embeddings)
+    answer_pool = ThreadPoolExecutor(max_workers=answer_concurrency, thread_name_prefix="rag-batch-answer") if llm else None
+    queries = iter(queries)
+    pending = None
+    written = 0
+    try:
+        while True:
+            chunk = list(islice(queries, batch_size))
+            if not chunk:
+                break
+            valid = [query for query in chunk if not query.get("error") and query["query"].strip()]
+            results, errors, vectors, chunk_error = [], {}, [], None
+            if valid:
+                try:
+                    results, errors, vectors = search_chunk(valid, sharded_index, store_ids, top_k, embeddings,
+                                                            mode=mode, timeout=timeout)
+                except Exception as e:
+                    chunk_error = f"{type(e).__name__}: {e}"
+            answers = {}
+            if answer_pool is not None and chunk_error is None:
+                answers = {
+                    i: answer_pool.submit(answer_query, query["query"], results[i], llm, top_k, temperature, vectors[i])
+                    for i, query in enumerate(valid)
+                }
+            if pending is not None:
+                written += _write_chunk(output, *pending)
+            pending = (chunk, valid, results, errors, answers, chunk_error)
+        if pending is not None:
+            written += _write_chunk(output, *pending)
+    finally:
+        if answer_pool is not None:
+            answer_pool.shutdown(wait=False, cancel_futures=True)
+    return written
+
+
+def main():
+    """Command-line entry point: run a file of queries and write JSONL results."""
+    from dotenv import load_dotenv
+    from utils.clients import get_shared_embeddings, get_shared_llm
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Executa consultas em lote e grava os resultados em JSONL.")
+    parser.add_argument("input", help="Arquivo de consultas (.jsonl, .csv ou uma por linha; '-' para stdin)")
+    parser.add_argument("--output", default="-", help="Arquivo JSONL de saída (padrão: stdout)")
+    parser.add_argument("--index-dir", default=os.getenv("PATH_INDEX"), help="Diretório dos índices (PATH_INDEX)")
+    parser.add_argument("--stores", action="append", help="Nome (ex.: LO) ou ID do store (repetível; padrão: todos)")
+    parser.add_argument("--top-k", type=int, default=int(os.getenv("TOP_K", "30")), help="Resultados por consulta")
+    parser.add_argument("--mode", choices=("semantic", "hybrid"), default=os.getenv("SEARCH_MODE", "semantic"))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("BATCH_QUERY_SIZE", "256")),
+                        help="Consultas embutidas e pesquisadas juntas")
+    parser.add_argument("--answer", action="store_true", help="Gerar também a resposta do LLM")
+    parser.add_argument("--answer-concurrency", type=int, default=int(os.getenv("BATCH_ANSWER_CONCURRENCY", "8")),
+                        help="Respostas geradas ao mesmo tempo")
+    parser.add_argument("--model", default=None, help="Modelo do LLM (padrão: MODEL_LLM)")
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=None, help="Prazo por store, em segundos")
+    args = parser.parse_args()
+
+    if not args.index_dir:
+        parser.error("diretório dos índices não informado (--index-dir ou PATH_INDEX)")
+    try:
+        store_ids = resolve_store_ids(args.stores, args.index_dir)
+    except ValueError as e:
+        parser.error(str(e))
+    if not store_ids:
+        parser.error("nenhum store informado ou configurado (VECTOR_STORE_ID_*)")
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start = time.perf_counter()
+    try:
+        written = run_batch(
+            read_queries(args.input),
+            output,
+            args.index_dir,
+            store_ids,
+            args.top_k,
+            get_shared_embeddings(),
+            mode=args.mode,
+            llm=get_shared_llm(args.model) if args.answer else None,
+            temperature=args.temperature,
+            batch_size=args.batch_size,
+            answer_concurrency=args.answer_concurrency,
+            timeout=args.timeout,
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+    print(f"{written} consultas em {elapsed:.1f}s ({written / elapsed:.1f}/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
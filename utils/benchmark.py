@@ -0,0 +1,533 @@
+"""
+End-to-end latency benchmark of the search and answer path for the RAG application.
+
+Synthetic corpora are split across several stores and indexed with the
+deterministic hash embeddings. The app's own perform_search and
+generate_llm_answer then run against them with a local chat model stand-in,
+so no network access or API key is needed. Each run reports p50/p95/p99
+latency per stage, the resident size of the vector indexes and their recall
+against an exact search, and can be saved as JSON and compared with an
+earlier run.
+
+Usage:
+    python -m utils.benchmark --sizes 10000,100000,1000000 --stores 4 --output results.json
+    python -m utils.benchmark --sizes 10000 --compare results.json
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from utils.ann_index import ANN_INDEX_TYPES, build_ann_index, index_spec_from_env, store_vectors, write_index_spec
+from utils.embedding_cache import embed_queries_cached
+from utils.embedding_providers import HashEmbeddings
+from utils.index_cache import get_vectorstore_cache
+from utils.lexical_index import build_lexical_index, fold_accents
+from utils.profiling import StageRecorder
+from utils.search_operations import generate_llm_answer, perform_search
+from utils.search_tiers import tier_memory, write_full_vectors
+from utils.sharded_index import ShardedIndex, higher_is_better, merge_shard_hits, prepare_queries
+
+# Metadados do corpus sintético gravados no diretório de índices gerado
+CORPUS_FILE = "corpus.json"
+
+STAGES = ("index_load", "embed_query", "ann_search", "lexical_search", "merge", "group", "pack_context", "llm")
+
+_SYLLABLES = (
+    "ca", "co", "cu", "da", "de", "do", "fa", "fe", "ga", "la", "le", "li", "lo", "ma", "me", "mi", "mo",
+    "na", "ne", "no", "pa", "pe", "po", "ra", "re", "ri", "ro", "sa", "se", "si", "so", "ta", "te", "ti",
+    "to", "va", "ve", "vi", "ção", "ções", "dade", "mente", "ência", "ismo", "ista", "ável", "ões",
+)
+
+
+def synthetic_vocabulary(size, seed=0):
+    """
+    Generate a vocabulary of distinct Portuguese-like words.
+
+    Args:
+        size (int): Number of words
+        seed (int): Random seed
+
+    Returns:
+        numpy.ndarray: Words (object array)
+    """
+    rng = np.random.default_rng(seed)
+    words = set()
+    while len(words) < size:
+        n_syllables = rng.integers(2, 5)
+        words.add("".join(rng.choice(_SYLLABLES, n_syllables)))
+    return np.array(sorted(words), dtype=object)
+
+
+def synthetic_word_ids(n_paragraphs, vocab_size, words_per_paragraph=40, seed=0):
+    """
+    Draw paragraphs as word-id rows with a Zipf-like word distribution.
+
+    Args:
+        n_paragraphs (int): Number of paragraphs
+        vocab_size (int): Vocabulary size
+        words_per_paragraph (int): Words per paragraph
+        seed (int): Random seed
+
+    Returns:
+        numpy.ndarray: (n_paragraphs, words_per_paragraph) int32 matrix
+    """
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, vocab_size + 1, dtype=np.float64)
+    probabilities = 1.0 / ranks
+    probabilities /= probabilities.sum()
+    return rng.choice(vocab_size, size=(n_paragraphs, words_per_paragraph), p=probabilities).astype(np.int32)
+
+
+def embed_word_ids(word_ids, vocabulary, embeddings, chunk_size=20000):
+    """
+    Embed synthetic paragraphs directly from their word ids.
+
+    Uses the same word buckets as HashEmbeddings (without bigrams), so
+    millions of paragraphs embed in seconds while queries still land near
+    the paragraphs they were drawn from.
+
+    Args:
+        word_ids (numpy.ndarray): (n, words) word-id matrix
+        vocabulary (numpy.ndarray): Words
+        embeddings (HashEmbeddings): Embeddings defining buckets and dimension
+        chunk_size (int): Paragraphs per vectorized chunk
+
+    Returns:
+        numpy.ndarray: (n, dimension) float32 L2-normalized vectors
+    """
+    dimension = embeddings.dimension
+    buckets = np.empty(len(vocabulary), dtype=np.int64)
+    signs = np.empty(len(vocabulary), dtype=np.float32)
+    for i, word in enumerate(vocabulary):
+        buckets[i], signs[i] = embeddings.feature_bucket(fold_accents(word))
+
+    vectors = np.empty((len(word_ids), dimension), dtype=np.float32)
+    for start in range(0, len(word_ids), chunk_size):
+        rows = word_ids[start:start + chunk_size]
+        flat = (np.arange(len(rows))[:, None] * dimension + buckets[rows]).ravel()
+        chunk = np.bincount(flat, weights=signs[rows].ravel(), minlength=len(rows) * dimension)
+        chunk = chunk.reshape(len(rows), dimension).astype(np.float32)
+        norms = np.linalg.norm(chunk, axis=1, keepdims=True)
+        vectors[start:start + len(rows)] = chunk / np.maximum(norms, 1e-12)
+    return vectors
+
+
+def build_synthetic_stores(index_dir, n_paragraphs, n_stores, embeddings, index_spec, lexical=False, seed=0,
+                           vocab_size=20000):
+    """
+    Build (or reuse) synthetic stores holding n_paragraphs in total.
+
+    Args:
+        index_dir (str): Directory that receives one sub-directory per store
+        n_paragraphs (int): Paragraphs across all stores
+        n_stores (int): Number of stores
+        embeddings (HashEmbeddings): Embeddings used for the vectors
+        index_spec (dict): Index type and parameters
+        lexical (bool): Also build the BM25 indexes (hybrid mode)
+        seed (int): Random seed
+        vocab_size (int): Vocabulary size
+
+    Returns:
+        dict: Corpus metadata (store_ids, build_s, reused, ...), with "vocabulary"
+            and per-store "word_ids" kept in memory for query generation
+    """
+    config = {
+        "paragraphs": n_paragraphs, "stores": n_stores, "dimension": embeddings.dimension,
+        "index_spec": index_spec, "lexical": lexical, "seed": seed, "vocab_size": vocab_size,
+    }
+    store_ids = [f"bench{i:02d}" for i in range(n_stores)]
+    vocabulary = synthetic_vocabulary(vocab_size, seed)
+    per_store = np.array_split(np.arange(n_paragraphs), n_stores)
+    word_ids = {
+        store_id: synthetic_word_ids(len(rows), vocab_size, seed=seed + 1 + i)
+        for i, (store_id, rows) in enumerate(zip(store_ids, per_store))
+    }
+
+    corpus_file = os.path.join(index_dir, CORPUS_FILE)
+    reused = False
+    start = time.perf_counter()
+    if os.path.exists(corpus_file):
+        with open(corpus_file, "r", encoding="utf-8") as f:
+            reused = json.load(f).get("config") == config
+    if not reused:
+        for store_id in store_ids:
+            ids = word_ids[store_id]
+            docs = [
+                Document(page_content=" ".join(vocabulary[row]),
+                         metadata={"source": f"{store_id}.md", "paragraph_number": i + 1})
+                for i, row in enumerate(ids)
+            ]
+            doc_ids = [f"{store_id}.md#{i + 1}" for i in range(len(docs))]
+            vectors = embed_word_ids(ids, vocabulary, embeddings)
+            vectorstore = FAISS(
+                embeddings,
+                build_ann_index(vectors, index_spec),
+                InMemoryDocstore(dict(zip(doc_ids, docs))),
+                dict(enumerate(doc_ids))
+            )
+            store_path = os.path.join(index_dir, store_id)
+            vectorstore.save_local(store_path)
+            write_index_spec(store_path, index_spec)
+            write_full_vectors(store_path, vectors, index_spec)
+            if lexical:
+                build_lexical_index(vectorstore, store_path)
+        with open(corpus_file, "w", encoding="utf-8") as f:
+            json.dump({"config": config}, f)
+
+    return {
+        "store_ids": store_ids,
+        "build_s": time.perf_counter() - start,
+        "reused": reused,
+        "vocabulary": vocabulary,
+        "word_ids": word_ids,
+    }
+
+
+def synthetic_queries(corpus, n_queries, words_per_query=6, seed=0):
+    """
+    Draw queries as word windows of random corpus paragraphs.
+
+    Args:
+        corpus (dict): Result of build_synthetic_stores
+        n_queries (int): Number of queries
+        words_per_query (int): Words per query
+        seed (int): Random seed
+
+    Returns:
+        list: Query texts
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(n_queries):
+        ids = corpus["word_ids"][corpus["store_ids"][rng.integers(len(corpus["store_ids"]))]]
+        row = ids[rng.integers(len(ids))]
+        start = rng.integers(0, max(len(row) - words_per_query, 0) + 1)
+        queries.append(" ".join(corpus["vocabulary"][row[start:start + words_per_query]]))
+    return queries
+
+
+class StandInChatModel:
+    """
+    Local stand-in for the chat model with a configurable latency profile.
+
+    The answer is a fixed number of words, produced after `ttft` seconds
+    and then at `tokens_per_second` (0 = instantly).
+    """
+
+    def __init__(self, model_name="gpt-4o", ttft=0.0, tokens_per_second=0.0, answer_words=150):
+        """
+        Args:
+            model_name (str): Model name reported to the answer path (selects the tokenizer)
+            ttft (float): Seconds before the first token
+            tokens_per_second (float): Generation speed; 0 disables the delay
+            answer_words (int): Words in every answer
+        """
+        self.model_name = model_name
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.answer_words = answer_words
+
+    def _words(self, messages):
+        context = messages[-1].content.split()
+        return [context[i % len(context)] for i in range(self.answer_words)] if context else []
+
+    def stream(self, messages, **kwargs):
+        """Yield the answer word by word, as AIMessageChunk objects."""
+        if self.ttft:
+            time.sleep(self.ttft)
+        for word in self._words(messages):
+            if self.tokens_per_second:
+                time.sleep(1.0 / self.tokens_per_second)
+            yield AIMessageChunk(content=word + " ")
+
+    def invoke(self, messages, **kwargs):
+        """Return the whole answer as an AIMessage."""
+        return AIMessage(content="".join(chunk.content for chunk in self.stream(messages)))
+
+
+def latency_summary(seconds):
+    """
+    Summarize latencies.
+
+    Args:
+        seconds (list): Durations in seconds
+
+    Returns:
+        dict: p50_ms, p95_ms, p99_ms, mean_ms
+    """
+    if not seconds:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    values = np.asarray(seconds) * 1000.0
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "mean_ms": float(values.mean())}
+
+
+def run_corpus(index_dir, corpus, queries, embeddings, llm, top_k=10, mode="semantic", answer=True):
+    """
+    Run every query through perform_search (and generate_llm_answer) and collect latencies.
+
+    The first query runs against an empty vector store cache and is reported
+    separately as the cold query; the others are warm.
+
+    Args:
+        index_dir (str): Directory with the synthetic stores
+        corpus (dict): Result of build_synthetic_stores
+        queries (list): Query texts
+        embeddings: Embeddings object
+        llm: Chat model (or stand-in)
+        top_k (int): Results per query
+        mode (str): "semantic" or "hybrid"
+        answer (bool): Also generate answers
+
+    Returns:
+        dict: cold, search, answer and per-stage latency summaries
+    """
+    get_vectorstore_cache().invalidate()
+    search_times, answer_times = [], []
+    stage_times = {name: [] for name in STAGES}
+    cold = None
+
+    for query in queries:
+        with StageRecorder() as recorder:
+            start = time.perf_counter()
+            results, _, _ = perform_search(query, corpus["store_ids"], index_dir, top_k, mode=mode, embeddings=embeddings)
+            search_s = time.perf_counter() - start
+            answer_s = 0.0
+            if answer:
+                start = time.perf_counter()
+                generate_llm_answer(query, results, llm, top_k)
+                answer_s = time.perf_counter() - start
+        totals = recorder.totals()
+
+        if cold is None:
+            cold = {"search_ms": search_s * 1000.0,
+                    "stages_ms": {name: seconds * 1000.0 for name, seconds in totals.items()}}
+            continue
+        search_times.append(search_s)
+        answer_times.append(answer_s)
+        for name in STAGES:
+            if name in totals:
+                stage_times[name].append(totals[name])
+
+    return {
+        "queries": len(search_times),
+        "cold": cold,
+        "search": latency_summary(search_times),
+        "answer": latency_summary(answer_times) if answer else None,
+        "end_to_end": latency_summary([s + a for s, a in zip(search_times, answer_times)]),
+        "stages": {name: latency_summary(times) for name, times in stage_times.items() if times},
+    }
+
+
+def measure_index_quality(index_dir, corpus, queries, embeddings, top_k=10):
+    """
+    Measure the resident size of the stores' vector indexes and their recall against exact search.
+
+    Recall@k compares the global top-k of the app's search path (first pass
+    plus rescoring, for quantized stores) with an exhaustive float32 search
+    over the same vectors.
+
+    Args:
+        index_dir (str): Directory with the synthetic stores
+        corpus (dict): Result of build_synthetic_stores
+        queries (list): Query texts
+        embeddings: Embeddings object
+        top_k (int): Cut-off for recall@k
+
+    Returns:
+        dict: index_mb, float32_mb, compression and recall
+    """
+    store_ids = corpus["store_ids"]
+    sharded_index = ShardedIndex(index_dir, embeddings)
+    shards = {store_id: sharded_index.load_shard(store_id) for store_id in store_ids}
+    memory = [tier_memory(vectorstore) for vectorstore in shards.values()]
+    index_bytes = sum(item["index_bytes"] for item in memory)
+    float32_bytes = sum(item["float32_bytes"] for item in memory)
+
+    query_vectors = np.vstack(embed_queries_cached(embeddings, queries))
+    found, _ = sharded_index.search_batch(query_vectors, top_k, store_ids)
+
+    exact_hits = {}
+    for store_id, vectorstore in shards.items():
+        exact = build_ann_index(store_vectors(vectorstore), {"type": "flat"}, vectorstore.index.metric_type)
+        scores, ids = exact.search(prepare_queries(vectorstore, query_vectors), top_k)
+        exact_hits[store_id] = [
+            [(float(score), int(local_id)) for score, local_id in zip(row_scores, row_ids) if local_id != -1]
+            for row_scores, row_ids in zip(scores, ids)
+        ]
+    higher_better = higher_is_better(next(iter(shards.values())))
+
+    recalls = []
+    for i, results in enumerate(found):
+        winners = merge_shard_hits({store_id: hits[i] for store_id, hits in exact_hits.items()}, top_k, higher_better)
+        truth = {(store_id, shards[store_id].index_to_docstore_id[local_id]) for store_id, local_id, _ in winners}
+        got = {(doc.metadata["store_id"], doc.metadata["doc_id"]) for doc, _ in results}
+        recalls.append(len(truth & got) / max(len(truth), 1))
+
+    return {
+        "index_mb": index_bytes / 2 ** 20,
+        "float32_mb": float32_bytes / 2 ** 20,
+        "compression": float32_bytes / index_bytes if index_bytes else 1.0,
+        "recall": float(np.mean(recalls)) if recalls else None,
+    }
+
+
+def git_commit():
+    """Return the current git commit, or None outside a repository."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_runs(current, baseline, threshold=0.10, metric="p95_ms"):
+    """
+    Compare two benchmark runs corpus by corpus.
+
+    Args:
+        current (dict): Current run
+        baseline (dict): Earlier run
+        threshold (float): Relative slowdown reported as a regression
+        metric (str): Latency summary field to compare
+
+    Returns:
+        list: (corpus label, measure, baseline ms, current ms, ratio, regression) tuples
+    """
+    def label(run):
+        return f"{run['paragraphs']}/{run['stores']}"
+
+    baseline_runs = {label(run): run for run in baseline.get("runs", [])}
+    rows = []
+    for run in current.get("runs", []):
+        previous = baseline_runs.get(label(run))
+        if previous is None:
+            continue
+        measures = [("search", run["search"], previous["search"]), ("end_to_end", run["end_to_end"], previous["end_to_end"])]
+        measures += [(f"stage:{name}", summary, previous["stages"][name])
+                     for name, summary in run["stages"].items() if name in previous.get("stages", {})]
+        for measure, now, before in measures:
+            if not before or not now or not before[metric]:
+                continue
+            ratio = now[metric] / before[metric]
+            rows.append((label(run), measure, before[metric], now[metric], ratio, ratio > 1.0 + threshold))
+    return rows
+
+
+def format_report(result):
+    """
+    Format a benchmark result as a text table.
+
+    Args:
+        result (dict): Benchmark result
+
+    Returns:
+        str: Report
+    """
+    lines = []
+    for run in result["runs"]:
+        lines.append(f"\n{run['paragraphs']} parágrafos em {run['stores']} stores "
+                     f"(construção {run['build_s']:.1f}s{', reutilizada' if run['reused'] else ''}; "
+                     f"consulta fria {run['cold']['search_ms']:.1f} ms)")
+        lines.append(f"{'etapa':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        rows = [("search", run["search"])]
+        if run["answer"]:
+            rows.append(("answer", run["answer"]))
+            rows.append(("end_to_end", run["end_to_end"]))
+        rows += [(f"  {name}", summary) for name, summary in run["stages"].items()]
+        for name, summary in rows:
+            lines.append(f"{name:<16}{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}{summary['p99_ms']:>10.2f}")
+        quality = run.get("index")
+        if quality:
+            lines.append(f"índice em RAM {quality['index_mb']:.1f} MB (float32: {quality['float32_mb']:.1f} MB, "
+                         f"{quality['compression']:.1f}x menor); recall@{result['config']['top_k']} {quality['recall']:.4f}")
+    return "\n".join(lines)
+
+
+def main():
+    """Command-line entry point: run the benchmark, save it as JSON and compare with a baseline."""
+    parser = argparse.ArgumentParser(description="Benchmark de latência da busca e da resposta com corpora sintéticos.")
+    parser.add_argument("--sizes", default="10000,100000", help="Total de parágrafos por corpus, separados por vírgula")
+    parser.add_argument("--stores", type=int, default=4, help="Stores por corpus")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensão dos embeddings sintéticos")
+    parser.add_argument("--index-type", choices=ANN_INDEX_TYPES, help="Tipo de índice (padrão: ANN_INDEX_TYPE)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--mode", choices=("semantic", "hybrid"), default="semantic")
+    parser.add_argument("--no-answer", action="store_true", help="Mede apenas a busca")
+    parser.add_argument("--recall-queries", type=int, default=100, help="Consultas usadas no recall contra a busca exata")
+    parser.add_argument("--llm-ttft", type=float, default=0.0, help="Segundos até o primeiro token do modelo simulado")
+    parser.add_argument("--llm-tps", type=float, default=0.0, help="Tokens por segundo do modelo simulado (0 = instantâneo)")
+    parser.add_argument("--workdir", default=os.path.join(".cache", "benchmark"), help="Onde os stores sintéticos são gravados")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Arquivo JSON de resultados")
+    parser.add_argument("--compare", help="Resultado JSON anterior para comparação")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Aumento relativo do p95 considerado regressão")
+    args = parser.parse_args()
+
+    # Consultas medidas sempre do zero: sem cache de embeddings nem cache de respostas
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    os.environ["EMBEDDING_CACHE_SIZE"] = "0"
+    os.environ["ANSWER_CACHE_SIZE"] = "0"
+
+    # A busca roda fora do servidor do Streamlit; silencia os avisos de contexto ausente
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    embeddings = HashEmbeddings(dimension=args.dim)
+    llm = StandInChatModel(os.getenv("MODEL_LLM", "gpt-4o"), ttft=args.llm_ttft, tokens_per_second=args.llm_tps)
+    index_spec = index_spec_from_env()
+    if args.index_type:
+        index_spec["type"] = args.index_type
+
+    result = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "stores": args.stores, "dimension": args.dim, "index_spec": index_spec, "queries": args.queries,
+            "top_k": args.top_k, "mode": args.mode, "llm_ttft": args.llm_ttft, "llm_tps": args.llm_tps,
+        },
+        "runs": [],
+    }
+    for size in (int(value) for value in args.sizes.split(",")):
+        index_dir = os.path.join(args.workdir, f"{size}-{args.stores}-{args.dim}-{index_spec['type']}")
+        print(f"Preparando corpus de {size} parágrafos...", file=sys.stderr)
+        corpus = build_synthetic_stores(index_dir, size, args.stores, embeddings, index_spec,
+                                        lexical=args.mode == "hybrid", seed=args.seed)
+        queries = synthetic_queries(corpus, args.queries + 1, seed=args.seed)
+        run = run_corpus(index_dir, corpus, queries, embeddings, llm, top_k=args.top_k, mode=args.mode,
+                         answer=not args.no_answer)
+        run.update(paragraphs=size, stores=args.stores, build_s=corpus["build_s"], reused=corpus["reused"])
+        if args.mode == "semantic":
+            run["index"] = measure_index_quality(index_dir, corpus, queries[:args.recall_queries], embeddings, args.top_k)
+        result["runs"].append(run)
+
+    print(format_report(result))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare_runs(result, baseline, args.threshold)
+        print(f"\nComparação com {baseline.get('commit') or args.compare} (p95):")
+        for corpus_label, measure, before, now, ratio, regression in rows:
+            flag = "  REGRESSÃO" if regression else ""
+            print(f"{corpus_label:<14}{measure:<22}{before:>10.2f}{now:>10.2f}{ratio:>8.2f}x{flag}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Process-wide embeddings and LLM clients shared by every session and API request.
+"""
+import os
+import threading
+
+from utils.llm_query import initialize_llm
+from utils.vector_store import initialize_embeddings
+
+_embeddings = None
+_llms = {}
+_lock = threading.Lock()
+
+
+def get_shared_embeddings():
+    """
+    Return the process-wide embeddings object of the configured provider.
+
+    Returns:
+        Embeddings: Shared embeddings object
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                _embeddings = initialize_embeddings()
+    return _embeddings
+
+
+def get_shared_llm(model_name=None):
+    """
+    Return the process-wide chat model for a model name.
+
+    The temperature is passed per call, so one client serves every request.
+
+    Args:
+        model_name (str, optional): Model name; defaults to MODEL_LLM
+
+    Returns:
+        ChatOpenAI: Shared LLM object
+    """
+    model_name = model_name or os.getenv("MODEL_LLM", "gpt-4o")
+    llm = _llms.get(model_name)
+    if llm is None:
+        with _lock:
+            llm = _llms.get(model_name)
+            if llm is None:
+                llm = _llms[model_name] = initialize_llm(model_name=model_name, temperature=0)
+    return llm
@@ -0,0 +1,200 @@
+"""
+Token-budgeted context assembly for LLM prompts in the RAG application.
+"""
+import hashlib
+import os
+import re
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken normalmente vem com langchain-openai
+    tiktoken = None
+
+# Estimativa usada quando o tokenizador do modelo não está disponível
+APPROX_CHARS_PER_TOKEN = 4
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…;])\s+")
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """
+    Return the tiktoken encoding of a model.
+
+    Args:
+        model (str): OpenAI model name
+
+    Returns:
+        tiktoken.Encoding: Encoding, or None when tiktoken is not installed
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def encoding_name(model):
+    """
+    Return the name of the tokenizer used to count tokens for a model.
+
+    Args:
+        model (str): OpenAI model name
+
+    Returns:
+        str: Encoding name, or "approx" for the character-based estimate
+    """
+    encoding = get_encoding(model)
+    return encoding.name if encoding is not None else "approx"
+
+
+def count_tokens(text, model):
+    """
+    Count the tokens of a text with the model's tokenizer.
+
+    Args:
+        text (str): Text to count
+        model (str): OpenAI model name
+
+    Returns:
+        int: Number of tokens
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // APPROX_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def annotate_token_counts(docs, model):
+    """
+    Store per-document token counts in metadata at index time.
+
+    Args:
+        docs (list): Document objects (updated in place)
+        model (str): Target LLM model name
+
+    Returns:
+        list: The same documents
+    """
+    name = encoding_name(model)
+    for doc in docs:
+        doc.metadata["token_count"] = count_tokens(doc.page_content, model)
+        doc.metadata["token_encoding"] = name
+    return docs
+
+
+def document_tokens(doc, model):
+    """
+    Return a document's token count, using the precomputed value when it matches the model.
+
+    Args:
+        doc: Document object
+        model (str): Target LLM model name
+
+    Returns:
+        int: Number of tokens
+    """
+    if doc.metadata.get("token_encoding") == encoding_name(model) and "token_count" in doc.metadata:
+        return doc.metadata["token_count"]
+    return count_tokens(doc.page_content, model)
+
+
+def truncate_at_sentence(text, max_tokens, model):
+    """
+    Cut a text to at most max_tokens, ending at a sentence boundary when possible.
+
+    Args:
+        text (str): Text to truncate
+        max_tokens (int): Token limit
+        model (str): Target LLM model name
+
+    Returns:
+        str: Truncated text (may be empty)
+    """
+    kept, used = [], 0
+    for sentence in _SENTENCE_END.split(text):
+        tokens = count_tokens(sentence + " ", model)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    if kept:
+        return " ".join(kept)
+
+    # A primeira frase já excede o limite: corta no limite de tokens
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * APPROX_CHARS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _shingles(text, size=3):
+    """Return the set of word n-grams of a text, used for near-duplicate detection."""
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def pack_context(docs, model, token_budget=None, max_passage_tokens=None, near_duplicate_threshold=None):
+    """
+    Select passages in rank order until the token budget is filled.
+
+    Exact duplicates and near-duplicates (word-trigram Jaccard similarity above
+    the threshold) of an already selected passage are dropped, and passages
+    longer than max_passage_tokens or than the remaining budget are truncated
+    at a sentence boundary.
+
+    Args:
+        docs (list): Documents in rank order
+        model (str): Target LLM model name
+        token_budget (int, optional): Total context tokens (CONTEXT_TOKEN_BUDGET, default 8000)
+        max_passage_tokens (int, optional): Cap per passage (CONTEXT_MAX_PASSAGE_TOKENS, default 800)
+        near_duplicate_threshold (float, optional): Jaccard threshold (CONTEXT_NEAR_DUPLICATE, default 0.9)
+
+    Returns:
+        list: Passage texts to place in the prompt
+    """
+    if token_budget is None:
+        token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+    if max_passage_tokens is None:
+        max_passage_tokens = int(os.getenv("CONTEXT_MAX_PASSAGE_TOKENS", "800"))
+    if near_duplicate_threshold is None:
+        near_duplicate_threshold = float(os.getenv("CONTEXT_NEAR_DUPLICATE", "0.9"))
+
+    # Separador "\n\n" entre trechos
+    separator_tokens = count_tokens("\n\n", model)
+    passages, seen_hashes, seen_shingles = [], set(), []
+    remaining = token_budget
+
+    for doc in docs:
+        text = doc.page_content.strip()
+        if not text:
+            continue
+
+        text_hash = hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+        if text_hash in seen_hashes:
+            continue
+        shingles = _shingles(text)
+        if any(len(shingles & other) / len(shingles | other) >= near_duplicate_threshold for other in seen_shingles):
+            continue
+
+        tokens = document_tokens(doc, model)
+        limit = min(max_passage_tokens, remaining - separator_tokens)
+        if limit <= 0:
+            break
+        if tokens > limit:
+            text = truncate_at_sentence(text, limit, model)
+            if not text:
+                break
+            tokens = count_tokens(text, model)
+
+        passages.append(text)
+        seen_hashes.add(text_hash)
+        seen_shingles.append(shingles)
+        remaining -= tokens + separator_tokens
+
+    return passages
@@ -0,0 +1,274 @@
+"""
+Two-tier query embedding cache (in-memory LRU + on-disk SQLite) for the RAG application.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.metrics import EMBEDDING_CALLS, EMBEDDING_TEXTS
+
+
+def normalize_query_text(text):
+    """
+    Normalize query text so trivially different spellings share a cache entry.
+
+    Args:
+        text (str): Raw query text
+
+    Returns:
+        str: NFC-normalized text with collapsed whitespace
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def embedding_model_name(embeddings):
+    """
+    Return the model name used to key cached vectors of an embeddings object.
+
+    Models with a configurable output size (text-embedding-3-* with
+    EMBEDDING_DIM) get it appended, so vectors of another size are never
+    served from the caches or the build checkpoint.
+
+    Args:
+        embeddings: Embeddings object
+
+    Returns:
+        str: Model name, e.g. "text-embedding-3-small@256"
+    """
+    name = (
+        getattr(embeddings, "model", None)
+        or getattr(embeddings, "model_name", None)
+        or type(embeddings).__name__
+    )
+    dimensions = getattr(embeddings, "dimensions", None)
+    return f"{name}@{dimensions}" if dimensions else name
+
+
+class EmbeddingCache:
+    """
+    Thread-safe embedding cache keyed by (model, normalized text).
+
+    Hot entries live in an in-memory LRU; every entry is also persisted to a
+    SQLite file so popular queries survive restarts and are shared between
+    worker processes.
+    """
+
+    def __init__(self, max_entries, db_path=None):
+        """
+        Args:
+            max_entries (int): Maximum number of vectors kept in memory
+            db_path (str, optional): SQLite file for the disk tier; None disables it
+        """
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def _key(model, text):
+        text_hash = hashlib.sha256(normalize_query_text(text).encode("utf-8")).hexdigest()
+        return model, text_hash
+
+    def get(self, model, text):
+        """
+        Look up a cached vector.
+
+        Args:
+            model (str): Embedding model name
+            text (str): Query text
+
+        Returns:
+            numpy.ndarray: float32 vector, or None on a miss
+        """
+        key = self._key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return vector
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?", key
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self._stats["disk_hits"] += 1
+                    return vector
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, model, text, vector):
+        """
+        Store a vector in both tiers.
+
+        Args:
+            model (str): Embedding model name
+            text (str): Query text
+            vector (list or numpy.ndarray): Embedding vector
+
+        Returns:
+            numpy.ndarray: The cached (read-only, float32) vector
+        """
+        key = self._key(model, text)
+        vector = np.asarray(vector, dtype=np.float32).copy()
+        vector.setflags(write=False)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    (key[0], key[1], vector.tobytes())
+                )
+                self._db.commit()
+        return vector
+
+    def _remember(self, key, vector):
+        """Insert into the memory tier (caller holds self._lock)."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: memory_hits, disk_hits, misses, memory_entries
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """
+    Return the process-wide embedding cache.
+
+    The memory tier size is read from EMBEDDING_CACHE_SIZE (default 1024) and
+    the SQLite file from EMBEDDING_CACHE_PATH (default .cache/embeddings.sqlite;
+    set it empty to disable the disk tier).
+
+    Returns:
+        EmbeddingCache: Shared cache instance
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                max_entries = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+                db_path = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite"))
+                _cache = EmbeddingCache(max_entries, db_path or None)
+    return _cache
+
+
+def embed_query_cached(embeddings, text):
+    """
+    Embed a query, skipping the embedding API when the vector is cached.
+
+    Args:
+        embeddings: Embeddings object
+        text (str): Query text
+
+    Returns:
+        numpy.ndarray: float32 query vector
+    """
+    cache = get_embedding_cache()
+    model = embedding_model_name(embeddings)
+    vector = cache.get(model, text)
+    if vector is None:
+        EMBEDDING_CALLS.inc(model=model, kind="query")
+        EMBEDDING_TEXTS.inc(model=model, kind="query")
+        vector = cache.put(model, text, embeddings.embed_query(normalize_query_text(text)))
+    return vector
+
+
+async def aembed_query_cached(embeddings, text):
+    """
+    Async counterpart of embed_query_cached, using the provider's aembed_query.
+
+    Cache lookups may hit SQLite, so they run in a worker thread instead of
+    blocking the event loop.
+
+    Args:
+        embeddings: Embeddings object
+        text (str): Query text
+
+    Returns:
+        numpy.ndarray: float32 query vector
+    """
+    cache = get_embedding_cache()
+    model = embedding_model_name(embeddings)
+    vector = await asyncio.to_thread(cache.get, model, text)
+    if vector is None:
+        EMBEDDING_CALLS.inc(model=model, kind="query")
+        EMBEDDING_TEXTS.inc(model=model, kind="query")
+        vector = await embeddings.aembed_query(normalize_query_text(text))
+        vector = await asyncio.to_thread(cache.put, model, text, vector)
+    return vector
+
+
+def embed_queries_cached(embeddings, texts):
+    """
+    Embed many queries at once, skipping the ones whose vectors are cached.
+
+    The misses (deduplicated) go to the provider in one embed_documents call,
+    which the provider splits into API batches of its own batch size, instead
+    of one request per query.
+
+    Args:
+        embeddings: Embeddings object
+        texts (list): Query texts
+
+    Returns:
+        list: float32 query vectors (numpy.ndarray), in the order of texts
+    """
+    cache = get_embedding_cache()
+    model = embedding_model_name(embeddings)
+    vectors = [cache.get(model, text) for text in texts]
+    missing = {}
+    for text, vector in zip(texts, vectors):
+        if vector is None:
+            missing.setdefault(normalize_query_text(text), text)
+    if missing:
+        EMBEDDING_CALLS.inc(model=model, kind="query")
+        EMBEDDING_TEXTS.inc(len(missing), model=model, kind="query")
+        new_vectors = embeddings.embed_documents(list(missing))
+        fresh = {
+            normalized: cache.put(model, text, vector)
+            for (normalized, text), vector in zip(missing.items(), new_vectors)
+        }
+        vectors = [
+            vector if vector is not None else fresh[normalize_query_text(text)]
+            for text, vector in zip(texts, vectors)
+        ]
+    return vectors
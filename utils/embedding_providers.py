@@ -0,0 +1,206 @@
+"""
+Pluggable embedding providers (OpenAI, local CPU model, deterministic hashing) for the RAG application.
+"""
+import hashlib
+import os
+import re
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils.lexical_index import fold_accents
+
+# Dimensão dos embeddings text-embedding-ada-002 / text-embedding-3-small da OpenAI
+DEFAULT_DIMENSION = 1536
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic, offline embeddings built with the hashing trick.
+
+    Words and word bigrams are hashed into signed buckets and the result is
+    L2-normalized, so texts sharing vocabulary get similar vectors. It needs
+    no network or model download, which makes builds, tests and latency
+    benchmarks reproducible on any machine.
+    """
+
+    def __init__(self, dimension=DEFAULT_DIMENSION, batch_size=256):
+        """
+        Args:
+            dimension (int): Vector dimension
+            batch_size (int): Texts per batch in embed_documents
+        """
+        self.dimension = dimension
+        self.batch_size = batch_size
+        self.model = f"hash-{dimension}"
+
+    def _features(self, text):
+        words = _WORD.findall(fold_accents(text))
+        return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+    def feature_bucket(self, feature):
+        """
+        Return the bucket and sign a feature (word or bigram) is hashed to.
+
+        Args:
+            feature (str): Folded word or "word word" bigram
+
+        Returns:
+            tuple: (bucket index, +1.0 or -1.0)
+        """
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest[:4], "little") % self.dimension, 1.0 if digest[4] & 1 else -1.0
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature in self._features(text):
+            bucket, sign = self.feature_bucket(feature)
+            vector[bucket] += sign
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed_documents(self, texts):
+        """
+        Embed a list of texts.
+
+        Args:
+            texts (list): Texts to embed
+
+        Returns:
+            list: One vector (list of floats) per text
+        """
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed(text).tolist() for text in texts[start:start + self.batch_size])
+        return vectors
+
+    def embed_query(self, text):
+        """
+        Embed a query.
+
+        Args:
+            text (str): Query text
+
+        Returns:
+            list: Query vector
+        """
+        return self._embed(text).tolist()
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    CPU embeddings from a local sentence-transformers model.
+    """
+
+    def __init__(self, model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2", batch_size=64):
+        """
+        Args:
+            model_name (str): sentence-transformers model name or path
+            batch_size (int): Texts per forward pass
+        """
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("O provedor 'local' requer o pacote sentence-transformers (pip install sentence-transformers)")
+        self.model = model_name
+        self.batch_size = batch_size
+        self._model = SentenceTransformer(model_name, device="cpu")
+        self.dimension = self._model.get_sentence_embedding_dimension()
+
+    def embed_documents(self, texts):
+        """
+        Embed a list of texts.
+
+        Args:
+            texts (list): Texts to embed
+
+        Returns:
+            list: One vector (list of floats) per text
+        """
+        vectors = self._model.encode(list(texts), batch_size=self.batch_size, normalize_embeddings=True,
+                                     convert_to_numpy=True, show_progress_bar=False)
+        return vectors.astype(np.float32).tolist()
+
+    def embed_query(self, text):
+        """
+        Embed a query.
+
+        Args:
+            text (str): Query text
+
+        Returns:
+            list: Query vector
+        """
+        return self.embed_documents([text])[0]
+
+
+def _openai_provider(model=None, dimension=None, batch_size=None):
+    from langchain_openai import OpenAIEmbeddings
+
+    from utils.http_pool import get_async_http_client, get_http_client
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable is not set")
+    # Pool HTTP compartilhado por (provedor, modelo) com todas as sessões
+    pool_model = model or "text-embedding-ada-002"
+    kwargs = {
+        "openai_api_key": api_key,
+        "http_client": get_http_client("openai", pool_model),
+        "http_async_client": get_async_http_client("openai", pool_model),
+    }
+    if model:
+        kwargs["model"] = model
+    if dimension and model and model.startswith("text-embedding-3"):
+        kwargs["dimensions"] = dimension
+    if batch_size:
+        kwargs["chunk_size"] = batch_size
+    return OpenAIEmbeddings(**kwargs)
+
+
+def _local_provider(model=None, dimension=None, batch_size=None):
+    kwargs = {}
+    if model:
+        kwargs["model_name"] = model
+    if batch_size:
+        kwargs["batch_size"] = batch_size
+    return LocalEmbeddings(**kwargs)
+
+
+def _hash_provider(model=None, dimension=None, batch_size=None):
+    return HashEmbeddings(dimension=dimension or DEFAULT_DIMENSION, batch_size=batch_size or 256)
+
+
+EMBEDDING_PROVIDERS = {
+    "openai": _openai_provider,
+    "local": _local_provider,
+    "hash": _hash_provider,
+}
+
+
+def get_embedding_provider(name=None, model=None, dimension=None, batch_size=None):
+    """
+    Create an embeddings object for the configured provider.
+
+    Defaults come from EMBEDDING_PROVIDER ("openai", "local" or "hash"),
+    EMBEDDING_MODEL, EMBEDDING_DIM and EMBEDDING_BATCH_SIZE. Stores must be
+    searched with the provider (and dimension) they were built with.
+
+    Args:
+        name (str, optional): Provider name
+        model (str, optional): Model name for the provider
+        dimension (int, optional): Vector dimension (hash provider, text-embedding-3 models)
+        batch_size (int, optional): Texts per embedding batch
+
+    Returns:
+        Embeddings: LangChain embeddings object
+    """
+    name = name or os.getenv("EMBEDDING_PROVIDER", "openai")
+    if name not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Provedor de embeddings desconhecido: {name} (use um de {', '.join(EMBEDDING_PROVIDERS)})")
+    model = model or os.getenv("EMBEDDING_MODEL") or None
+    dimension = dimension or (int(os.getenv("EMBEDDING_DIM")) if os.getenv("EMBEDDING_DIM") else None)
+    batch_size = batch_size or (int(os.getenv("EMBEDDING_BATCH_SIZE")) if os.getenv("EMBEDDING_BATCH_SIZE") else None)
+    return EMBEDDING_PROVIDERS[name](model=model, dimension=dimension, batch_size=batch_size)
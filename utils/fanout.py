@@ -0,0 +1,160 @@
+"""
+Concurrent fan-out of per-store work on a bounded, process-wide thread pool.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Resultado de uma tarefa: chave, valor retornado, exceção (ou None) e duração em segundos
+TaskOutcome = namedtuple("TaskOutcome", ["key", "result", "error", "elapsed"])
+
+# Intervalo de verificação de prazos enquanto há tarefas com timeout pendentes
+_POLL_SECONDS = 0.05
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_search_executor():
+    """
+    Return the shared thread pool used for store searches.
+
+    The pool size is read from SEARCH_MAX_WORKERS (default: CPU count, at most 16).
+    FAISS releases the GIL while searching, so stores run truly in parallel.
+
+    Returns:
+        ThreadPoolExecutor: Shared executor
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = int(os.getenv("SEARCH_MAX_WORKERS", str(min(16, os.cpu_count() or 4))))
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-search")
+    return _executor
+
+
+def fan_out(tasks, timeout=None, executor=None):
+    """
+    Run tasks concurrently and yield their outcomes as each one finishes.
+
+    Outcomes are yielded in the caller's thread, so it is safe to update
+    Streamlit elements while iterating. A task that runs longer than
+    `timeout` seconds (or waits longer than that for a free worker) is
+    reported with a TimeoutError and abandoned; its thread cannot be
+    interrupted and finishes in the background.
+
+    Args:
+        tasks (dict): Mapping of key -> zero-argument callable
+        timeout (float, optional): Per-task deadline in seconds
+        executor (Executor, optional): Executor to use instead of the shared pool
+
+    Yields:
+        TaskOutcome: (key, result, error, elapsed) in completion order
+    """
+    executor = executor or get_search_executor()
+    started = {}
+
+    def run(key, fn):
+        started[key] = time.perf_counter()
+        return fn()
+
+    submitted = time.perf_counter()
+    futures = {executor.submit(run, key, fn): key for key, fn in tasks.items()}
+    pending = set(futures)
+
+    while pending:
+        done, pending = wait(
+            pending,
+            timeout=_POLL_SECONDS if timeout is not None else None,
+            return_when=FIRST_COMPLETED
+        )
+        now = time.perf_counter()
+
+        for future in done:
+            key = futures[future]
+            elapsed = now - started.get(key, now)
+            try:
+                yield TaskOutcome(key, future.result(), None, elapsed)
+            except Exception as e:
+                yield TaskOutcome(key, None, e, elapsed)
+
+        if timeout is None:
+            continue
+
+        for future in list(pending):
+            key = futures[future]
+            start = started.get(key)
+            if start is None:
+                # Ainda na fila: cancela se esperou mais que o prazo por um worker livre
+                if now - submitted > timeout and future.cancel():
+                    pending.discard(future)
+                    yield TaskOutcome(key, None, TimeoutError(f"sem worker livre após {timeout:.1f}s"), 0.0)
+            elif now - start > timeout:
+                pending.discard(future)
+                yield TaskOutcome(key, None, TimeoutError(f"prazo de {timeout:.1f}s excedido"), now - start)
+
+
+async def afan_out(tasks, timeout=None, executor=None):
+    """
+    Async counterpart of fan_out for code running on an event loop.
+
+    Tasks run on the same bounded thread pool; the event loop stays free
+    while they run, with the same deadline rules as fan_out.
+
+    Args:
+        tasks (dict): Mapping of key -> zero-argument callable
+        timeout (float, optional): Per-task deadline in seconds
+        executor (Executor, optional): Executor to use instead of the shared pool
+
+    Yields:
+        TaskOutcome: (key, result, error, elapsed) in completion order
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or get_search_executor()
+    started = {}
+
+    def run(key, fn):
+        started[key] = time.perf_counter()
+        return fn()
+
+    submitted = time.perf_counter()
+    futures = {loop.run_in_executor(executor, run, key, fn): key for key, fn in tasks.items()}
+    pending = set(futures)
+
+    while pending:
+        done, pending = await asyncio.wait(
+            pending,
+            timeout=_POLL_SECONDS if timeout is not None else None,
+            return_when=asyncio.FIRST_COMPLETED
+        )
+        now = time.perf_counter()
+
+        for future in done:
+            key = futures[future]
+            elapsed = now - started.get(key, now)
+            if future.cancelled():
+                continue
+            error = future.exception()
+            yield TaskOutcome(key, None if error else future.result(), error, elapsed)
+
+        if timeout is None:
+            continue
+
+        for future in list(pending):
+            key = futures[future]
+            start = started.get(key)
+            if start is None:
+                # Ainda na fila: cancela se esperou mais que o prazo por um worker livre
+                if now - submitted > timeout:
+                    future.cancel()
+                    pending.discard(future)
+                    yield TaskOutcome(key, None, TimeoutError(f"sem worker livre após {timeout:.1f}s"), 0.0)
+            elif now - start > timeout:
+                # A thread continua até o fim; o resultado é descartado
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                pending.discard(future)
+                yield TaskOutcome(key, None, TimeoutError(f"prazo de {timeout:.1f}s excedido"), now - start)
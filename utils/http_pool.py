@@ -0,0 +1,222 @@
+"""
+Process-wide keep-alive HTTP connection pools for the provider clients of the RAG application.
+
+One sync and one async httpx client is kept per (provider, model), so every
+session, API request and batch tool calling the same model reuses the same
+TLS connections instead of each client opening its own. Pool sizes come from
+HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE and HTTP_KEEPALIVE_EXPIRY.
+
+Requests, in-flight requests and newly opened connections are counted per
+pool in utils.metrics; connections opened versus requests sent shows how
+often a pooled connection was reused.
+"""
+import os
+import threading
+
+import httpx
+
+from utils.metrics import HTTP_CONNECTIONS_OPENED, HTTP_IN_FLIGHT, HTTP_REQUESTS
+
+# Evento do httpcore emitido quando uma nova conexão TCP é aberta
+CONNECT_EVENT = "connection.connect_tcp.complete"
+
+_sync_clients = {}
+_async_clients = {}
+_lock = threading.Lock()
+
+
+def pool_limits():
+    """
+    Return the connection limits of each pool.
+
+    Returns:
+        httpx.Limits: Limits from the HTTP_POOL_* variables
+    """
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60")),
+    )
+
+
+def _timeout():
+    return httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", "60")), connect=10.0)
+
+
+def _pool_name(provider, model):
+    return f"{provider}:{model}" if model else provider
+
+
+class _CountedStream(httpx.SyncByteStream):
+    """Response body that ends the in-flight count when it is closed."""
+
+    def __init__(self, stream, done):
+        self._stream = stream
+        self._done = done
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._done()
+
+
+class _AsyncCountedStream(httpx.AsyncByteStream):
+    """Async response body that ends the in-flight count when it is closed."""
+
+    def __init__(self, stream, done):
+        self._stream = stream
+        self._done = done
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._done()
+
+
+def _completion(pool):
+    """Return a callback that ends one in-flight request, at most once."""
+    state = {"done": False}
+
+    def done():
+        if not state["done"]:
+            state["done"] = True
+            HTTP_IN_FLIGHT.dec(pool=pool)
+
+    return done
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """
+    Pooled transport that counts requests, in-flight requests and new connections.
+
+    A request stays in flight until its response body is closed, so streamed
+    LLM answers are counted for their whole duration.
+    """
+
+    def __init__(self, pool, **kwargs):
+        """
+        Args:
+            pool (str): Pool name used as the metrics label
+            **kwargs: httpx.HTTPTransport arguments
+        """
+        super().__init__(**kwargs)
+        self.pool = pool
+
+    def _trace(self, event, info):
+        if event == CONNECT_EVENT:
+            HTTP_CONNECTIONS_OPENED.inc(pool=self.pool)
+
+    def handle_request(self, request):
+        request.extensions["trace"] = self._trace
+        HTTP_REQUESTS.inc(pool=self.pool)
+        HTTP_IN_FLIGHT.inc(pool=self.pool)
+        done = _completion(self.pool)
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            done()
+            raise
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_CountedStream(response.stream, done), extensions=response.extensions)
+
+
+class AsyncInstrumentedTransport(httpx.AsyncHTTPTransport):
+    """
+    Async counterpart of InstrumentedTransport.
+    """
+
+    def __init__(self, pool, **kwargs):
+        """
+        Args:
+            pool (str): Pool name used as the metrics label
+            **kwargs: httpx.AsyncHTTPTransport arguments
+        """
+        super().__init__(**kwargs)
+        self.pool = pool
+
+    async def _trace(self, event, info):
+        if event == CONNECT_EVENT:
+            HTTP_CONNECTIONS_OPENED.inc(pool=self.pool)
+
+    async def handle_async_request(self, request):
+        request.extensions["trace"] = self._trace
+        HTTP_REQUESTS.inc(pool=self.pool)
+        HTTP_IN_FLIGHT.inc(pool=self.pool)
+        done = _completion(self.pool)
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            done()
+            raise
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_AsyncCountedStream(response.stream, done), extensions=response.extensions)
+
+
+def get_http_client(provider, model=None):
+    """
+    Return the shared sync HTTP client of a (provider, model) pool.
+
+    Args:
+        provider (str): Provider name (e.g. openai)
+        model (str, optional): Model name
+
+    Returns:
+        httpx.Client: Shared keep-alive client
+    """
+    key = (provider, model)
+    client = _sync_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _sync_clients.get(key)
+            if client is None:
+                transport = InstrumentedTransport(_pool_name(provider, model), limits=pool_limits())
+                client = _sync_clients[key] = httpx.Client(transport=transport, timeout=_timeout())
+    return client
+
+
+def get_async_http_client(provider, model=None):
+    """
+    Return the shared async HTTP client of a (provider, model) pool.
+
+    Args:
+        provider (str): Provider name (e.g. openai)
+        model (str, optional): Model name
+
+    Returns:
+        httpx.AsyncClient: Shared keep-alive client
+    """
+    key = (provider, model)
+    client = _async_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(key)
+            if client is None:
+                transport = AsyncInstrumentedTransport(_pool_name(provider, model), limits=pool_limits())
+                client = _async_clients[key] = httpx.AsyncClient(transport=transport, timeout=_timeout())
+    return client
+
+
+def pool_stats():
+    """
+    Return the open and idle connections of each sync pool.
+
+    Returns:
+        dict: Pool name -> {"open": int, "idle": int}
+    """
+    stats = {}
+    for (provider, model), client in list(_sync_clients.items()):
+        connections = list(getattr(client._transport._pool, "connections", []))
+        stats[_pool_name(provider, model)] = {
+            "open": len(connections),
+            "idle": sum(1 for connection in connections if connection.is_idle()),
+        }
+    return stats
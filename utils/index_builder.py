@@ -0,0 +1,513 @@
+"""
+Resumable, concurrent and incremental vector store build pipeline for the RAG application.
+
+Usage:
+    python -m utils.index_builder --store <VECTOR_STORE_ID>=<markdown_dir> [--store ...]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from utils.ann_index import build_ann_index, index_spec_from_env, read_index_spec, store_vectors, write_index_spec
+from utils.clients import get_shared_embeddings
+from utils.context_packer import annotate_token_counts
+from utils.embedding_cache import embedding_model_name
+from utils.lazy_imports import lazy_import
+from utils.lexical_index import build_lexical_index
+from utils.metrics import EMBEDDING_CALLS, EMBEDDING_TEXTS
+from utils.search_tiers import write_full_vectors
+from utils.vector_store import load_faiss_store, write_and_swap_store
+
+langchain_docstore = lazy_import("langchain_community.docstore.in_memory")
+langchain_vectorstores = lazy_import("langchain_community.vectorstores")
+
+# Metadados da construção gravados no diretório do store
+BUILD_FILE = "build.json"
+
+# Ids removidos de um store ativo (ver utils.index_mutation)
+TOMBSTONES_FILE = "tombstones.json"
+
+# Tentativas por lote de embeddings antes de desistir
+EMBED_RETRIES = 4
+
+
+def load_markdown_documents(source_dir):
+    """
+    Load the Markdown files of a directory as one document per paragraph.
+
+    Paragraphs are separated by blank lines. Each document gets the file name
+    without extension as "source" and its 1-based position in the file as
+    "paragraph_number", which together form its stable id.
+
+    Args:
+        source_dir (str): Directory with .md files (searched recursively)
+
+    Returns:
+        list: Document objects, in file and paragraph order
+    """
+    from langchain_core.documents import Document
+
+    docs = []
+    for root, _, file_names in sorted(os.walk(source_dir)):
+        for file_name in sorted(file_names):
+            if not file_name.lower().endswith(".md"):
+                continue
+            with open(os.path.join(root, file_name), "r", encoding="utf-8") as f:
+                text = f.read()
+            source = os.path.splitext(file_name)[0]
+            paragraphs = [paragraph.strip() for paragraph in re.split(r"\n\s*\n", text) if paragraph.strip()]
+            for number, paragraph in enumerate(paragraphs, 1):
+                docs.append(Document(page_content=paragraph, metadata={"source": source, "paragraph_number": number}))
+    return docs
+
+
+def content_hash(text):
+    """
+    Hash a paragraph's content; unchanged paragraphs keep their vectors across builds.
+
+    Args:
+        text (str): Paragraph text
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def stable_document_id(doc):
+    """
+    Return the stable id of a document, used as its docstore id.
+
+    Args:
+        doc: Document object
+
+    Returns:
+        str: metadata["doc_id"], else "source#paragraph_number", else the content hash
+    """
+    metadata = doc.metadata
+    if metadata.get("doc_id"):
+        return str(metadata["doc_id"])
+    if metadata.get("source") and metadata.get("paragraph_number") is not None:
+        return f"{metadata['source']}#{metadata['paragraph_number']}"
+    return content_hash(doc.page_content)
+
+
+def assign_document_ids(docs):
+    """
+    Return one unique stable id per document, disambiguating repeats with a suffix.
+
+    Args:
+        docs (list): Document objects
+
+    Returns:
+        list: Document ids, in order
+    """
+    ids, seen = [], {}
+    for doc in docs:
+        doc_id = stable_document_id(doc)
+        if doc_id in seen:
+            seen[doc_id] += 1
+            doc_id = f"{doc_id}~{seen[doc_id]}"
+        else:
+            seen[doc_id] = 0
+        ids.append(doc_id)
+    return ids
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting requests and tokens per minute.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        """
+        Args:
+            requests_per_minute (float): Request budget per minute
+            tokens_per_minute (float): Token budget per minute
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        """
+        Block until one request of the given size fits in the budget.
+
+        Args:
+            tokens (int): Tokens the request will consume
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._updated
+                self._updated = now
+                self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+                self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60 / self.requests_per_minute,
+                    (tokens - self._tokens) * 60 / self.tokens_per_minute,
+                )
+            time.sleep(max(wait, 0.01))
+
+
+def default_rate_limiter():
+    """
+    Build a rate limiter from EMBED_REQUESTS_PER_MIN (default 3000) and
+    EMBED_TOKENS_PER_MIN (default 1000000).
+
+    Returns:
+        RateLimiter: New limiter
+    """
+    return RateLimiter(
+        float(os.getenv("EMBED_REQUESTS_PER_MIN", "3000")),
+        float(os.getenv("EMBED_TOKENS_PER_MIN", "1000000"))
+    )
+
+
+class VectorCheckpoint:
+    """
+    SQLite file of embedded paragraphs, keyed by content hash.
+
+    Every finished batch is committed, so an interrupted build resumes where it
+    stopped, and the file is kept after the build so the next incremental build
+    only embeds new or edited paragraphs.
+    """
+
+    def __init__(self, path, model):
+        """
+        Args:
+            path (str): SQLite file
+            model (str): Embedding model name; vectors of other models are ignored
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.model = model
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, hash))"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def known_hashes(self):
+        """Return the set of hashes already embedded with this model."""
+        with self._lock:
+            rows = self._db.execute("SELECT hash FROM vectors WHERE model = ?", (self.model,))
+            return {row[0] for row in rows}
+
+    def put_many(self, items):
+        """
+        Store (hash, vector) pairs in one transaction.
+
+        Args:
+            items (list): (hash, vector) pairs
+        """
+        rows = [(self.model, text_hash, np.asarray(vector, dtype=np.float32).tobytes()) for text_hash, vector in items]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO vectors (model, hash, vector) VALUES (?, ?, ?)", rows)
+            self._db.commit()
+
+    def get_many(self, hashes):
+        """
+        Read the vectors of the given hashes.
+
+        Args:
+            hashes (list): Content hashes
+
+        Returns:
+            dict: hash -> float32 vector
+        """
+        vectors = {}
+        hashes = list(hashes)
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT hash, vector FROM vectors WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model] + chunk
+                )
+                for text_hash, blob in rows:
+                    vectors[text_hash] = np.frombuffer(blob, dtype=np.float32)
+        return vectors
+
+    def close(self):
+        """Close the SQLite connection."""
+        with self._lock:
+            self._db.close()
+
+
+def checkpoint_path(index_dir, store_id):
+    """
+    Return the checkpoint file of a store.
+
+    Args:
+        index_dir (str): Directory containing vector stores
+        store_id (str): Vector store ID
+
+    Returns:
+        str: SQLite file path
+    """
+    return os.path.join(index_dir, ".build", f"{store_id}.sqlite")
+
+
+def seed_from_existing_store(checkpoint, index_path, embeddings):
+    """
+    Copy the vectors of an existing store into the checkpoint so its unchanged
+    paragraphs are not re-embedded.
+
+    Vectors are only reused when the store was built with the same embedding
+    model and its index keeps exact vectors (not IVF-PQ).
+
+    Args:
+        checkpoint (VectorCheckpoint): Build checkpoint
+        index_path (str): Existing store directory
+        embeddings: Embeddings object
+
+    Returns:
+        int: Number of vectors copied
+    """
+    if not os.path.exists(os.path.join(index_path, "index.faiss")):
+        return 0
+    build_file = os.path.join(index_path, BUILD_FILE)
+    if os.path.exists(build_file):
+        with open(build_file, "r", encoding="utf-8") as f:
+            if json.load(f).get("embedding_model") != checkpoint.model:
+                return 0
+    if (read_index_spec(index_path) or {}).get("type") == "ivf_pq":
+        return 0
+
+    vectorstore, _ = load_faiss_store(index_path, embeddings, mmap=True)
+    known = checkpoint.known_hashes()
+    vectors = store_vectors(vectorstore)
+    items = []
+    for position, docstore_id in vectorstore.index_to_docstore_id.items():
+        doc = vectorstore.docstore.search(docstore_id)
+        if not hasattr(doc, "page_content"):
+            continue
+        text_hash = content_hash(doc.page_content)
+        if text_hash not in known:
+            items.append((text_hash, vectors[position]))
+            known.add(text_hash)
+    if items:
+        checkpoint.put_many(items)
+    return len(items)
+
+
+def embed_missing(texts_by_hash, embeddings, checkpoint, batch_size, max_workers, limiter, on_batch=None):
+    """
+    Embed paragraphs missing from the checkpoint, concurrently and under the rate limit.
+
+    Args:
+        texts_by_hash (dict): hash -> text of the paragraphs to embed
+        embeddings: Embeddings object
+        checkpoint (VectorCheckpoint): Build checkpoint, updated after every batch
+        batch_size (int): Paragraphs per embedding request
+        max_workers (int): Concurrent embedding requests
+        limiter (RateLimiter): Request/token limiter
+        on_batch (callable, optional): Called with the number of paragraphs after each batch
+
+    Returns:
+        int: Number of paragraphs embedded
+    """
+    items = list(texts_by_hash.items())
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+    model = embedding_model_name(embeddings)
+
+    def embed_batch(batch):
+        texts = [text for _, text in batch]
+        # Estimativa de ~4 caracteres por token para o limitador
+        limiter.acquire(sum(len(text) for text in texts) // 4 + len(texts))
+        for attempt in range(EMBED_RETRIES):
+            try:
+                EMBEDDING_CALLS.inc(model=model, kind="documents")
+                vectors = embeddings.embed_documents(texts)
+                EMBEDDING_TEXTS.inc(len(texts), model=model, kind="documents")
+                break
+            except Exception:
+                if attempt == EMBED_RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
+        checkpoint.put_many([(text_hash, vector) for (text_hash, _), vector in zip(batch, vectors)])
+        return len(batch)
+
+    embedded = 0
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-embed") as executor:
+        for future in as_completed([executor.submit(embed_batch, batch) for batch in batches]):
+            done = future.result()
+            embedded += done
+            if on_batch is not None:
+                on_batch(done)
+    return embedded
+
+
+def build_store(store_id, docs, index_dir, embeddings=None, index_spec=None, batch_size=None,
+                max_workers=None, limiter=None, on_batch=None):
+    """
+    Build (or incrementally rebuild) one vector store.
+
+    Paragraphs are hashed; vectors of unchanged paragraphs come from the
+    checkpoint (seeded from the current store), only new or edited text is
+    embedded, and the finished store is written to a temporary directory and
+    swapped into place.
+
+    Args:
+        store_id (str): Vector store ID
+        docs (list): Document objects (one per paragraph)
+        index_dir (str): Directory containing vector stores
+        embeddings (optional): Embeddings object; the shared process-wide one if omitted
+        index_spec (dict, optional): Index type and parameters; index_spec_from_env() if omitted
+        batch_size (int, optional): Paragraphs per embedding request (BUILD_BATCH_SIZE, default 256)
+        max_workers (int, optional): Concurrent embedding requests (BUILD_MAX_WORKERS, default 4)
+        limiter (RateLimiter, optional): Shared rate limiter; built from EMBED_REQUESTS_PER_MIN
+            and EMBED_TOKENS_PER_MIN if omitted
+        on_batch (callable, optional): Progress callback receiving paragraphs per finished batch
+
+    Returns:
+        dict: store_id, documents, reused, embedded, seconds
+    """
+    if not docs:
+        raise ValueError(f"Nenhum documento para o vector store {store_id}")
+    start = time.perf_counter()
+    embeddings = embeddings or get_shared_embeddings()
+    index_spec = index_spec or index_spec_from_env()
+    batch_size = batch_size or int(os.getenv("BUILD_BATCH_SIZE", "256"))
+    max_workers = max_workers or int(os.getenv("BUILD_MAX_WORKERS", "4"))
+    limiter = limiter or default_rate_limiter()
+    index_path = os.path.join(index_dir, store_id)
+    model = embedding_model_name(embeddings)
+
+    checkpoint = VectorCheckpoint(checkpoint_path(index_dir, store_id), model)
+    try:
+        seed_from_existing_store(checkpoint, index_path, embeddings)
+
+        hashes = [content_hash(doc.page_content) for doc in docs]
+        known = checkpoint.known_hashes()
+        missing = {text_hash: doc.page_content for text_hash, doc in zip(hashes, docs) if text_hash not in known}
+        reused = sum(1 for text_hash in hashes if text_hash in known)
+        embedded = embed_missing(missing, embeddings, checkpoint, batch_size, max_workers, limiter, on_batch)
+
+        vectors_by_hash = checkpoint.get_many(set(hashes))
+    finally:
+        checkpoint.close()
+
+    vectors = np.vstack([vectors_by_hash[text_hash] for text_hash in hashes]).astype(np.float32)
+    doc_ids = assign_document_ids(docs)
+    annotate_token_counts(docs, os.getenv("MODEL_LLM", "gpt-4o"))
+
+    vectorstore = langchain_vectorstores.FAISS(
+        embeddings,
+        build_ann_index(vectors, index_spec),
+        langchain_docstore.InMemoryDocstore(dict(zip(doc_ids, docs))),
+        dict(enumerate(doc_ids))
+    )
+
+    def write(tmp_dir):
+        vectorstore.save_local(tmp_dir)
+        write_index_spec(tmp_dir, index_spec)
+        write_full_vectors(tmp_dir, vectors, index_spec)
+        build_lexical_index(vectorstore, tmp_dir)
+        with open(os.path.join(tmp_dir, BUILD_FILE), "w", encoding="utf-8") as f:
+            json.dump({"embedding_model": model, "documents": len(docs), "built_at": time.time()}, f)
+
+    # Importado aqui: utils.index_mutation importa este módulo
+    from utils.index_mutation import StoreWriteLock
+
+    # Grava tudo em um diretório temporário e troca os arquivos do store no final, sem
+    # concorrer com mutações, compactações ou --apply do mesmo store
+    with StoreWriteLock(index_path):
+        write_and_swap_store(index_path, write)
+        # O índice novo já reflete o texto-fonte: exclusões anteriores não valem mais
+        tombstones_file = os.path.join(index_path, TOMBSTONES_FILE)
+        if os.path.exists(tombstones_file):
+            os.remove(tombstones_file)
+
+    return {
+        "store_id": store_id,
+        "documents": len(docs),
+        "reused": reused,
+        "embedded": embedded,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _build_store_worker(store_id, docs, index_dir, index_spec):
+    """Process-pool entry point; each process creates its own embeddings client."""
+    return build_store(store_id, docs, index_dir, index_spec=index_spec)
+
+
+def build_stores(docs_by_store, index_dir, index_spec=None, max_processes=None):
+    """
+    Build several stores in parallel, one process per store.
+
+    The request/token limits apply per process, so divide EMBED_REQUESTS_PER_MIN
+    and EMBED_TOKENS_PER_MIN by the number of processes to stay under the API quota.
+
+    Args:
+        docs_by_store (dict): store_id -> list of Document objects
+        index_dir (str): Directory containing vector stores
+        index_spec (dict, optional): Index type and parameters for every store
+        max_processes (int, optional): Parallel builds (BUILD_MAX_PROCESSES, default 2)
+
+    Returns:
+        dict: store_id -> build stats, or the exception raised by that build
+    """
+    max_processes = max_processes or int(os.getenv("BUILD_MAX_PROCESSES", "2"))
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_processes) as executor:
+        futures = {
+            executor.submit(_build_store_worker, store_id, docs, index_dir, index_spec): store_id
+            for store_id, docs in docs_by_store.items()
+        }
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+    return results
+
+
+def main():
+    """Command-line entry point: build stores from directories of Markdown files."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Cria ou atualiza vector stores de forma incremental e retomável.")
+    parser.add_argument("--index-dir", default=os.getenv("PATH_INDEX"), help="Diretório dos índices (PATH_INDEX)")
+    parser.add_argument("--store", action="append", required=True, metavar="ID=DIR",
+                        help="ID do vector store e diretório com os arquivos Markdown (repetível)")
+    parser.add_argument("--processes", type=int, help="Stores construídos em paralelo")
+    args = parser.parse_args()
+
+    docs_by_store = {}
+    for item in args.store:
+        store_id, _, source_dir = item.partition("=")
+        docs_by_store[store_id] = load_markdown_documents(source_dir)
+
+    for store_id, result in build_stores(docs_by_store, args.index_dir, max_processes=args.processes).items():
+        if isinstance(result, Exception):
+            print(f"{store_id}: erro - {result}")
+        else:
+            print(f"{store_id}: {result['documents']} documentos, {result['reused']} reaproveitados, "
+                  f"{result['embedded']} novos embeddings em {result['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""
+Process-wide cache of loaded FAISS vector stores for the RAG application.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from utils.ann_index import SPEC_FILE
+from utils.lexical_index import LEXICAL_DIR, load_lexical_index
+from utils.profiling import stage
+from utils.search_tiers import VECTORS_FILE
+from utils.vector_store import index_mmap_enabled, load_faiss_store, recover_store_swap, stale_swap, swap_in_progress
+
+# Arquivos que compõem um vector store salvo com FAISS.save_local
+INDEX_FILES = ("index.faiss", "index.pkl")
+
+# Arquivos auxiliares trocados junto com o índice (o diretório do BM25 entra arquivo por arquivo)
+STORE_FILES = INDEX_FILES + (SPEC_FILE, VECTORS_FILE)
+
+
+def store_fingerprint(index_path):
+    """
+    Compute the on-disk fingerprint of a vector store directory.
+
+    Covers every file swapped in by replace_store_files (index, docstore,
+    index spec, full vectors and BM25 files), so a change to any of them is
+    a new version of the store.
+
+    Args:
+        index_path (str): Directory containing index.faiss and index.pkl
+
+    Returns:
+        tuple: ((file_name, mtime_ns, size), ...) or None if index.faiss is missing
+    """
+    lexical_dir = os.path.join(index_path, LEXICAL_DIR)
+    try:
+        lexical_files = sorted(os.path.join(LEXICAL_DIR, name) for name in os.listdir(lexical_dir))
+    except FileNotFoundError:
+        lexical_files = []
+    fingerprint = []
+    for file_name in STORE_FILES + tuple(lexical_files):
+        try:
+            stat = os.stat(os.path.join(index_path, file_name))
+        except FileNotFoundError:
+            if file_name == "index.faiss":
+                return None
+            continue
+        fingerprint.append((file_name, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+def fingerprint_size(fingerprint, mapped=False):
+    """
+    Estimate the private memory held by a loaded store from its on-disk file sizes.
+
+    Only index.faiss and index.pkl count; full vectors and BM25 postings are
+    memory-mapped.
+
+    Args:
+        fingerprint (tuple): Fingerprint returned by store_fingerprint
+        mapped (bool): index.faiss is memory-mapped and lives in the shared page cache
+
+    Returns:
+        int: Estimated size in bytes
+    """
+    return sum(
+        size for file_name, _, size in fingerprint or ()
+        if file_name in INDEX_FILES and not (mapped and file_name == "index.faiss")
+    )
+
+
+def _recover_stale_swap(index_path):
+    """Finish a store swap left by a failed or dead writer, unless another writer holds the store."""
+    # Importado aqui: utils.index_mutation depende de boa parte do pacote
+    from utils.index_mutation import StoreWriteLock
+
+    try:
+        with StoreWriteLock(index_path, timeout=1):
+            if stale_swap(index_path):
+                recover_store_swap(index_path)
+    except RuntimeError:
+        # Outro processo está escrevendo no store; ele conclui a troca pendente
+        pass
+
+
+def load_consistent(index_path, embeddings, attempts=5):
+    """
+    Load a store, retrying when its files are swapped while they are being read.
+
+    A store is replaced file by file (see replace_store_files), so a load is
+    only accepted when no swap was running at its start or end and the
+    fingerprint of every store file is unchanged across it; all files are
+    then guaranteed to come from the same version. A swap left unfinished by
+    a failed or dead writer is finished first (see recover_store_swap).
+
+    Args:
+        index_path (str): Store directory
+        embeddings: Embeddings object
+        attempts (int): Maximum number of loads
+
+    Returns:
+        tuple: (vectorstore, status, fingerprint)
+    """
+    for _ in range(attempts):
+        if swap_in_progress(index_path) and stale_swap(index_path):
+            _recover_stale_swap(index_path)
+        if not swap_in_progress(index_path):
+            before = store_fingerprint(index_path)
+            vectorstore, status = load_faiss_store(index_path, embeddings, mmap=index_mmap_enabled())
+            after = store_fingerprint(index_path)
+            if before == after and not swap_in_progress(index_path):
+                vectorstore.store_fingerprint = after
+                return vectorstore, status, after
+        time.sleep(0.05)
+    raise RuntimeError(f"O índice {index_path} mudou durante todas as {attempts} tentativas de carregamento")
+
+
+def load_store_lexical_index(vectorstore, index_path):
+    """
+    Return the BM25 index of the same on-disk version as a loaded store.
+
+    BM25 hits are FAISS positions, so they are only valid against the store
+    version they were built with. The lexical index is loaded once per loaded
+    store and only while the files on disk still match its fingerprint;
+    otherwise the store is about to be reloaded and None is returned.
+
+    Args:
+        vectorstore: Store returned by load_consistent
+        index_path (str): Store directory
+
+    Returns:
+        LexicalIndex: Lexical index of the store, or None
+    """
+    lexical_index = getattr(vectorstore, "lexical_index", None)
+    if lexical_index is not None:
+        return lexical_index
+    fingerprint = getattr(vectorstore, "store_fingerprint", None)
+    if swap_in_progress(index_path) or store_fingerprint(index_path) != fingerprint:
+        return None
+    lexical_index = load_lexical_index(index_path)
+    if lexical_index is None or swap_in_progress(index_path) or store_fingerprint(index_path) != fingerprint:
+        return None
+    vectorstore.lexical_index = lexical_index
+    return lexical_index
+
+
+class VectorStoreCache:
+    """
+    Thread-safe LRU cache of loaded vector stores bounded by a RAM budget.
+
+    Entries are keyed by store directory, so stores with the same id under
+    different index directories are cached separately, and validated against
+    the fingerprint (mtime/size) of the store files, so a store rebuilt on
+    disk is reloaded on its next access. Memory-mapped indexes are shared
+    through the OS page cache and only their docstore counts against the budget.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes (int): Memory budget for all cached stores, in bytes
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # store directory -> dict(vectorstore, fingerprint, size, mapped, store_id)
+        self._lock = threading.Lock()
+        self._store_locks = {}
+        self._stats = {"hits": 0, "misses": 0, "reloads": 0, "evictions": 0, "demotions": 0, "load_seconds": 0.0}
+        self._reload_listeners = []
+
+    @staticmethod
+    def _key(index_path):
+        """Return the cache key of a store directory."""
+        return os.path.normpath(os.path.abspath(index_path))
+
+    def _keys(self, store_id, index_path=None):
+        """Return the keys of a store, by directory or by id (caller holds self._lock)."""
+        if index_path is not None:
+            key = self._key(index_path)
+            return [key] if key in self._entries else []
+        return [key for key, entry in self._entries.items() if entry["store_id"] == store_id]
+
+    def _store_lock(self, key):
+        with self._lock:
+            return self._store_locks.setdefault(key, threading.Lock())
+
+    def _lookup(self, key, fingerprint):
+        """Return the cached store if it is still current (caller holds self._lock)."""
+        entry = self._entries.get(key)
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            self._entries.move_to_end(key)
+            return entry["vectorstore"]
+        return None
+
+    def get(self, store_id, index_path, embeddings):
+        """
+        Return the vector store for store_id, loading it from disk if needed.
+
+        Args:
+            store_id (str): Vector store ID
+            index_path (str): Directory containing the store files
+            embeddings: Embeddings object bound to the store on load
+
+        Returns:
+            FAISS: Loaded vector store
+        """
+        key = self._key(index_path)
+        fingerprint = store_fingerprint(index_path)
+        if fingerprint is None:
+            raise FileNotFoundError(f"Arquivo de índice não encontrado: {os.path.join(index_path, 'index.faiss')}")
+
+        with self._lock:
+            vectorstore = self._lookup(key, fingerprint)
+            if vectorstore is not None:
+                self._stats["hits"] += 1
+                return vectorstore
+
+        # Carregamentos do mesmo store são serializados; stores diferentes carregam em paralelo
+        with self._store_lock(key):
+            with self._lock:
+                vectorstore = self._lookup(key, fingerprint)
+                if vectorstore is not None:
+                    self._stats["hits"] += 1
+                    return vectorstore
+                stale = key in self._entries
+
+            start = time.perf_counter()
+            with stage("index_load"):
+                vectorstore, status, fingerprint = load_consistent(index_path, embeddings)
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self._stats["misses"] += 1
+                self._stats["load_seconds"] += elapsed
+                if stale:
+                    self._stats["reloads"] += 1
+                self._entries[key] = {
+                    "vectorstore": vectorstore,
+                    "fingerprint": fingerprint,
+                    "size": fingerprint_size(fingerprint, mapped=status == "mmap"),
+                    "mapped": status == "mmap",
+                    "store_id": store_id,
+                }
+                self._entries.move_to_end(key)
+                self._evict()
+
+            if stale:
+                for listener in list(self._reload_listeners):
+                    listener(store_id)
+            return vectorstore
+
+    def contains(self, index_path):
+        """
+        Tell whether a store directory is cached, without checking its files on disk.
+
+        Args:
+            index_path (str): Store directory
+
+        Returns:
+            bool: True if a version of the store is loaded
+        """
+        with self._lock:
+            return self._key(index_path) in self._entries
+
+    def add_reload_listener(self, listener):
+        """
+        Register a callback invoked with the store id whenever a store is reloaded
+        because its files changed on disk.
+
+        Args:
+            listener (callable): Function taking a store id
+        """
+        self._reload_listeners.append(listener)
+
+    def fingerprint(self, store_id, index_path=None):
+        """
+        Return the fingerprint of the cached version of a store.
+
+        Args:
+            store_id (str): Vector store ID
+            index_path (str, optional): Store directory; without it, every cached
+                store with this id is included
+
+        Returns:
+            tuple: Fingerprint of the loaded files (one per cached directory when
+                looked up by id), or None if the store is not cached
+        """
+        with self._lock:
+            keys = self._keys(store_id, index_path)
+            if not keys:
+                return None
+            if index_path is not None:
+                return self._entries[keys[0]]["fingerprint"]
+            return tuple(sorted((key, self._entries[key]["fingerprint"]) for key in keys))
+
+    def _evict(self):
+        """Evict least recently used stores until the budget is met (caller holds self._lock)."""
+        # O store mais recente é sempre mantido, mesmo que sozinho exceda o orçamento
+        while len(self._entries) > 1 and self.used_bytes() > self.max_bytes:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def demote(self, store_id, index_path=None):
+        """
+        Make a store the first candidate for eviction without dropping it.
+
+        Used when a user deselects a store: it stays available to other
+        sessions, but is the first to go when another load needs the memory.
+        Any later access makes it most recently used again.
+
+        Args:
+            store_id (str): Vector store ID
+            index_path (str, optional): Store directory; without it, every cached store with this id
+
+        Returns:
+            bool: True if the store was cached
+        """
+        with self._lock:
+            keys = self._keys(store_id, index_path)
+            for key in keys:
+                self._entries.move_to_end(key, last=False)
+                self._stats["demotions"] += 1
+            return bool(keys)
+
+    def used_bytes(self):
+        """Return the estimated memory held by cached stores, in bytes."""
+        return sum(entry["size"] for entry in self._entries.values())
+
+    def cached_store_ids(self):
+        """Return cached store ids from least to most recently used."""
+        with self._lock:
+            return [entry["store_id"] for entry in self._entries.values()]
+
+    def invalidate(self, store_id=None, index_path=None):
+        """
+        Drop one store (or every store when store_id is None) from the cache.
+
+        Args:
+            store_id (str, optional): Vector store ID to drop
+            index_path (str, optional): Store directory; without it, every cached store with this id
+        """
+        with self._lock:
+            if store_id is None and index_path is None:
+                self._entries.clear()
+            else:
+                for key in self._keys(store_id, index_path):
+                    del self._entries[key]
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: hits, misses, reloads, evictions, demotions, load_seconds, entries, used_bytes, max_bytes
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["used_bytes"] = self.used_bytes()
+            stats["max_bytes"] = self.max_bytes
+            return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_vectorstore_cache():
+    """
+    Return the process-wide vector store cache, shared by every Streamlit session.
+
+    The memory budget is read from INDEX_CACHE_MAX_MB (default 4096).
+
+    Returns:
+        VectorStoreCache: Shared cache instance
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                max_mb = int(os.getenv("INDEX_CACHE_MAX_MB", "4096"))
+                _cache = VectorStoreCache(max_mb * 1024 * 1024)
+    return _cache
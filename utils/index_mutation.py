@@ -0,0 +1,333 @@
+"""
+In-place add/update/delete of documents on live vector stores for the RAG application.
+
+Deletes are recorded as tombstones and filtered at search time; adds and
+replacements are written to a private copy of the store that is swapped into
+place, and a background compaction drops tombstoned vectors once they pass
+a threshold.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from utils.ann_index import read_index_spec, store_vectors, write_index_spec
+from utils.context_packer import annotate_token_counts
+from utils.embedding_cache import embedding_model_name
+from utils.index_builder import (
+    BUILD_FILE, TOMBSTONES_FILE, VectorCheckpoint, assign_document_ids, checkpoint_path, content_hash,
+    default_rate_limiter, embed_missing
+)
+from utils.lazy_imports import lazy_import
+from utils.lexical_index import build_lexical_index
+from utils.search_tiers import rescore_factor, write_full_vectors
+from utils.vector_store import load_faiss_store, pid_alive, write_and_swap_store
+
+faiss = lazy_import("faiss")
+
+# Arquivo de trava de escrita (uma mutação por store por vez, entre processos)
+WRITE_LOCK_FILE = ".write.lock"
+
+_tombstones = {}
+_tombstones_lock = threading.Lock()
+_compacting = set()
+_compacting_lock = threading.Lock()
+
+
+def load_tombstones(index_path):
+    """
+    Return the ids deleted from a store but still present in its index.
+
+    Args:
+        index_path (str): Store directory
+
+    Returns:
+        frozenset: Tombstoned docstore ids
+    """
+    tombstones_file = os.path.join(index_path, TOMBSTONES_FILE)
+    try:
+        mtime = os.stat(tombstones_file).st_mtime_ns
+    except FileNotFoundError:
+        return frozenset()
+    with _tombstones_lock:
+        cached = _tombstones.get(index_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(tombstones_file, "r", encoding="utf-8") as f:
+            ids = frozenset(json.load(f))
+        _tombstones[index_path] = (mtime, ids)
+        return ids
+
+
+def _write_tombstones(index_path, ids):
+    """Atomically replace a store's tombstone file."""
+    tombstones_file = os.path.join(index_path, TOMBSTONES_FILE)
+    if not ids:
+        if os.path.exists(tombstones_file):
+            os.remove(tombstones_file)
+        return
+    tmp_file = tombstones_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(sorted(ids), f, ensure_ascii=False)
+    os.replace(tmp_file, tombstones_file)
+
+
+class StoreWriteLock:
+    """
+    Exclusive write lock of a store, held through a lock file so that
+    mutations from different processes never interleave. A lock file left
+    by a process that died is taken over.
+    """
+
+    def __init__(self, index_path, timeout=600):
+        """
+        Args:
+            index_path (str): Store directory
+            timeout (float): Seconds to wait for a running mutation to finish
+        """
+        self.lock_file = os.path.join(index_path, WRITE_LOCK_FILE)
+        self.timeout = timeout
+
+    def __enter__(self):
+        # Um store novo ainda não tem diretório
+        os.makedirs(os.path.dirname(self.lock_file), exist_ok=True)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                if self._holder_died():
+                    # Trava deixada por um processo encerrado no meio de uma escrita
+                    try:
+                        os.remove(self.lock_file)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                if time.monotonic() > deadline:
+                    raise RuntimeError(
+                        f"Outra alteração está em andamento neste store; remova {self.lock_file} "
+                        "se nenhum processo estiver alterando o índice"
+                    )
+                time.sleep(0.1)
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        os.remove(self.lock_file)
+
+    def _holder_died(self):
+        """True if the lock file names a process that is no longer running."""
+        try:
+            with open(self.lock_file, "r", encoding="utf-8") as f:
+                text = f.read().strip()
+        except FileNotFoundError:
+            return False
+        # Arquivo recém-criado, ainda sem PID: o dono está vivo
+        return text.isdigit() and not pid_alive(int(text))
+
+
+def _remove_documents(vectorstore, doc_ids):
+    """
+    Remove documents and their vectors from a private (read/write) copy of a store.
+
+    The index is cloned empty, which keeps its type, trained quantizers and
+    search parameters, and refilled with the remaining vectors in order, so
+    positions stay contiguous for every index type (HNSW has no remove_ids,
+    and IVF keeps the removed ids as gaps).
+    """
+    doc_ids = set(doc_ids) & set(vectorstore.index_to_docstore_id.values())
+    if not doc_ids:
+        return
+    vectors = store_vectors(vectorstore)
+    kept = [(position, doc_id) for position, doc_id in sorted(vectorstore.index_to_docstore_id.items())
+            if doc_id not in doc_ids]
+    index = faiss.clone_index(vectorstore.index)
+    index.reset()
+    if kept:
+        index.add(np.ascontiguousarray(vectors[[position for position, _ in kept]]))
+    vectorstore.index = index
+    vectorstore.index_to_docstore_id = {i: doc_id for i, (_, doc_id) in enumerate(kept)}
+    if getattr(vectorstore, "full_vectors", None) is not None:
+        vectorstore.full_vectors = vectors[[position for position, _ in kept]]
+    vectorstore.docstore.delete(list(doc_ids))
+
+
+def _save_and_swap(vectorstore, index_path, index_spec):
+    """Write a mutated store next to the live one and swap its files into place (caller holds the write lock)."""
+    def write(tmp_dir):
+        vectorstore.save_local(tmp_dir)
+        if index_spec:
+            write_index_spec(tmp_dir, index_spec)
+        if rescore_factor(index_spec):
+            write_full_vectors(tmp_dir, store_vectors(vectorstore), index_spec)
+        build_lexical_index(vectorstore, tmp_dir)
+        build_file = os.path.join(index_path, BUILD_FILE)
+        if os.path.exists(build_file):
+            shutil.copy2(build_file, os.path.join(tmp_dir, BUILD_FILE))
+
+    write_and_swap_store(index_path, write)
+
+
+def upsert_documents(index_dir, store_id, docs, embeddings, replace=True):
+    """
+    Add documents to a live store, replacing those that already exist with the same stable id.
+
+    Args:
+        index_dir (str): Directory containing vector stores
+        store_id (str): Vector store ID
+        docs (list): Document objects; ids come from metadata (doc_id or source#paragraph_number)
+        embeddings: Embeddings object
+        replace (bool): Replace existing documents; when False an existing id raises ValueError
+
+    Returns:
+        dict: added, replaced
+    """
+    index_path = os.path.join(index_dir, store_id)
+    doc_ids = assign_document_ids(docs)
+
+    with StoreWriteLock(index_path):
+        vectorstore, _ = load_faiss_store(index_path, embeddings, mmap=False)
+        index_spec = read_index_spec(index_path)
+        existing = set(doc_ids) & set(vectorstore.index_to_docstore_id.values())
+        if existing and not replace:
+            raise ValueError(f"Documentos já existem no store {store_id}: {', '.join(sorted(existing)[:5])}")
+
+        # Embeddings reaproveitam o checkpoint da construção (parágrafos já vistos não são reenviados)
+        checkpoint = VectorCheckpoint(checkpoint_path(index_dir, store_id), embedding_model_name(embeddings))
+        try:
+            hashes = [content_hash(doc.page_content) for doc in docs]
+            known = checkpoint.known_hashes()
+            missing = {h: doc.page_content for h, doc in zip(hashes, docs) if h not in known}
+            embed_missing(missing, embeddings, checkpoint, int(os.getenv("BUILD_BATCH_SIZE", "256")),
+                          int(os.getenv("BUILD_MAX_WORKERS", "4")), default_rate_limiter())
+            vectors_by_hash = checkpoint.get_many(set(hashes))
+        finally:
+            checkpoint.close()
+
+        _remove_documents(vectorstore, existing)
+        annotate_token_counts(docs, os.getenv("MODEL_LLM", "gpt-4o"))
+        vectors = np.vstack([vectors_by_hash[h] for h in hashes]).astype(np.float32)
+        vectorstore.add_embeddings(
+            list(zip([doc.page_content for doc in docs], vectors.tolist())),
+            metadatas=[doc.metadata for doc in docs],
+            ids=doc_ids
+        )
+        if getattr(vectorstore, "full_vectors", None) is not None:
+            vectorstore.full_vectors = np.vstack([vectorstore.full_vectors, vectors])
+        _save_and_swap(vectorstore, index_path, index_spec)
+
+        # Ids readicionados deixam de estar removidos
+        tombstones = load_tombstones(index_path)
+        if tombstones & set(doc_ids):
+            _write_tombstones(index_path, tombstones - set(doc_ids))
+
+    return {"added": len(doc_ids) - len(existing), "replaced": len(existing)}
+
+
+def delete_documents(index_dir, store_id, doc_ids, embeddings=None):
+    """
+    Delete documents by stable id.
+
+    The ids are tombstoned immediately (searches stop returning them at once);
+    when tombstones exceed COMPACTION_THRESHOLD (default 0.1) of the store and
+    embeddings are given, a background compaction is scheduled.
+
+    Args:
+        index_dir (str): Directory containing vector stores
+        store_id (str): Vector store ID
+        doc_ids (list): Stable ids to delete
+        embeddings (optional): Embeddings object, required for automatic compaction
+
+    Returns:
+        int: Number of tombstoned ids
+    """
+    index_path = os.path.join(index_dir, store_id)
+    with StoreWriteLock(index_path):
+        tombstones = load_tombstones(index_path) | set(doc_ids)
+        _write_tombstones(index_path, tombstones)
+
+    if embeddings is not None and tombstone_ratio(index_dir, store_id, embeddings) > float(os.getenv("COMPACTION_THRESHOLD", "0.1")):
+        schedule_compaction(index_dir, store_id, embeddings)
+    return len(tombstones)
+
+
+def tombstone_ratio(index_dir, store_id, embeddings):
+    """
+    Return the fraction of a store's vectors that are tombstoned.
+
+    Args:
+        index_dir (str): Directory containing vector stores
+        store_id (str): Vector store ID
+        embeddings: Embeddings object
+
+    Returns:
+        float: Tombstoned / total vectors
+    """
+    from utils.index_cache import get_vectorstore_cache
+
+    index_path = os.path.join(index_dir, store_id)
+    tombstones = load_tombstones(index_path)
+    if not tombstones:
+        return 0.0
+    vectorstore = get_vectorstore_cache().get(store_id, index_path, embeddings)
+    return len(tombstones) / max(vectorstore.index.ntotal, 1)
+
+
+def compact_store(index_dir, store_id, embeddings):
+    """
+    Rewrite a store without its tombstoned documents and swap it into place.
+
+    Args:
+        index_dir (str): Directory containing vector stores
+        store_id (str): Vector store ID
+        embeddings: Embeddings object
+
+    Returns:
+        int: Number of documents removed
+    """
+    index_path = os.path.join(index_dir, store_id)
+    with StoreWriteLock(index_path):
+        tombstones = load_tombstones(index_path)
+        if not tombstones:
+            return 0
+        vectorstore, _ = load_faiss_store(index_path, embeddings, mmap=False)
+        index_spec = read_index_spec(index_path)
+        _remove_documents(vectorstore, tombstones)
+        _save_and_swap(vectorstore, index_path, index_spec)
+        _write_tombstones(index_path, load_tombstones(index_path) - tombstones)
+    return len(tombstones)
+
+
+def schedule_compaction(index_dir, store_id, embeddings):
+    """
+    Compact a store in a background thread (at most one compaction per store at a time).
+
+    Args:
+        index_dir (str): Directory containing vector stores
+        store_id (str): Vector store ID
+        embeddings: Embeddings object
+
+    Returns:
+        threading.Thread: The compaction thread, or None if one is already running
+    """
+    key = os.path.join(index_dir, store_id)
+    with _compacting_lock:
+        if key in _compacting:
+            return None
+        _compacting.add(key)
+
+    def run():
+        try:
+            compact_store(index_dir, store_id, embeddings)
+        finally:
+            with _compacting_lock:
+                _compacting.discard(key)
+
+    thread = threading.Thread(target=run, name=f"rag-compact-{store_id}", daemon=True)
+    thread.start()
+    return thread
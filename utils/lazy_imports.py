@@ -0,0 +1,100 @@
+"""
+Deferred imports of heavy dependencies for the RAG application.
+
+FAISS, langchain_community and the LLM SDKs take seconds to import. Modules on
+the app's import path bind them with lazy_import(), so a process starts
+without them and imports each one on first use (or in the background warm-up
+of utils.warmup). Set LAZY_IMPORTS=0 to import everything eagerly.
+"""
+import importlib
+import os
+import threading
+
+_lock = threading.Lock()
+
+
+def lazy_imports_enabled():
+    """
+    Tell whether heavy imports are deferred (LAZY_IMPORTS, default on).
+
+    Returns:
+        bool: True if imports are deferred
+    """
+    return os.getenv("LAZY_IMPORTS", "1").lower() not in ("0", "false", "no", "")
+
+
+class LazyModule:
+    """
+    Stand-in for a module that imports it on first attribute access.
+    """
+
+    def __init__(self, name):
+        """
+        Args:
+            name (str): Dotted module name
+        """
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Import the module now (once; later calls return it).
+
+        Returns:
+            module: The imported module
+        """
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self):
+        """True once the module has been imported."""
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+_registry = {}
+
+
+def lazy_import(name):
+    """
+    Return a module that is imported on first use.
+
+    With LAZY_IMPORTS=0 the module is imported immediately and returned as is.
+
+    Args:
+        name (str): Dotted module name
+
+    Returns:
+        LazyModule or module: Deferred module (shared per name)
+    """
+    if not lazy_imports_enabled():
+        return importlib.import_module(name)
+    with _lock:
+        module = _registry.get(name)
+        if module is None:
+            module = _registry[name] = LazyModule(name)
+    return module
+
+
+def load_deferred_modules():
+    """
+    Import every module registered with lazy_import().
+
+    Returns:
+        list: Names of the modules imported by this call
+    """
+    pending = [module for module in list(_registry.values()) if not module.loaded]
+    for module in pending:
+        module.load()
+    return [module._name for module in pending]
@@ -0,0 +1,320 @@
+"""
+On-disk BM25 inverted index stored next to each FAISS store for the RAG application.
+
+Usage:
+    python -m utils.lexical_index --store <VECTOR_STORE_ID> [--store <VECTOR_STORE_ID> ...]
+"""
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# Subdiretório do store com o índice léxico
+LEXICAL_DIR = "bm25"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Stopwords do português já sem acentos (comparadas após fold_accents)
+PORTUGUESE_STOPWORDS = frozenset("""
+a ao aos as ate com como da das de dela dele deles do dos e ela elas ele eles em entre era
+essa essas esse esses esta estas este estes eu foi for ha isso isto ja la lhe lhes mais mas
+me mesmo meu minha muito na nao nas nem no nos nossa nosso num numa o os ou para pela pelas
+pelo pelos por qual quando que quem se sem ser seu seus sua suas so tambem te tem ter um uma
+umas uns voce voces
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def fold_accents(text):
+    """
+    Lowercase a text and strip diacritics ("Proéxis" -> "proexis").
+
+    Args:
+        text (str): Text to fold
+
+    Returns:
+        str: Folded text
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def normalize_plural(token):
+    """
+    Reduce common Portuguese plural endings to the singular form.
+
+    Args:
+        token (str): Folded token
+
+    Returns:
+        str: Normalized token
+    """
+    if len(token) <= 3:
+        return token
+    if token.endswith(("oes", "aes")):
+        return token[:-3] + "ao"
+    if token.endswith("ais"):
+        return token[:-3] + "al"
+    if token.endswith("eis"):
+        return token[:-3] + "el"
+    if token.endswith("ns"):
+        return token[:-2] + "m"
+    if token.endswith("s") and not token.endswith(("ss", "is", "us")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """
+    Tokenize Portuguese text for BM25: accent folding, stopword removal and plural normalization.
+
+    Hyphenated compounds ("auto-organização") yield their parts and the joined form.
+
+    Args:
+        text (str): Text to tokenize
+
+    Returns:
+        list: Tokens
+    """
+    folded = fold_accents(text)
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)*", folded):
+        parts = _TOKEN.findall(word)
+        if len(parts) > 1:
+            parts.append("".join(parts))
+        for part in parts:
+            if len(part) > 1 and part not in PORTUGUESE_STOPWORDS:
+                tokens.append(normalize_plural(part))
+    return tokens
+
+
+def lexical_index_path(index_path):
+    """
+    Return the directory of a store's lexical index.
+
+    Args:
+        index_path (str): Store directory
+
+    Returns:
+        str: Lexical index directory
+    """
+    return os.path.join(index_path, LEXICAL_DIR)
+
+
+def lexical_index_exists(index_path):
+    """
+    Tell whether a store has a lexical index.
+
+    Args:
+        index_path (str): Store directory
+
+    Returns:
+        bool: True if the lexical index was built
+    """
+    return os.path.exists(os.path.join(lexical_index_path(index_path), "meta.json"))
+
+
+def build_lexical_index(vectorstore, index_path):
+    """
+    Build the BM25 index of a store and save it next to its FAISS files.
+
+    Documents are indexed by their FAISS position, so lexical and vector hits
+    share the same local ids. Postings are stored as flat uint32/uint16 arrays
+    that are memory-mapped at query time.
+
+    Args:
+        vectorstore: FAISS vector store
+        index_path (str): Store directory
+
+    Returns:
+        dict: Index metadata (n_docs, n_terms, avgdl, k1, b)
+    """
+    doc_ids = defaultdict(lambda: array("I"))
+    term_freqs = defaultdict(lambda: array("H"))
+    doc_lengths = array("I")
+
+    for position in range(vectorstore.index.ntotal):
+        docstore_id = vectorstore.index_to_docstore_id.get(position)
+        doc = vectorstore.docstore.search(docstore_id) if docstore_id is not None else None
+        tokens = tokenize(doc.page_content) if hasattr(doc, "page_content") else []
+        doc_lengths.append(len(tokens))
+        for term, freq in Counter(tokens).items():
+            doc_ids[term].append(position)
+            term_freqs[term].append(min(freq, 65535))
+
+    vocabulary, offset = {}, 0
+    postings = array("I")
+    frequencies = array("H")
+    for term in sorted(doc_ids):
+        vocabulary[term] = [offset, len(doc_ids[term])]
+        postings.extend(doc_ids[term])
+        frequencies.extend(term_freqs[term])
+        offset += len(doc_ids[term])
+
+    n_docs = len(doc_lengths)
+    meta = {
+        "n_docs": n_docs,
+        "n_terms": len(vocabulary),
+        "avgdl": (sum(doc_lengths) / n_docs) if n_docs else 0.0,
+        "k1": BM25_K1,
+        "b": BM25_B,
+    }
+
+    # Escreve em um diretório temporário e troca de uma vez
+    target = lexical_index_path(index_path)
+    tmp = target + ".tmp"
+    os.makedirs(tmp, exist_ok=True)
+    np.save(os.path.join(tmp, "postings.npy"), np.frombuffer(postings, dtype=np.uint32))
+    np.save(os.path.join(tmp, "tfs.npy"), np.frombuffer(frequencies, dtype=np.uint16))
+    np.save(os.path.join(tmp, "doclen.npy"), np.frombuffer(doc_lengths, dtype=np.uint32))
+    with open(os.path.join(tmp, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, ensure_ascii=False)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    if os.path.exists(target):
+        old = target + ".old"
+        os.replace(target, old)
+        os.replace(tmp, target)
+        for file_name in os.listdir(old):
+            os.remove(os.path.join(old, file_name))
+        os.rmdir(old)
+    else:
+        os.replace(tmp, target)
+    return meta
+
+
+class LexicalIndex:
+    """
+    Memory-mapped BM25 index of one store.
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): Lexical index directory
+        """
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(directory, "vocab.json"), "r", encoding="utf-8") as f:
+            self.vocabulary = json.load(f)
+        self.postings = np.load(os.path.join(directory, "postings.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(directory, "tfs.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(directory, "doclen.npy"), mmap_mode="r")
+
+    def search(self, query, k):
+        """
+        Score documents with BM25.
+
+        Args:
+            query (str): Query text
+            k (int): Number of hits to return
+
+        Returns:
+            list: (score, local_id) tuples, best first
+        """
+        n_docs = self.meta["n_docs"]
+        if n_docs == 0:
+            return []
+        k1, b, avgdl = self.meta["k1"], self.meta["b"], self.meta["avgdl"] or 1.0
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            entry = self.vocabulary.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            docs = self.postings[offset:offset + df]
+            tf = self.tfs[offset:offset + df].astype(np.float32)
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = k1 * (1.0 - b + b * self.doc_lengths[docs] / avgdl)
+            scores[docs] += idf * tf * (k1 + 1.0) / (tf + norm)
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(float(scores[i]), int(i)) for i in candidates]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def load_lexical_index(index_path):
+    """
+    Return the lexical index of a store, reloading it when it was rebuilt.
+
+    Args:
+        index_path (str): Store directory
+
+    Returns:
+        LexicalIndex: Loaded index, or None if the store has none
+    """
+    directory = lexical_index_path(index_path)
+    try:
+        mtime = os.stat(os.path.join(directory, "meta.json")).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _indexes_lock:
+        cached = _indexes.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        index = LexicalIndex(directory)
+        _indexes[directory] = (mtime, index)
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=60):
+    """
+    Fuse several rankings with reciprocal rank fusion.
+
+    Args:
+        rankings (list): Rankings, each a list of hashable keys, best first
+        k (int): Number of fused keys to return
+        rrf_k (int): RRF damping constant
+
+    Returns:
+        list: (key, fused_score) tuples, best first
+    """
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] += 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def main():
+    """Command-line entry point: build the lexical index of one or more stores."""
+    from dotenv import load_dotenv
+    from utils.clients import get_shared_embeddings
+    from utils.index_mutation import StoreWriteLock
+    from utils.vector_store import load_faiss_store, write_and_swap_store
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Cria o índice léxico (BM25) ao lado de cada store FAISS.")
+    parser.add_argument("--index-dir", default=os.getenv("PATH_INDEX"), help="Diretório dos índices (PATH_INDEX)")
+    parser.add_argument("--store", action="append", required=True, help="ID do vector store (repetível)")
+    args = parser.parse_args()
+
+    embeddings = get_shared_embeddings()
+    for store_id in args.store:
+        index_path = os.path.join(args.index_dir, store_id)
+        # bm25/ é trocado como os demais arquivos do store, sem concorrer com outras escritas
+        with StoreWriteLock(index_path):
+            vectorstore, _ = load_faiss_store(index_path, embeddings, mmap=True)
+            meta = write_and_swap_store(index_path, lambda tmp_dir: build_lexical_index(vectorstore, tmp_dir))
+        print(f"{store_id}: {meta['n_docs']} documentos, {meta['n_terms']} termos")
+
+
+if __name__ == "__main__":
+    main()
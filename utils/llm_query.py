@@ -1,9 +1,12 @@
 """
 LLM query handling for the RAG application.
 """
-from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQA
 import os
+from utils.lazy_imports import lazy_import
+
+# SDKs pesados importados no primeiro uso
+langchain_openai = lazy_import("langchain_openai")
+langchain_chains = lazy_import("langchain.chains")
 
 def initialize_llm(model_name="gpt-4.1-nano-2025-04-14", temperature=0):
     """
@@ -16,7 +19,16 @@ def initialize_llm(model_name="gpt-4.1-nano-2025-04-14", temperature=0):
     Returns:
         ChatOpenAI: LLM object
     """
-    return ChatOpenAI(model_name=model_name, temperature=temperature, openai_api_key=os.getenv("OPENAI_API_KEY"))
+    from utils.http_pool import get_async_http_client, get_http_client
+
+    # Conexões keep-alive compartilhadas por todos os clientes do mesmo modelo
+    return langchain_openai.ChatOpenAI(
+        model_name=model_name,
+        temperature=temperature,
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=get_http_client("openai", model_name),
+        http_async_client=get_async_http_client("openai", model_name),
+    )
 
 def query_llm(query, vectorstore, llm, top_k=30):
     """
@@ -36,7 +48,7 @@ def query_llm(query, vectorstore, llm, top_k=30):
     results = vectorstore.similarity_search_with_score(query, k=top_k)
     
     # Query LLM
-    qa = RetrievalQA.from_chain_type(
+    qa = langchain_chains.RetrievalQA.from_chain_type(
         llm=llm,
         retriever=vectorstore.as_retriever(search_kwargs={"k": top_k}),
         return_source_documents=True
@@ -0,0 +1,306 @@
+"""
+Process-wide counters and latency histograms with a Prometheus text exporter for the RAG application.
+
+Stage timings from utils.profiling are recorded automatically; the search
+and answer paths add per-store search times, errors, embedding calls and
+LLM tokens. Cache counters and HTTP pool connections are read at scrape time.
+"""
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.profiling import add_stage_listener
+
+# Limites (em segundos) dos histogramas de latência
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger(__name__)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Counter:
+    """
+    Monotonic counter with labels.
+    """
+
+    def __init__(self, name, documentation):
+        """
+        Args:
+            name (str): Metric name
+            documentation (str): HELP text
+        """
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        """
+        Increase the counter.
+
+        Args:
+            amount (float): Increment
+            **labels: Label values
+        """
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        """Return the metric in Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, with labels.
+    """
+
+    def dec(self, amount=1.0, **labels):
+        """
+        Decrease the gauge.
+
+        Args:
+            amount (float): Decrement
+            **labels: Label values
+        """
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        """
+        Set the gauge.
+
+        Args:
+            value (float): New value
+            **labels: Label values
+        """
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def render(self):
+        """Return the metric in Prometheus text format."""
+        return super().render().replace(f"# TYPE {self.name} counter", f"# TYPE {self.name} gauge", 1)
+
+
+class Histogram:
+    """
+    Cumulative histogram with labels.
+    """
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            name (str): Metric name
+            documentation (str): HELP text
+            buckets (tuple): Upper bounds, in increasing order
+        """
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Record one observation.
+
+        Args:
+            value (float): Observed value
+            **labels: Label values
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        """Return the metric in Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(series['sum'])}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Duration of each stage of the search and answer path")
+STORE_SEARCH_SECONDS = Histogram("rag_store_search_seconds", "Search time per vector store, including a cold load")
+STORE_ERRORS = Counter("rag_store_errors_total", "Failed or timed-out store searches by store and error kind")
+SEARCHES = Counter("rag_searches_total", "Searches by mode")
+EMBEDDING_CALLS = Counter("rag_embedding_calls_total", "Calls to the embedding provider by model and kind (query, documents)")
+EMBEDDING_TEXTS = Counter("rag_embedding_texts_total", "Texts sent to the embedding provider by model and kind")
+LLM_SECONDS = Histogram("rag_llm_seconds", "LLM generation time by model")
+LLM_TTFT_SECONDS = Histogram("rag_llm_ttft_seconds", "Time to the first LLM token by model")
+LLM_TOKENS = Counter("rag_llm_tokens_total", "LLM tokens by model and kind (prompt, completion)")
+ANSWERS = Counter("rag_answers_total", "Answers by model and source (llm, cache, error)")
+HTTP_REQUESTS = Counter("rag_http_requests_total", "Requests sent through each shared provider HTTP pool")
+HTTP_CONNECTIONS_OPENED = Counter("rag_http_connections_opened_total", "New connections opened by each shared HTTP pool")
+HTTP_IN_FLIGHT = Gauge("rag_http_in_flight_requests", "Requests in flight on each shared HTTP pool")
+WARMUP_READY = Gauge("rag_warmup_ready", "1 once the background warm-up of the process succeeded")
+
+METRICS = (
+    STAGE_SECONDS, STORE_SEARCH_SECONDS, STORE_ERRORS, SEARCHES, EMBEDDING_CALLS, EMBEDDING_TEXTS,
+    LLM_SECONDS, LLM_TTFT_SECONDS, LLM_TOKENS, ANSWERS, HTTP_REQUESTS, HTTP_CONNECTIONS_OPENED, HTTP_IN_FLIGHT,
+    WARMUP_READY,
+)
+
+add_stage_listener(lambda name, seconds: STAGE_SECONDS.observe(seconds, stage=name))
+
+
+def record_store_search(outcome):
+    """
+    Record the result of one store search.
+
+    Args:
+        outcome (TaskOutcome): Outcome yielded by utils.fanout.fan_out
+    """
+    STORE_SEARCH_SECONDS.observe(outcome.elapsed, store=outcome.key)
+    if outcome.error is not None:
+        kind = "timeout" if isinstance(outcome.error, TimeoutError) else type(outcome.error).__name__
+        STORE_ERRORS.inc(store=outcome.key, kind=kind)
+
+
+def _cache_gauges():
+    """Render the counters of the shared caches as gauges."""
+    from utils.answer_cache import get_answer_cache
+    from utils.embedding_cache import get_embedding_cache
+    from utils.index_cache import get_vectorstore_cache
+
+    caches = (
+        ("index", get_vectorstore_cache().stats()),
+        ("embedding", get_embedding_cache().stats()),
+        ("answer", get_answer_cache().stats()),
+    )
+    lines = ["# HELP rag_cache Counters of the shared caches (hits, misses, entries, bytes)", "# TYPE rag_cache gauge"]
+    for cache, stats in caches:
+        for field, value in sorted(stats.items()):
+            if isinstance(value, (int, float)):
+                lines.append(f'rag_cache{{cache="{cache}",field="{field}"}} {_format_value(value)}')
+    return "\n".join(lines)
+
+
+def _http_pool_gauges():
+    """Render the open and idle connections of the shared HTTP pools as gauges."""
+    from utils.http_pool import pool_stats
+
+    lines = ["# HELP rag_http_pool_connections Connections held by each shared HTTP pool (open, idle)",
+             "# TYPE rag_http_pool_connections gauge"]
+    for pool, stats in sorted(pool_stats().items()):
+        for state, value in sorted(stats.items()):
+            lines.append(f"rag_http_pool_connections{_format_labels((('pool', pool), ('state', state)))} {_format_value(value)}")
+    return "\n".join(lines)
+
+
+def render_metrics():
+    """
+    Return every metric in Prometheus text exposition format.
+
+    Returns:
+        str: Exposition text
+    """
+    parts = [metric.render() for metric in METRICS]
+    try:
+        parts.append(_cache_gauges())
+    except Exception as e:
+        logger.warning("Falha ao coletar métricas dos caches: %s", e)
+    try:
+        parts.append(_http_pool_gauges())
+    except Exception as e:
+        logger.warning("Falha ao coletar métricas dos pools HTTP: %s", e)
+    return "\n".join(parts) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            status, content_type, body = 200, "text/plain; version=0.0.4; charset=utf-8", render_metrics()
+        elif path == "/ready":
+            # Prontidão do processo (aquecimento concluído), para balanceadores e autoscaling
+            from utils.warmup import is_ready, warmup_status
+
+            status, content_type = (200 if is_ready() else 503), "application/json"
+            body = json.dumps(warmup_status())
+        else:
+            self.send_error(404)
+            return
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_failed = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host=None):
+    """
+    Serve /metrics from a background thread (once per process).
+
+    The address comes from METRICS_HOST (default 127.0.0.1) and METRICS_PORT
+    (default 9464; 0 disables the exporter). A port already in use is logged
+    and ignored, so several app processes can run side by side.
+
+    Args:
+        port (int, optional): Port to listen on
+        host (str, optional): Interface to bind
+
+    Returns:
+        ThreadingHTTPServer: The running server, or None if disabled or unavailable
+    """
+    global _server, _server_failed
+    port = int(os.getenv("METRICS_PORT", "9464")) if port is None else port
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None and not _server_failed:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                _server_failed = True
+                logger.warning("Exportador de métricas não iniciado em %s:%s: %s", host, port, e)
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="rag-metrics", daemon=True).start()
+    return _server
@@ -0,0 +1,95 @@
+"""
+Per-stage latency instrumentation of the search and answer path for the RAG application.
+
+Code on the query path wraps each stage in `stage(name)`; listeners (the
+benchmark suite, metrics exporters) receive every (name, seconds) pair.
+Without listeners a stage only costs two clock reads.
+
+Stages: index_load, embed_query, ann_search, lexical_search, merge, group,
+pack_context, llm.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+def add_stage_listener(listener):
+    """
+    Register a callback invoked with (stage name, seconds) whenever a stage ends.
+
+    Stages may end in worker threads, so listeners must be thread-safe.
+
+    Args:
+        listener (callable): Function taking a stage name and a duration
+    """
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def remove_stage_listener(listener):
+    """
+    Unregister a stage listener.
+
+    Args:
+        listener (callable): Previously registered listener
+    """
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block of the query path and report it to the stage listeners.
+
+    Args:
+        name (str): Stage name
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _listeners:
+            elapsed = time.perf_counter() - start
+            for listener in list(_listeners):
+                listener(name, elapsed)
+
+
+class StageRecorder:
+    """
+    Stage listener that accumulates durations while active.
+
+    Use as a context manager around one query; `totals()` then returns the
+    time spent per stage. Stages that run once per store (index_load,
+    ann_search, lexical_search) are summed over stores.
+    """
+
+    def __init__(self):
+        self._totals = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def __call__(self, name, seconds):
+        with self._lock:
+            self._totals[name] += seconds
+
+    def __enter__(self):
+        add_stage_listener(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        remove_stage_listener(self)
+
+    def totals(self):
+        """
+        Return the accumulated time per stage.
+
+        Returns:
+            dict: Stage name -> seconds
+        """
+        with self._lock:
+            return dict(self._totals)
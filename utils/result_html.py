@@ -0,0 +1,137 @@
+"""
+Pre-rendered HTML for search results, for the RAG application.
+
+Each page of results becomes one HTML string (one Streamlit element) styled
+by the shared classes in RESULTS_CSS, instead of a container, an expander
+and several markdown elements per result. Sources are native <details>
+blocks, so expanding one happens in the browser without a rerun.
+"""
+import html
+from functools import lru_cache
+
+from markdown_it import MarkdownIt
+
+# Markdown dos trechos sem HTML embutido (equivale a unsafe_allow_html=False)
+_markdown = MarkdownIt("commonmark", {"html": False})
+
+RESULTS_CSS = """
+<style>
+.rag-source {
+    margin-bottom: 1rem;
+    border: 1px solid var(--glass-border);
+    border-radius: var(--radius-md);
+    background-color: var(--glass-bg);
+}
+.rag-source > summary {
+    cursor: pointer;
+    font-weight: 600;
+    color: var(--color-secondary);
+    padding: 0.75rem 1rem;
+}
+.rag-source > summary p {
+    display: inline;
+    margin: 0;
+}
+.rag-source-body {
+    padding: 0 1rem 0.5rem 1rem;
+}
+.rag-doc {
+    background-color: rgba(255, 255, 255, 0.5);
+    border-radius: var(--radius-md);
+    padding: 0.5rem;
+    margin-bottom: 1rem;
+    border: 1px solid var(--glass-border);
+}
+.rag-doc-meta {
+    font-size: 0.8rem;
+    opacity: 0.7;
+    display: flex;
+    gap: 1rem;
+}
+.rag-doc-body p:last-child {
+    margin-bottom: 0;
+}
+</style>
+"""
+
+
+def markdown_to_html(text):
+    """
+    Render passage markdown to HTML, escaping any raw HTML in it.
+
+    Args:
+        text (str): Markdown text
+
+    Returns:
+        str: HTML
+    """
+    return _markdown.render(text)
+
+
+@lru_cache(maxsize=4096)
+def passage_html(content, paragraph_number, score, source_label=None):
+    """
+    Render one retrieved passage as an HTML card (memoized across reruns).
+
+    Args:
+        content (str): Passage markdown
+        paragraph_number: Paragraph number shown in the header
+        score (float): Similarity or fused score
+        source_label (str, optional): Source shown in the header (flat listing)
+
+    Returns:
+        str: HTML card
+    """
+    source_html = f'<span><i class="fas fa-book"></i> {_markdown.renderInline(source_label)}</span>' if source_label else ""
+    return (
+        '<div class="rag-doc">'
+        f'<div class="rag-doc-meta">{source_html}'
+        f'<span><i class="fas fa-paragraph"></i> Parágrafo: {html.escape(str(paragraph_number))}</span>'
+        f'<span>Score: {score:.4f}</span></div>'
+        f'<div class="rag-doc-body">{markdown_to_html(content)}</div>'
+        '</div>'
+    )
+
+
+def results_page_html(results, format_source, visible, grouped=True):
+    """
+    Render the first `visible` results as one HTML block.
+
+    With grouped=True the visible results are grouped by source (sources in
+    alphabetical order, passages in rank order), as in the results tab;
+    otherwise they are listed in rank order with their source in each card.
+
+    Args:
+        results (list): (Document, score) tuples in rank order
+        format_source (callable): Formats a source name for display (markdown)
+        visible (int): Number of results to render
+        grouped (bool): Group results by source
+
+    Returns:
+        str: HTML block
+    """
+    page = results[:visible]
+    if not grouped:
+        return "".join(
+            passage_html(doc.page_content, doc.metadata.get("paragraph_number", "N/A"), float(score),
+                         format_source(doc.metadata.get("source", "Unknown")))
+            for doc, score in page
+        )
+
+    by_source = {}
+    for doc, score in page:
+        by_source.setdefault(doc.metadata.get("source", "Unknown"), []).append((doc, score))
+
+    blocks = []
+    for source in sorted(by_source):
+        cards = "".join(
+            passage_html(doc.page_content, doc.metadata.get("paragraph_number", "N/A"), float(score))
+            for doc, score in by_source[source]
+        )
+        blocks.append(
+            '<details class="rag-source">'
+            f'<summary>📚 {_markdown.renderInline(format_source(source))} ({len(by_source[source])})</summary>'
+            f'<div class="rag-source-body">{cards}</div>'
+            '</details>'
+        )
+    return "".join(blocks)
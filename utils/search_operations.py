@@ -1,15 +1,24 @@
 """
 Search operations for the RAG application.
 """
+import asyncio
 import os
+import threading
+import time
 import streamlit as st
-from langchain_community.vectorstores import FAISS
-from langchain_core.messages import HumanMessage, SystemMessage
 from utils.vector_store import load_vectorstore
 from utils.vector_store import initialize_embeddings
+from utils.embedding_cache import aembed_query_cached, embed_query_cached
+from utils.sharded_index import ShardedIndex
+from utils.lexical_index import lexical_index_exists
+from utils.answer_cache import get_answer_cache
+from utils.context_packer import pack_context
+from utils.profiling import stage
+from utils.metrics import ANSWERS, LLM_SECONDS, LLM_TOKENS, LLM_TTFT_SECONDS, SEARCHES
+from utils.context_packer import count_tokens
+from utils.lazy_imports import lazy_import
 
-
-
+langchain_messages = lazy_import("langchain_core.messages")
 
 def format_source_name(source):
     """
@@ -51,17 +60,126 @@ def group_results_by_source(results):
     
     return grouped, sources_sorted
 
+def prefetch_selected_stores(vector_store_ids, previous_ids, index_dir, embeddings, mode=None):
+    """
+    React to a change of the selected stores before any search is made.
+    
+    Newly selected stores start loading into the process-wide cache in the
+    background (with their BM25 indexes in hybrid mode), overlapping with the
+    time the user spends typing the query. Deselected stores are demoted in
+    the cache: they stay available to other sessions but are the first to be
+    evicted when memory is needed.
+    
+    Args:
+        vector_store_ids (list): Currently selected vector store IDs
+        previous_ids (list): Vector store IDs selected before this change
+        index_dir (str): Directory containing vector stores
+        embeddings: Embeddings object
+        mode (str, optional): "semantic" or "hybrid"; defaults to SEARCH_MODE or "semantic"
+        
+    Returns:
+        list: Store IDs whose loading was started
+    """
+    mode = mode or os.getenv("SEARCH_MODE", "semantic")
+    sharded_index = ShardedIndex(index_dir, embeddings)
+    
+    for store_id in previous_ids:
+        if store_id not in vector_store_ids:
+            sharded_index.cache.demote(store_id, os.path.join(index_dir, store_id))
+    
+    # Só stores novos e existentes em disco; os demais dariam erro na própria busca
+    added = [
+        store_id for store_id in vector_store_ids
+        if store_id not in previous_ids and os.path.exists(os.path.join(index_dir, store_id, "index.faiss"))
+    ]
+    sharded_index.prefetch(added, lexical=mode == "hybrid")
+    return added
 
+def search_stores(query, vector_store_ids, index_dir, top_k, embeddings, mode=None, timeout=None, on_shard_done=None):
+    """
+    Search several vector stores for a global top-k, without any Streamlit UI.
+    
+    This is the search core shared by the Streamlit app and the HTTP API.
+    
+    Args:
+        query (str): The search query
+        vector_store_ids (list): Vector store IDs to search
+        index_dir (str): Directory containing vector stores
+        top_k (int): Number of top results to return
+        embeddings: Embeddings object
+        mode (str, optional): "semantic" or "hybrid"; defaults to SEARCH_MODE or "semantic"
+        timeout (float, optional): Per-store deadline in seconds; defaults to SEARCH_STORE_TIMEOUT (30)
+        on_shard_done (callable, optional): Called with each TaskOutcome as stores finish
+        
+    Returns:
+        tuple: (results, errors) where results is a list of (Document, score) tuples,
+            best first, and errors maps store_id -> exception
+    """
+    mode = mode or os.getenv("SEARCH_MODE", "semantic")
+    SEARCHES.inc(mode=mode)
+    if timeout is None:
+        timeout = float(os.getenv("SEARCH_STORE_TIMEOUT", "30"))
+    
+    # Embed the query once and reuse the vector for every store
+    with stage("embed_query"):
+        query_vector = embed_query_cached(embeddings, query)
+    
+    # Global top-k across stores (lower score = more similar for L2 indexes;
+    # in hybrid mode scores are RRF values, higher = more relevant)
+    return ShardedIndex(index_dir, embeddings).search(
+        query_vector,
+        top_k,
+        vector_store_ids,
+        timeout=timeout,
+        on_shard_done=on_shard_done,
+        query_text=query,
+        mode=mode
+    )
 
-def perform_search(query, vector_store_ids, index_dir, top_k):
+async def asearch_stores(query, vector_store_ids, index_dir, top_k, embeddings, mode=None, timeout=None, on_shard_done=None):
+    """
+    Async counterpart of search_stores.
+    
+    Stores not yet in the cache start loading while the query is embedded
+    with aembed_query, so a cold load and the embedding request overlap; the shard searches
+    then run on the shared thread pool without blocking the event loop.
+    Arguments and return value are the same as search_stores.
     """
-    Perform search across multiple vector stores.
+    mode = mode or os.getenv("SEARCH_MODE", "semantic")
+    SEARCHES.inc(mode=mode)
+    if timeout is None:
+        timeout = float(os.getenv("SEARCH_STORE_TIMEOUT", "30"))
+    
+    sharded_index = ShardedIndex(index_dir, embeddings)
+    sharded_index.prefetch([
+        store_id for store_id in vector_store_ids
+        if not sharded_index.cache.contains(os.path.join(index_dir, store_id))
+    ])
+    with stage("embed_query"):
+        query_vector = await aembed_query_cached(embeddings, query)
+    
+    return await sharded_index.asearch(
+        query_vector,
+        top_k,
+        vector_store_ids,
+        timeout=timeout,
+        on_shard_done=on_shard_done,
+        query_text=query,
+        mode=mode
+    )
+
+def perform_search(query, vector_store_ids, index_dir, top_k, mode=None, embeddings=None):
+    """
+    Perform search across multiple vector stores, reporting progress and errors in the Streamlit UI.
     
     Args:
         query (str): The search query
         vector_store_ids (list): List of vector store IDs to search
         index_dir (str): Directory containing vector stores
         top_k (int): Number of top results to return
+        mode (str, optional): "semantic" or "hybrid" (BM25 + vector with reciprocal
+            rank fusion); defaults to SEARCH_MODE or "semantic"
+        embeddings (optional): Embeddings object; defaults to the session's embeddings
         
     Returns:
         tuple: (all_results, grouped_results, sources_sorted)
@@ -88,92 +206,352 @@ def perform_search(query, vector_store_ids, index_dir, top_k):
         st.info("Execute 'create_vector_store.py' para criar os índices faltantes.")
         return [], {}, []
     
-    # Search across all vector stores
-    all_results = []
+    mode = mode or os.getenv("SEARCH_MODE", "semantic")
+    if mode == "hybrid":
+        missing_lexical = [vid for vid in valid_vector_store_ids if not lexical_index_exists(os.path.join(index_dir, vid))]
+        if missing_lexical:
+            st.warning(f"Índice léxico (BM25) não encontrado para {', '.join(missing_lexical)}; apenas a busca vetorial será usada nesses stores.")
+    
+    embeddings = embeddings or st.session_state.embeddings
+    
+    # Search all selected stores as shards of one index; shards report as each one finishes
     progress_bar = st.progress(0)
     status_text = st.empty()
+    status_text.text(f"Pesquisando em {len(valid_vector_store_ids)} vector store(s)...")
+    completed = []
     
-    for i, vector_store_id in enumerate(valid_vector_store_ids):
-        index_path = os.path.join(index_dir, vector_store_id)
-        status_text.text(f"Pesquisando em {vector_store_id} ({i+1}/{len(valid_vector_store_ids)})")
-        progress_bar.progress((i) / len(valid_vector_store_ids))
+    def on_shard_done(outcome):
+        completed.append(outcome.key)
+        if isinstance(outcome.error, FileNotFoundError):
+            st.warning(f"Arquivo de índice não encontrado para {outcome.key}")
+        elif isinstance(outcome.error, TimeoutError):
+            st.warning(f"Tempo esgotado ao pesquisar no vector store {outcome.key}: {outcome.error}")
+        elif outcome.error is not None:
+            st.warning(f"Erro ao carregar vector store {outcome.key}: {str(outcome.error)}")
         
-        try:
-            with st.spinner(f"Buscando em {vector_store_id}..."):
-                # Check if index file exists
-                index_file = os.path.join(index_path, "index.faiss")
-                if not os.path.exists(index_file):
-                    st.warning(f"Arquivo de índice não encontrado para {vector_store_id}")
-                    continue
-                    
-                # Load existing vector store
-                try:
-                    vectorstore = FAISS.load_local(
-                        index_path,
-                        st.session_state.embeddings,
-                        allow_dangerous_deserialization=True
-                    )
-                    results = vectorstore.similarity_search_with_score(query, k=top_k)
-                    all_results.extend(results)
-                except Exception as e:
-                    st.warning(f"Erro ao carregar vector store {vector_store_id}: {str(e)}")
-        except Exception as e:
-            st.warning(f"Não foi possível pesquisar no vector store {vector_store_id}: {e}")
+        status_text.text(f"{outcome.key} concluído em {outcome.elapsed:.2f}s ({len(completed)}/{len(valid_vector_store_ids)})")
+        progress_bar.progress(len(completed) / len(valid_vector_store_ids))
+    
+    try:
+        all_results, _ = search_stores(
+            query,
+            valid_vector_store_ids,
+            index_dir,
+            top_k,
+            embeddings,
+            mode=mode,
+            on_shard_done=on_shard_done
+        )
+    except Exception as e:
+        progress_bar.empty()
+        status_text.empty()
+        st.error(f"Erro ao gerar embedding da consulta: {e}")
+        return [], {}, []
     
     progress_bar.progress(1.0)
     status_text.text("Processando resultados...")
     
-    # Sort all aggregated results by score (lower score = more similar)
-    all_results = sorted(all_results, key=lambda x: x[1])
-    # Limit to global top-k
-    all_results = all_results[:top_k]
-    
     # Group results by source
-    grouped, sources_sorted = group_results_by_source(all_results)
+    with stage("group"):
+        grouped, sources_sorted = group_results_by_source(all_results)
     
     # Clear progress indicators
     status_text.empty()
     
     return all_results, grouped, sources_sorted
 
-def generate_llm_answer(query, results, llm, top_k, temperature=0.2):
+SYSTEM_PROMPT = "Você é um assistente especializado em Conscienciologia que responde perguntas com base no contexto fornecido."
+
+# Intervalo mínimo entre atualizações da resposta na tela durante o streaming
+STREAM_RENDER_INTERVAL = 0.05
+
+def build_llm_messages(query, results, top_k, model=None):
     """
-    Generate LLM answer based on search results.
+    Build the chat messages sent to the LLM.
+    
+    The context is packed within the token budget of the target model
+    (see utils.context_packer.pack_context), in rank order.
     
     Args:
         query (str): The search query
         results (list): List of (document, score) tuples
-        llm: LLM object
         top_k (int): Number of documents to include in context
-        temperature (float, optional): Controls randomness in LLM response generation. Defaults to 0.7.
+        model (str, optional): Target model name, used to count tokens
         
     Returns:
-        dict: Answer from the LLM
+        list: System and human messages
+    """
+    # Build context from document texts, within the token budget
+    passages = pack_context([doc for doc, _ in results[:top_k]], model or os.getenv("MODEL_LLM", "gpt-4o"))
+    context = "\n\n".join(passages)
+    
+    return [
+        langchain_messages.SystemMessage(content=SYSTEM_PROMPT),
+        langchain_messages.HumanMessage(content=f"Contexto:\n{context}\n\nPergunta: {query}\nPor favor, responda com base apenas no contexto fornecido.")
+    ]
+
+def _record_llm_metrics(model, messages, result_text, ttft, total):
+    """Record latency and token counts of one LLM call."""
+    LLM_SECONDS.observe(total, model=model)
+    LLM_TTFT_SECONDS.observe(ttft, model=model)
+    LLM_TOKENS.inc(sum(count_tokens(message.content, model) for message in messages), model=model, kind="prompt")
+    LLM_TOKENS.inc(count_tokens(result_text, model), model=model, kind="completion")
+    ANSWERS.inc(model=model, source="llm")
+
+def _model_name(llm):
+    """Return the model name of an LLM object, used in metrics and cache keys."""
+    return getattr(llm, 'model_name', None) or getattr(llm, 'model', None) or type(llm).__name__
+
+def _chunk_text(chunk):
+    """Return the text of a streamed chunk or an invoke response."""
+    return chunk.content if hasattr(chunk, 'content') else str(chunk)
+
+def _empty_answer_event():
+    """Return the final event of an answer to a search without results."""
+    return {"result": "Nenhum resultado encontrado.", "timings": {"ttft_s": 0.0, "total_s": 0.0}, "cached": False}
+
+def _lookup_answer(query, results, model_name, top_k, temperature, query_vector):
+    """
+    Look up an answer in the process-wide answer cache.
+    
+    Returns:
+        tuple: (cache_key, cached answer dict or None)
+    """
+    answer_cache = get_answer_cache()
+    cache_key = answer_cache.make_key(model_name, temperature, SYSTEM_PROMPT, query, [doc for doc, _ in results[:top_k]])
+    return cache_key, answer_cache.get(cache_key, query_vector=query_vector)
+
+def _cached_answer_events(model_name, cached, start):
+    """Return the events replaying a cached answer."""
+    elapsed = time.perf_counter() - start
+    ANSWERS.inc(model=model_name, source="cache")
+    return [
+        {"token": cached["result"]},
+        {"result": cached["result"], "timings": {"ttft_s": elapsed, "total_s": elapsed}, "cached": True},
+    ]
+
+def _finish_answer(model_name, messages, chunks, ttft, start, cache_key, query_vector):
+    """
+    Record the metrics of a generated answer, store it in the answer cache and
+    return its final event.
+    """
+    result_text = "".join(chunks)
+    total = time.perf_counter() - start
+    ttft = ttft if ttft is not None else total
+    _record_llm_metrics(model_name, messages, result_text, ttft, total)
+    get_answer_cache().put(cache_key, {"result": result_text}, query_vector=query_vector)
+    return {"result": result_text, "timings": {"ttft_s": ttft, "total_s": total}, "cached": False}
+
+def iter_answer_events(query, results, llm, top_k, temperature=0.2, query_vector=None, stream=True):
+    """
+    Generate an answer from search results as a sequence of events, without any Streamlit UI.
+    
+    This is the answer core shared by the Streamlit app and the HTTP API.
+    Answers are first looked up in the process-wide answer cache, keyed by the
+    model, temperature, system prompt and the ordered documents in the context.
+    
+    Args:
+        query (str): The search query
+        results (list): List of (document, score) tuples
+        llm: LLM object
+        top_k (int): Number of documents to include in context
+        temperature (float, optional): Controls randomness in LLM response generation
+        query_vector (optional): Query embedding, enables near-duplicate cache matches
+        stream (bool): Stream tokens from the model; otherwise one invoke call
+        
+    Yields:
+        dict: {"token": text} for each piece of the answer, then a final
+            {"result", "timings": {"ttft_s", "total_s"}, "cached"} event
     """
     if not results:
-        return {"result": "Nenhum resultado encontrado."}
+        yield _empty_answer_event()
+        return
+    
+    model_name = _model_name(llm)
+    start = time.perf_counter()
+    
+    # Return a cached answer for the same context without calling the API
+    cache_key, cached = _lookup_answer(query, results, model_name, top_k, temperature, query_vector)
+    if cached is not None:
+        yield from _cached_answer_events(model_name, cached, start)
+        return
+    
+    try:
+        with stage("pack_context"):
+            messages = build_llm_messages(query, results, top_k, model=model_name)
+        
+        chunks = []
+        ttft = None
+        with stage("llm"):
+            if stream:
+                for chunk in llm.stream(messages, temperature=temperature):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    chunks.append(_chunk_text(chunk))
+                    yield {"token": chunks[-1]}
+            else:
+                # Invoke model with messages
+                chunks.append(_chunk_text(llm.invoke(messages, temperature=temperature)))
+                yield {"token": chunks[0]}
+    except Exception:
+        ANSWERS.inc(model=model_name, source="error")
+        raise
+    
+    yield _finish_answer(model_name, messages, chunks, ttft, start, cache_key, query_vector)
+
+async def aiter_answer_events(query, results, llm, top_k, temperature=0.2, query_vector=None, stream=True):
+    """
+    Async counterpart of iter_answer_events, using the model's astream/ainvoke.
+    
+    Tokens are yielded as they arrive without holding a thread, so one event
+    loop can stream many answers at once; the answer cache lookup and the
+    token counting of the context run in worker threads. Arguments and events
+    are the same as iter_answer_events.
+    """
+    if not results:
+        yield _empty_answer_event()
+        return
+    
+    model_name = _model_name(llm)
+    start = time.perf_counter()
+    
+    cache_key, cached = await asyncio.to_thread(_lookup_answer, query, results, model_name, top_k, temperature, query_vector)
+    if cached is not None:
+        for event in _cached_answer_events(model_name, cached, start):
+            yield event
+        return
     
     try:
+        with stage("pack_context"):
+            messages = await asyncio.to_thread(build_llm_messages, query, results, top_k, model=model_name)
+        
+        chunks = []
+        ttft = None
+        with stage("llm"):
+            if stream:
+                async for chunk in llm.astream(messages, temperature=temperature):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    chunks.append(_chunk_text(chunk))
+                    yield {"token": chunks[-1]}
+            else:
+                chunks.append(_chunk_text(await llm.ainvoke(messages, temperature=temperature)))
+                yield {"token": chunks[0]}
+    except Exception:
+        ANSWERS.inc(model=model_name, source="error")
+        raise
+    
+    yield await asyncio.to_thread(_finish_answer, model_name, messages, chunks, ttft, start, cache_key, query_vector)
+
+async def agenerate_llm_answer(query, results, llm, top_k, temperature=0.2, query_vector=None):
+    """
+    Generate an LLM answer asynchronously, without any Streamlit UI.
+    
+    Args:
+        query (str): The search query
+        results (list): List of (document, score) tuples
+        llm: LLM object
+        top_k (int): Number of documents to include in context
+        temperature (float, optional): Controls randomness in LLM response generation
+        query_vector (optional): Query embedding, enables near-duplicate cache matches
+        
+    Returns:
+        dict: "result", "timings" ({"ttft_s", "total_s"}) and "cached"
+    """
+    final = None
+    async for event in aiter_answer_events(query, results, llm, top_k, temperature=temperature,
+                                           query_vector=query_vector, stream=False):
+        final = event
+    return final
+
+def start_answer_job(query, results, llm, top_k, temperature=0.2, query_vector=None, stream=True):
+    """
+    Generate an LLM answer in a background thread, independent of the Streamlit script run.
+    
+    A rerun (changing tab, loading more results) stops the script that shows
+    the answer but not the job, so a job kept in session state can be shown
+    again by the next run and finishes (and is cached) exactly once.
+    
+    Args:
+        query (str): The search query
+        results (list): List of (document, score) tuples
+        llm: LLM object
+        top_k (int): Number of documents to include in context
+        temperature (float, optional): Controls randomness in LLM response generation
+        query_vector (optional): Query embedding, enables near-duplicate cache matches
+        stream (bool): Stream tokens into the job as they arrive
+        
+    Returns:
+        dict: Job with "chunks" (tokens so far), "result" (final event), "error" and "done" (threading.Event)
+    """
+    job = {"query": query, "chunks": [], "result": None, "error": None, "done": threading.Event()}
+    
+    def run():
+        try:
+            for event in iter_answer_events(query, results, llm, top_k, temperature=temperature,
+                                            query_vector=query_vector, stream=stream):
+                if "token" in event:
+                    job["chunks"].append(event["token"])
+                else:
+                    job["result"] = event
+        except Exception as e:
+            job["error"] = e
+        finally:
+            job["done"].set()
+    
+    threading.Thread(target=run, name="rag-answer", daemon=True).start()
+    return job
+
+def show_answer_job(job, placeholder=None):
+    """
+    Show an answer job until it finishes, streaming its tokens into a placeholder.
+    
+    Args:
+        job (dict): Job returned by start_answer_job
+        placeholder (optional): Streamlit element (st.empty()) that receives streamed tokens;
+            without one the answer is awaited behind a spinner
+        
+    Returns:
+        dict: Final answer ("result", "timings", "cached"), or {"result": error message}
+    """
+    if placeholder is None:
         with st.spinner("Gerando resposta com LLM..."):
-            # Build context from document texts
-            context = "\n\n".join([doc.page_content for doc, _ in results[:top_k]])
-            
-            # Create messages for chat
-            system_msg = "Você é um assistente especializado em Conscienciologia que responde perguntas com base no contexto fornecido."
-            
-            messages = [
-                SystemMessage(content=system_msg),
-                HumanMessage(content=f"Contexto:\n{context}\n\nPergunta: {query}\nPor favor, responda com base apenas no contexto fornecido.")
-            ]
-            
-            # Invoke model with messages
-            response = llm.invoke(messages, temperature=temperature)
-            
-            # Extract response content
-            result_text = response.content if hasattr(response, 'content') else str(response)
-            
-            return {"result": result_text}
-    except Exception as e:
-        error_msg = f"Erro ao gerar resposta com LLM: {str(e)}"
+            job["done"].wait()
+    else:
+        placeholder.markdown("*Gerando resposta...*")
+        while not job["done"].wait(STREAM_RENDER_INTERVAL):
+            if job["chunks"]:
+                placeholder.markdown("".join(job["chunks"]) + " ▌")
+    
+    if job["error"] is not None:
+        error_msg = f"Erro ao gerar resposta com LLM: {str(job['error'])}"
         st.error(error_msg)
         return {"result": error_msg}
+    return job["result"]
+
+def generate_llm_answer(query, results, llm, top_k, temperature=0.2, placeholder=None, query_vector=None):
+    """
+    Generate LLM answer based on search results.
+    
+    When a placeholder is given the answer is streamed into it token by token;
+    otherwise the full completion is awaited behind a spinner.
+    
+    Args:
+        query (str): The search query
+        results (list): List of (document, score) tuples
+        llm: LLM object
+        top_k (int): Number of documents to include in context
+        temperature (float, optional): Controls randomness in LLM response generation. Defaults to 0.7.
+        placeholder (optional): Streamlit element (st.empty()) that receives streamed tokens
+        query_vector (optional): Query embedding, enables near-duplicate cache matches
+        
+    Returns:
+        dict: Answer from the LLM ("result"), generation timings in seconds
+            ("timings": {"ttft_s", "total_s"}) and whether it came from the cache ("cached")
+    """
+    if not results:
+        return {"result": "Nenhum resultado encontrado."}
+    
+    job = start_answer_job(query, results, llm, top_k, temperature=temperature,
+                           query_vector=query_vector, stream=placeholder is not None)
+    return show_answer_job(job, placeholder)
@@ -0,0 +1,183 @@
+"""
+Two-tier vector search for the RAG application: a compact first-pass index and exact rescoring.
+
+Stores built with a quantized index type (sq_fp16, sq8; see utils.ann_index)
+keep only compact codes in index.faiss, which is what stays resident, and
+write their full float32 vectors to vectors.npy. Stores built with a PCA
+projection (pca_dim) search a reduced-dimension index the same way. A search
+asks the first-pass index for `rescore` × k candidates and recomputes their
+exact scores from the memory-mapped full vectors, so only the candidate rows
+are read from disk and the results match a full-precision search in all but
+rare cases.
+"""
+import logging
+import os
+
+import numpy as np
+
+from utils.ann_index import QUANTIZED_TYPES
+from utils.lazy_imports import lazy_import
+
+faiss = lazy_import("faiss")
+
+# Vetores float32 completos do store, na ordem do índice (lidos via mmap)
+VECTORS_FILE = "vectors.npy"
+
+logger = logging.getLogger(__name__)
+
+
+def rescore_factor(spec):
+    """
+    Return how many candidates per result a store's first pass returns for rescoring.
+
+    Args:
+        spec (dict): Index spec of the store (None for a default flat store)
+
+    Returns:
+        int: Candidates per result, or 0 when the store is searched at full precision
+    """
+    if not spec or (spec.get("type") not in QUANTIZED_TYPES and not spec.get("pca_dim")):
+        return 0
+    return max(1, int(spec.get("rescore") or 4))
+
+
+def write_full_vectors(index_dir, vectors, spec):
+    """
+    Save (or remove) the full-precision vectors of a store according to its spec.
+
+    The file is written beside the store and renamed into place, so a process
+    that has the previous file memory-mapped keeps reading a complete copy.
+
+    Args:
+        index_dir (str): Store directory
+        vectors (numpy.ndarray): (n, d) vectors in index order
+        spec (dict): Index spec of the store
+    """
+    path = os.path.join(index_dir, VECTORS_FILE)
+    if not rescore_factor(spec):
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+
+def attach_full_vectors(vectorstore, index_dir, spec):
+    """
+    Memory-map a store's full-precision vectors for rescoring, when its spec uses them.
+
+    Args:
+        vectorstore: FAISS vector store just loaded from index_dir
+        index_dir (str): Store directory
+        spec (dict): Index spec of the store
+
+    Returns:
+        bool: True if rescoring is enabled for the store
+    """
+    factor = rescore_factor(spec)
+    if not factor:
+        return False
+    path = os.path.join(index_dir, VECTORS_FILE)
+    if not os.path.exists(path):
+        logger.warning("%s não tem %s; a busca usará só o índice comprimido", index_dir, VECTORS_FILE)
+        return False
+    vectors = np.load(path, mmap_mode="r")
+    if vectors.shape != (vectorstore.index.ntotal, vectorstore.index.d):
+        logger.warning("%s: %s não corresponde ao índice; a busca usará só o índice comprimido", index_dir, VECTORS_FILE)
+        return False
+    vectorstore.full_vectors = vectors
+    vectorstore.rescore_factor = factor
+    return True
+
+
+def exact_scores(full_vectors, query, ids, inner_product=False):
+    """
+    Compute exact scores of one query against some stored vectors.
+
+    Args:
+        full_vectors (numpy.ndarray): (n, d) full-precision vectors (may be memory-mapped)
+        query (numpy.ndarray): (d,) query vector, prepared as for the index
+        ids (numpy.ndarray): Sorted positions to score
+        inner_product (bool): Inner-product metric; otherwise squared L2, as FAISS reports
+
+    Returns:
+        numpy.ndarray: Scores aligned with ids
+    """
+    rows = np.asarray(full_vectors[ids], dtype=np.float32)
+    if inner_product:
+        return rows @ query
+    diff = rows - query
+    return np.einsum("ij,ij->i", diff, diff)
+
+
+def search_index(vectorstore, query_matrix, k):
+    """
+    Search a store's index, rescoring compact first-pass candidates when the store has tiers.
+
+    Drop-in replacement for vectorstore.index.search on prepared queries.
+
+    Args:
+        vectorstore: FAISS vector store
+        query_matrix (numpy.ndarray): (n, d) float32 queries, prepared for the index
+        k (int): Results per query
+
+    Returns:
+        tuple: (scores, ids) arrays of shape (n, k), best first, -1 ids for missing hits
+    """
+    return rescored_search(vectorstore.index, getattr(vectorstore, "full_vectors", None),
+                           getattr(vectorstore, "rescore_factor", 0), query_matrix, k)
+
+
+def rescored_search(index, full_vectors, factor, query_matrix, k):
+    """
+    Search a FAISS index for factor × k candidates and rerank them on exact scores.
+
+    Args:
+        index: First-pass FAISS index (compact codes or reduced dimension)
+        full_vectors (numpy.ndarray): (n, d) full-precision vectors in index order, or None
+        factor (int): Candidates per result; 0 searches the index alone
+        query_matrix (numpy.ndarray): (n, d) float32 queries, prepared for the index
+        k (int): Results per query
+
+    Returns:
+        tuple: (scores, ids) arrays of shape (n, k), best first, -1 ids for missing hits
+    """
+    if full_vectors is None or not factor:
+        return index.search(query_matrix, k)
+
+    inner_product = index.metric_type == faiss.METRIC_INNER_PRODUCT
+    _, candidates = index.search(query_matrix, min(max(k * factor, k), max(index.ntotal, 1)))
+    scores = np.full((len(query_matrix), k), -np.inf if inner_product else np.inf, dtype=np.float32)
+    ids = np.full((len(query_matrix), k), -1, dtype=np.int64)
+    for i, (query, row) in enumerate(zip(query_matrix, candidates)):
+        # Leitura das linhas em ordem crescente: acesso sequencial ao arquivo mapeado
+        positions = np.sort(row[row >= 0])
+        if not len(positions):
+            continue
+        exact = exact_scores(full_vectors, query, positions, inner_product)
+        top = np.argsort(-exact if inner_product else exact, kind="stable")[:k]
+        scores[i, :len(top)] = exact[top]
+        ids[i, :len(top)] = positions[top]
+    return scores, ids
+
+
+def tier_memory(vectorstore):
+    """
+    Estimate the resident memory of a store's vectors against plain float32 storage.
+
+    Args:
+        vectorstore: FAISS vector store
+
+    Returns:
+        dict: index_bytes (serialized first-pass index), float32_bytes (n × d × 4),
+            full_vectors_bytes (memory-mapped file, not resident)
+    """
+    index = vectorstore.index
+    full_vectors = getattr(vectorstore, "full_vectors", None)
+    return {
+        "index_bytes": int(faiss.serialize_index(index).nbytes),
+        "float32_bytes": int(index.ntotal) * int(index.d) * 4,
+        "full_vectors_bytes": int(full_vectors.nbytes) if full_vectors is not None else 0,
+    }
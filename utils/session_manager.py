@@ -5,8 +5,7 @@ import os
 import streamlit as st
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from utils.document_loader import load_markdown_documents
-from utils.vector_store import initialize_embeddings
-from utils.llm_query import initialize_llm
+from utils.clients import get_shared_embeddings, get_shared_llm
 
 def initialize_session(config):
     """
@@ -39,11 +38,11 @@ def initialize_session(config):
     
     # Initialize embeddings
     if 'embeddings' not in st.session_state:
-        st.session_state.embeddings = initialize_embeddings()
+        st.session_state.embeddings = get_shared_embeddings()
     
     # Initialize LLM
     if 'llm' not in st.session_state:
-        st.session_state.llm = initialize_llm(model_name=config['MODEL_LLM'], temperature=0)
+        st.session_state.llm = get_shared_llm(config['MODEL_LLM'])
     
     # Check for vector stores
     if 'vectorstore' not in st.session_state:
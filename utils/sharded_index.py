@@ -0,0 +1,450 @@
+"""
+Combined multi-store index with a single global top-k search for the RAG application.
+"""
+import heapq
+import os
+import threading
+from collections import Counter
+from functools import partial
+
+import numpy as np
+
+from utils.fanout import afan_out, fan_out, get_search_executor
+from utils.index_cache import get_vectorstore_cache, load_store_lexical_index
+from utils.lazy_imports import lazy_import
+from utils.lexical_index import reciprocal_rank_fusion
+from utils.index_mutation import load_tombstones
+from utils.metrics import record_store_search
+from utils.profiling import stage
+from utils.search_tiers import search_index
+
+faiss = lazy_import("faiss")
+langchain_documents = lazy_import("langchain_core.documents")
+
+# Carregamentos antecipados em andamento: (index_dir, store_id) -> Future
+_prefetches = {}
+_prefetch_lock = threading.RLock()
+
+
+def _prefetch_done(key, future):
+    # Erros reaparecem quando o store é pesquisado
+    future.exception()
+    with _prefetch_lock:
+        if _prefetches.get(key) is future:
+            del _prefetches[key]
+
+
+def higher_is_better(vectorstore):
+    """
+    Tell whether larger raw scores mean more similar for a store's index.
+
+    Args:
+        vectorstore: FAISS vector store
+
+    Returns:
+        bool: True for inner-product indexes, False for L2 distances
+    """
+    return vectorstore.index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def _metric_name(higher_better):
+    """Return the display name of an index metric."""
+    return "produto interno" if higher_better else "L2"
+
+
+def prepare_query(vectorstore, query_vector):
+    """
+    Convert a query vector to the (1, d) float32 matrix expected by a store's index.
+
+    Args:
+        vectorstore: FAISS vector store
+        query_vector (list or numpy.ndarray): Query embedding
+
+    Returns:
+        numpy.ndarray: Query matrix, L2-normalized when the store requires it
+    """
+    return prepare_queries(vectorstore, np.reshape(query_vector, (1, -1)))
+
+
+def prepare_queries(vectorstore, query_vectors):
+    """
+    Convert query vectors to the (n, d) float32 matrix expected by a store's index.
+
+    Args:
+        vectorstore: FAISS vector store
+        query_vectors (numpy.ndarray or list): (n, d) query embeddings
+
+    Returns:
+        numpy.ndarray: Private query matrix, L2-normalized when the store requires it
+    """
+    matrix = np.array(query_vectors, dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(matrix)
+    return matrix
+
+
+def search_shard(vectorstore, query_vector, k):
+    """
+    Search one store's raw FAISS index without touching its docstore.
+
+    Args:
+        vectorstore: FAISS vector store
+        query_vector (list or numpy.ndarray): Query embedding
+        k (int): Number of hits to return
+
+    Returns:
+        list: (score, local_id) tuples, best first
+    """
+    scores, ids = search_index(vectorstore, prepare_query(vectorstore, query_vector), k)
+    return [(float(score), int(local_id)) for score, local_id in zip(scores[0], ids[0]) if local_id != -1]
+
+
+def search_shard_batch(vectorstore, query_vectors, k):
+    """
+    Search one store's raw FAISS index for many queries in one matrix call.
+
+    Args:
+        vectorstore: FAISS vector store
+        query_vectors (numpy.ndarray): (n, d) query embeddings
+        k (int): Number of hits per query
+
+    Returns:
+        list: One list of (score, local_id) tuples per query, best first
+    """
+    scores, ids = search_index(vectorstore, prepare_queries(vectorstore, query_vectors), k)
+    return [
+        [(float(score), int(local_id)) for score, local_id in zip(row_scores, row_ids) if local_id != -1]
+        for row_scores, row_ids in zip(scores, ids)
+    ]
+
+
+def drop_tombstoned(vectorstore, hits, tombstones):
+    """
+    Remove hits whose documents were deleted but not yet compacted away.
+
+    Args:
+        vectorstore: FAISS vector store
+        hits (list): (score, local_id) tuples
+        tombstones (frozenset): Deleted docstore ids
+
+    Returns:
+        list: Remaining hits, in order
+    """
+    if not tombstones:
+        return hits
+    return [hit for hit in hits if vectorstore.index_to_docstore_id.get(hit[1]) not in tombstones]
+
+
+def merge_shard_hits(shard_hits, k, higher_better=False):
+    """
+    Merge per-shard hits into the global top-k.
+
+    Args:
+        shard_hits (dict): store_id -> list of (score, local_id)
+        k (int): Number of hits to keep
+        higher_better (bool): Whether larger scores are better
+
+    Returns:
+        list: (store_id, local_id, score) tuples, best first
+    """
+    candidates = (
+        (store_id, local_id, score)
+        for store_id, hits in shard_hits.items()
+        for score, local_id in hits
+    )
+    if higher_better:
+        return heapq.nlargest(k, candidates, key=lambda hit: hit[2])
+    return heapq.nsmallest(k, candidates, key=lambda hit: hit[2])
+
+
+def fetch_documents(shards, winners):
+    """
+    Materialize Documents for the winning hits only.
+
+    Each returned Document is a copy whose metadata also carries the
+    `store_id` and docstore `doc_id` it came from.
+
+    Args:
+        shards (dict): store_id -> FAISS vector store
+        winners (list): (store_id, local_id, score) tuples
+
+    Returns:
+        list: (Document, score) tuples in the order of winners
+    """
+    results = []
+    for store_id, local_id, score in winners:
+        vectorstore = shards[store_id]
+        doc_id = vectorstore.index_to_docstore_id.get(local_id)
+        doc = vectorstore.docstore.search(doc_id) if doc_id is not None else None
+        if not isinstance(doc, langchain_documents.Document):
+            continue
+        metadata = dict(doc.metadata)
+        metadata["store_id"] = store_id
+        metadata["doc_id"] = doc_id
+        results.append((langchain_documents.Document(page_content=doc.page_content, metadata=metadata), score))
+    return results
+
+
+class ShardedIndex:
+    """
+    Query layer over every store in an index directory.
+
+    Any subset of stores can be searched in one call; each selected store is
+    a shard searched concurrently on its raw FAISS index (and, in hybrid mode,
+    its BM25 index), the hits are merged into the true global top-k, and only
+    the winners are read from the docstores. Stores are resolved through the
+    process-wide vector store cache.
+    """
+
+    def __init__(self, index_dir, embeddings, cache=None):
+        """
+        Args:
+            index_dir (str): Directory containing one sub-directory per store
+            embeddings: Embeddings object bound to stores on load
+            cache (VectorStoreCache, optional): Cache to resolve stores from
+        """
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.cache = cache or get_vectorstore_cache()
+
+    def load_shard(self, store_id):
+        """
+        Return the loaded vector store for a shard.
+
+        Args:
+            store_id (str): Vector store ID
+
+        Returns:
+            FAISS: Loaded vector store
+        """
+        return self.cache.get(store_id, os.path.join(self.index_dir, store_id), self.embeddings)
+
+    def _search_one(self, store_id, query_vector, candidates_k, hybrid, query_text):
+        """Search one shard; returns (vectorstore, hits, lexical_hits)."""
+        index_path = os.path.join(self.index_dir, store_id)
+        vectorstore = self.load_shard(store_id)
+        # Documentos removidos (tombstones) são filtrados; busca alguns a mais para compensar
+        tombstones = load_tombstones(index_path)
+        fetch_k = candidates_k + len(tombstones)
+        with stage("ann_search"):
+            hits = drop_tombstoned(vectorstore, search_shard(vectorstore, query_vector, fetch_k), tombstones)
+        lexical_hits = []
+        if hybrid:
+            lexical_index = load_store_lexical_index(vectorstore, index_path)
+            if lexical_index is not None:
+                with stage("lexical_search"):
+                    lexical_hits = drop_tombstoned(vectorstore, lexical_index.search(query_text, fetch_k), tombstones)
+        return vectorstore, hits[:candidates_k], lexical_hits[:candidates_k]
+
+    def _search_one_batch(self, store_id, query_vectors, candidates_k, hybrid, query_texts):
+        """Search one shard for many queries; returns (vectorstore, hits per query, lexical hits per query)."""
+        index_path = os.path.join(self.index_dir, store_id)
+        vectorstore = self.load_shard(store_id)
+        tombstones = load_tombstones(index_path)
+        fetch_k = candidates_k + len(tombstones)
+        with stage("ann_search"):
+            hits = [
+                drop_tombstoned(vectorstore, query_hits, tombstones)[:candidates_k]
+                for query_hits in search_shard_batch(vectorstore, query_vectors, fetch_k)
+            ]
+        lexical_hits = [[] for _ in hits]
+        if hybrid:
+            lexical_index = load_store_lexical_index(vectorstore, index_path)
+            if lexical_index is not None:
+                # O BM25 não tem forma matricial: uma busca por consulta, no mesmo worker
+                with stage("lexical_search"):
+                    lexical_hits = [
+                        drop_tombstoned(vectorstore, lexical_index.search(text, fetch_k), tombstones)[:candidates_k]
+                        for text in query_texts
+                    ]
+        return vectorstore, hits, lexical_hits
+
+    def _tasks(self, query_vector, k, store_ids, query_text, mode):
+        """Build the per-shard tasks of one search; returns (tasks, candidates_k)."""
+        hybrid = mode == "hybrid"
+        candidates_k = max(k, int(os.getenv("HYBRID_CANDIDATES", "50"))) if hybrid else k
+        tasks = {
+            store_id: partial(self._search_one, store_id, query_vector, candidates_k, hybrid, query_text)
+            for store_id in store_ids
+        }
+        return tasks, candidates_k
+
+    @staticmethod
+    def _drop_mixed_metrics(store_ids, shards, shard_hits, lexical_hits, errors):
+        """
+        Drop shards whose index metric differs from the other shards, reporting them in errors.
+
+        Raw L2 distances and inner products cannot be ranked together. The
+        metric shared by most shards is kept; ties go to the first selected store.
+        """
+        metrics = {store_id: higher_is_better(shards[store_id]) for store_id in store_ids if store_id in shards}
+        counts = Counter(metrics.values())
+        if len(counts) <= 1:
+            return
+        kept = max(counts, key=counts.get)
+        for store_id, metric in metrics.items():
+            if metric != kept:
+                del shards[store_id], shard_hits[store_id], lexical_hits[store_id]
+                errors[store_id] = ValueError(
+                    f"Métrica do índice ({_metric_name(metric)}) diferente da dos demais stores "
+                    f"({_metric_name(kept)}); os resultados não podem ser combinados"
+                )
+
+    def _merge(self, shards, shard_hits, lexical_hits, k, candidates_k, hybrid):
+        """Merge per-shard hits (all of one metric) into the global top-k and read the winners from the docstores."""
+        if not shards:
+            return []
+        with stage("merge"):
+            higher_better = higher_is_better(next(iter(shards.values())))
+            if not hybrid:
+                winners = merge_shard_hits(shard_hits, k, higher_better=higher_better)
+                return fetch_documents(shards, winners)
+
+            vector_ranking = [(store_id, local_id) for store_id, local_id, _ in merge_shard_hits(shard_hits, candidates_k, higher_better)]
+            lexical_ranking = [(store_id, local_id) for store_id, local_id, _ in merge_shard_hits(lexical_hits, candidates_k, True)]
+            fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking], k)
+            winners = [(store_id, local_id, score) for (store_id, local_id), score in fused]
+            return fetch_documents(shards, winners)
+
+    def search(self, query_vector, k, store_ids, timeout=None, on_shard_done=None, query_text=None, mode="semantic"):
+        """
+        Return the global top-k over the selected stores.
+
+        In "hybrid" mode each shard also runs a BM25 search over its lexical
+        index; the global vector and lexical rankings of the top candidates are
+        fused with reciprocal rank fusion, and scores are the fused RRF values
+        (higher is better) instead of raw distances. A store whose index uses
+        another metric (L2 or inner product) than the other selected stores is
+        left out of the ranking and reported in errors.
+
+        Args:
+            query_vector (list or numpy.ndarray): Query embedding
+            k (int): Number of results to return
+            store_ids (list): Stores to search
+            timeout (float, optional): Per-store deadline in seconds
+            on_shard_done (callable, optional): Called with each TaskOutcome as shards finish;
+                successful outcomes carry (vectorstore, hits, lexical_hits) as result
+            query_text (str, optional): Query text, required in hybrid mode
+            mode (str): "semantic" or "hybrid"
+
+        Returns:
+            tuple: (results, errors) where results is a list of (Document, score)
+                tuples, best first, and errors maps store_id -> exception
+        """
+        tasks, candidates_k = self._tasks(query_vector, k, store_ids, query_text, mode)
+
+        shards, shard_hits, lexical_hits, errors = {}, {}, {}, {}
+        for outcome in fan_out(tasks, timeout=timeout):
+            record_store_search(outcome)
+            if outcome.error is not None:
+                errors[outcome.key] = outcome.error
+            else:
+                shards[outcome.key], shard_hits[outcome.key], lexical_hits[outcome.key] = outcome.result
+            if on_shard_done is not None:
+                on_shard_done(outcome)
+
+        self._drop_mixed_metrics(store_ids, shards, shard_hits, lexical_hits, errors)
+        return self._merge(shards, shard_hits, lexical_hits, k, candidates_k, mode == "hybrid"), errors
+
+    def search_batch(self, query_vectors, k, store_ids, timeout=None, query_texts=None, mode="semantic"):
+        """
+        Return the global top-k over the selected stores for many queries at once.
+
+        Each store is searched once, with the whole (n, d) query matrix in a
+        single FAISS call, instead of once per query; the per-query hits are
+        then merged across stores exactly as in search.
+
+        Args:
+            query_vectors (numpy.ndarray or list): (n, d) query embeddings
+            k (int): Number of results per query
+            store_ids (list): Stores to search
+            timeout (float, optional): Per-store deadline in seconds
+            query_texts (list, optional): Query texts, required in hybrid mode
+            mode (str): "semantic" or "hybrid"
+
+        Returns:
+            tuple: (results, errors) where results holds one list of (Document, score)
+                tuples per query, best first, and errors maps store_id -> exception
+        """
+        hybrid = mode == "hybrid"
+        candidates_k = max(k, int(os.getenv("HYBRID_CANDIDATES", "50"))) if hybrid else k
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        tasks = {
+            store_id: partial(self._search_one_batch, store_id, query_vectors, candidates_k, hybrid, query_texts)
+            for store_id in store_ids
+        }
+
+        shards, shard_hits, lexical_hits, errors = {}, {}, {}, {}
+        for outcome in fan_out(tasks, timeout=timeout):
+            record_store_search(outcome)
+            if outcome.error is not None:
+                errors[outcome.key] = outcome.error
+            else:
+                shards[outcome.key], shard_hits[outcome.key], lexical_hits[outcome.key] = outcome.result
+
+        self._drop_mixed_metrics(store_ids, shards, shard_hits, lexical_hits, errors)
+        results = [
+            self._merge(
+                shards,
+                {store_id: hits[i] for store_id, hits in shard_hits.items()},
+                {store_id: hits[i] for store_id, hits in lexical_hits.items()},
+                k,
+                candidates_k,
+                hybrid,
+            )
+            for i in range(len(query_vectors))
+        ]
+        return results, errors
+
+    def _load_for_prefetch(self, store_id, lexical):
+        vectorstore = self.load_shard(store_id)
+        if lexical:
+            load_store_lexical_index(vectorstore, os.path.join(self.index_dir, store_id))
+
+    def prefetch(self, store_ids, lexical=False):
+        """
+        Start loading shards in the background, e.g. while the query is being embedded.
+
+        A store whose load is already under way (from another session or an
+        earlier rerun) is not submitted again; its pending future is returned.
+
+        Args:
+            store_ids (list): Stores to load
+            lexical (bool): Also load their BM25 indexes
+
+        Returns:
+            list: Futures of the loads (errors surface again when the shard is searched)
+        """
+        futures = []
+        with _prefetch_lock:
+            for store_id in store_ids:
+                key = (self.index_dir, store_id)
+                future = _prefetches.get(key)
+                if future is None or future.done():
+                    future = _prefetches[key] = get_search_executor().submit(self._load_for_prefetch, store_id, lexical)
+                    future.add_done_callback(partial(_prefetch_done, key))
+                futures.append(future)
+        return futures
+
+    async def asearch(self, query_vector, k, store_ids, timeout=None, on_shard_done=None, query_text=None, mode="semantic"):
+        """
+        Async counterpart of search, for code running on an event loop.
+
+        Shards run on the shared search thread pool while the loop keeps
+        serving other requests. Arguments and return value are the same as
+        search.
+        """
+        tasks, candidates_k = self._tasks(query_vector, k, store_ids, query_text, mode)
+
+        shards, shard_hits, lexical_hits, errors = {}, {}, {}, {}
+        async for outcome in afan_out(tasks, timeout=timeout):
+            record_store_search(outcome)
+            if outcome.error is not None:
+                errors[outcome.key] = outcome.error
+            else:
+                shards[outcome.key], shard_hits[outcome.key], lexical_hits[outcome.key] = outcome.result
+            if on_shard_done is not None:
+                on_shard_done(outcome)
+
+        self._drop_mixed_metrics(store_ids, shards, shard_hits, lexical_hits, errors)
+        return self._merge(shards, shard_hits, lexical_hits, k, candidates_k, mode == "hybrid"), errors
@@ -0,0 +1,53 @@
+"""
+Configured vector stores and result serialization shared by the HTTP API and batch mode.
+"""
+import os
+
+from utils.config import load_config
+
+STORE_PREFIX = "VECTOR_STORE_ID_"
+
+
+def configured_stores():
+    """
+    Return the stores configured with VECTOR_STORE_ID_* variables.
+
+    Returns:
+        dict: Store name -> store ID
+    """
+    return {key[len(STORE_PREFIX):]: value for key, value in load_config().items() if key.startswith(STORE_PREFIX) and value}
+
+
+def resolve_store_ids(stores, index_dir):
+    """
+    Map store names (VECTOR_STORE_ID_<NAME>) or IDs to store IDs.
+
+    Only configured stores present under index_dir are accepted, so a caller
+    can never point the loader at another directory.
+
+    Args:
+        stores (list): Store names or IDs, or None for every configured store
+        index_dir (str): Directory containing vector stores
+
+    Returns:
+        list: Store IDs
+
+    Raises:
+        ValueError: If a store is not configured or has no directory under index_dir
+    """
+    configured = configured_stores()
+    if not stores:
+        return list(configured.values())
+    known_ids = set(configured.values())
+    store_ids = []
+    for store in stores:
+        store_id = configured.get(store.upper(), store)
+        if store_id not in known_ids or not os.path.isdir(os.path.join(index_dir, store_id)):
+            raise ValueError(f"Vector store não encontrado: {store}")
+        store_ids.append(store_id)
+    return store_ids
+
+
+def serialize_results(results):
+    """Convert (Document, score) tuples to JSON-friendly dicts."""
+    return [{"content": doc.page_content, "metadata": doc.metadata, "score": float(score)} for doc, score in results]
@@ -5,6 +5,7 @@ import os
 import subprocess
 import streamlit as st
 from streamlit_extras.stylable_container import stylable_container
+from utils.result_html import RESULTS_CSS, results_page_html
 
 def apply_custom_css():
     """Apply custom CSS styles to the Streamlit app."""
@@ -349,6 +350,9 @@ def apply_custom_css():
     }
     </style>
     """, unsafe_allow_html=True)
+    
+    # Shared classes of the pre-rendered result cards
+    st.markdown(RESULTS_CSS, unsafe_allow_html=True)
 
 def render_vector_db_selector(vector_db_options):
     """
@@ -570,7 +574,12 @@ def render_results_tab(query, answer, results, grouped=None, sources_sorted=None
         show_llm_answer (bool): Whether to show the LLM answer
         show_documents (bool): Whether to show the retrieved documents
         key_suffix (str): Suffix to add to keys to avoid duplicates
+        
+    Returns:
+        The empty answer placeholder to stream into when answer is None, otherwise None
     """
+    answer_placeholder = None
+    
     # Display query in a styled container
     with stylable_container(
         key=f"query_container{key_suffix}",
@@ -601,18 +610,25 @@ def render_results_tab(query, answer, results, grouped=None, sources_sorted=None
                 border-left: 4px solid var(--color-secondary);
             }"""
         ):
-            # Handle different answer formats (dict or string)
-            answer_text = answer["result"] if isinstance(answer, dict) and "result" in answer else answer
-            st.markdown(f"""<h3 style="margin-top: 0;"><i class="fas fa-robot" style="color: var(--color-secondary);"></i> Resposta</h3>
-            <div style="line-height: 1.6;">{answer_text}</div>""", unsafe_allow_html=True)
+            st.markdown("""<h3 style="margin-top: 0;"><i class="fas fa-robot" style="color: var(--color-secondary);"></i> Resposta</h3>""", unsafe_allow_html=True)
+            
+            # Answer still being generated: hand back a placeholder for streaming
+            if answer is None:
+                answer_placeholder = st.empty()
+            else:
+                render_answer(st.empty(), answer)
     
     # Display retrieved documents only if show_documents is True
     if show_documents:
         # Display retrieved documents header
         st.markdown(f"""<h3><i class="fas fa-file-alt" style="color: var(--color-primary);"></i> Top {top_k} documentos por índice de similaridade</h3>""", unsafe_allow_html=True)
         
+        # Pre-rendered HTML pages (default): one element per page, more loaded on demand
+        if os.getenv("RESULTS_RENDER_MODE", "html") == "html":
+            render_documents_html(results, grouped=bool(grouped and sources_sorted), key_suffix=key_suffix)
+        
         # If we have grouped results, display them by source with improved styling
-        if grouped and sources_sorted:
+        elif grouped and sources_sorted:
             for source_idx, source in enumerate(sources_sorted):
                 formatted_source = format_source_name(source)
                 
@@ -700,6 +716,69 @@ def render_results_tab(query, answer, results, grouped=None, sources_sorted=None
                                 </div>
                                 """, unsafe_allow_html=True)
                                 #st.markdown("---")
+    
+    return answer_placeholder
+
+def _show_more_results(state_key, page_size):
+    """Reveal one more page of results (button callback, runs before the rerun)."""
+    st.session_state[state_key] = st.session_state.get(state_key, page_size) + page_size
+
+def render_documents_html(results, grouped=True, key_suffix=""):
+    """
+    Render results as pre-rendered HTML pages, loading more pages on demand.
+    
+    The visible results are drawn as a single HTML block styled by shared
+    CSS classes. The rendered blocks are memoized in the session per result
+    list, so reruns that keep the same results (changing a parameter,
+    loading another page and coming back) render nothing again.
+    The page size comes from RESULTS_PAGE_SIZE (default 10).
+    
+    Args:
+        results (list): List of (document, score) tuples in rank order
+        grouped (bool): Group the visible results by source
+        key_suffix (str): Suffix to add to keys to avoid duplicates
+    """
+    page_size = int(os.getenv("RESULTS_PAGE_SIZE", "10"))
+    state_key = f"results_visible{key_suffix}"
+    visible = min(st.session_state.get(state_key, page_size), len(results))
+    
+    # Render model of the current result list (a new search replaces it)
+    model = st.session_state.get("results_render_model")
+    if model is None or model["results"] is not results:
+        model = st.session_state["results_render_model"] = {"results": results, "pages": {}}
+    page_key = (visible, grouped)
+    if page_key not in model["pages"]:
+        model["pages"][page_key] = results_page_html(results, format_source_name, visible, grouped=grouped)
+    
+    st.markdown(model["pages"][page_key], unsafe_allow_html=True)
+    
+    if visible < len(results):
+        st.button(
+            f"Carregar mais ({visible} de {len(results)})",
+            key=f"more_results{key_suffix}",
+            on_click=_show_more_results,
+            args=(state_key, page_size)
+        )
+
+def render_answer(placeholder, answer):
+    """
+    Render a finished LLM answer, with its generation timings, into a placeholder.
+    
+    Args:
+        placeholder: Streamlit element (st.empty()) that receives the answer
+        answer (dict or str): The LLM answer
+    """
+    # Handle different answer formats (dict or string)
+    answer_text = answer["result"] if isinstance(answer, dict) and "result" in answer else answer
+    timings = answer.get("timings") if isinstance(answer, dict) else None
+    
+    timings_html = ""
+    if timings:
+        timings_html = f"""<div style="font-size: 0.8rem; opacity: 0.7; margin-top: 0.75rem;">
+        <i class="fas fa-stopwatch"></i> Primeiro token: {timings['ttft_s']:.2f}s  -  Total: {timings['total_s']:.2f}s{"  -  Resposta em cache" if answer.get("cached") else ""}
+        </div>"""
+    
+    placeholder.markdown(f"""<div style="line-height: 1.6;">{answer_text}</div>{timings_html}""", unsafe_allow_html=True)
 
 
 def format_source_name(source):
@@ -1,23 +1,305 @@
 """
 Vector store operations for the RAG application.
 """
+import json
+import logging
 import os
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
+import pickle
+import shutil
+from utils.ann_index import apply_search_params, read_index_spec
+from utils.lazy_imports import lazy_import
+from utils.search_tiers import attach_full_vectors
+
+# Importados no primeiro uso (ver utils.lazy_imports)
+faiss = lazy_import("faiss")
+langchain_vectorstores = lazy_import("langchain_community.vectorstores")
+
+# Presente no diretório do store enquanto replace_store_files troca os arquivos
+SWAP_MARKER = ".swapping"
+
+logger = logging.getLogger(__name__)
 
 def initialize_embeddings():
     """
-    Initialize OpenAI embeddings.
+    Initialize embeddings from the configured provider (EMBEDDING_PROVIDER, default "openai").
+    
+    Returns:
+        Embeddings: Embeddings object
+    """
+    # langchain_core (base das classes de embeddings) só é importado ao criar o provedor
+    from utils.embedding_providers import get_embedding_provider
+
+    return get_embedding_provider()
+
+def index_mmap_enabled():
+    """
+    Tell whether stores should be opened memory-mapped (INDEX_MMAP, default on).
+    
+    Returns:
+        bool: True if memory mapping is enabled
+    """
+    return os.getenv("INDEX_MMAP", "1").lower() not in ("0", "false", "no", "")
+
+def read_faiss_index(index_file, mmap=False):
+    """
+    Read a FAISS index, memory-mapping it read-only when requested.
+    
+    A mapped index lives in the OS page cache, so every worker process that
+    opens the same file shares its pages instead of holding a private copy.
+    Index types that cannot be mapped are read into memory as usual.
+    
+    Args:
+        index_file (str): Path to index.faiss
+        mmap (bool): Try to memory-map the index
+        
+    Returns:
+        tuple: (faiss.Index, mapped) where mapped tells whether the vectors are really mapped
+    """
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        # IO_FLAG_MMAP_IFC mapeia índices flat, mas impede o mapeamento das listas IVF: tenta com e sem ele
+        for extra in (getattr(faiss, "IO_FLAG_MMAP_IFC", 0), 0):
+            try:
+                index = faiss.read_index(index_file, flags | extra)
+                return index, index_is_mapped(index)
+            except RuntimeError:
+                pass
+    return faiss.read_index(index_file), False
+
+def index_is_mapped(index):
+    """
+    Tell whether FAISS memory-maps the vectors of an index read with IO_FLAG_MMAP.
+    
+    The flag only maps IVF inverted lists; flat-code indexes (Flat, scalar
+    quantizer, PQ) are mapped only by FAISS builds with IO_FLAG_MMAP_IFC, and
+    other types (e.g. the HNSW graph) are always read into private memory.
+    
+    Args:
+        index (faiss.Index): Index read with the mmap flags
+        
+    Returns:
+        bool: True if the bulk of the index lives in the shared page cache
+    """
+    if faiss.try_extract_index_ivf(index) is not None:
+        return True
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    flat_codes = getattr(faiss, "IndexFlatCodes", None)
+    return hasattr(faiss, "IO_FLAG_MMAP_IFC") and flat_codes is not None and isinstance(index, flat_codes)
+
+def load_faiss_store(index_dir, embeddings, mmap=False):
+    """
+    Load a store saved with FAISS.save_local, optionally memory-mapping its index.
+    
+    Args:
+        index_dir (str): Directory containing index.faiss and index.pkl
+        embeddings: Embeddings object
+        mmap (bool): Memory-map index.faiss read-only
+        
+    Returns:
+        tuple: (FAISS vector store object, status string "mmap" or "loaded")
+    """
+    index, mapped = read_faiss_index(os.path.join(index_dir, "index.faiss"), mmap=mmap)
+    # Provedores com dimensão conhecida (local, hash) precisam coincidir com o índice
+    dimension = getattr(embeddings, "dimension", None) or getattr(embeddings, "dimensions", None)
+    if dimension and dimension != index.d:
+        raise ValueError(
+            f"O índice em {index_dir} tem dimensão {index.d}, mas o provedor de embeddings gera {dimension}; "
+            "recrie o índice com o mesmo provedor (EMBEDDING_PROVIDER / EMBEDDING_DIM)"
+        )
+    # Parâmetros de busca (nprobe/efSearch) escolhidos para este store
+    spec = read_index_spec(index_dir)
+    apply_search_params(index, spec)
+    with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    vectorstore = langchain_vectorstores.FAISS(embeddings, index, docstore, index_to_docstore_id)
+    # Índices comprimidos: vetores completos mapeados para a reordenação exata
+    attach_full_vectors(vectorstore, index_dir, spec)
+    return vectorstore, "mmap" if mapped else "loaded"
+
+def swap_in_progress(index_dir):
+    """
+    Tell whether replace_store_files is swapping a store's files right now.
+    
+    Args:
+        index_dir (str): Store directory
+        
+    Returns:
+        bool: True while the store's files may come from different versions
+    """
+    return os.path.exists(os.path.join(index_dir, SWAP_MARKER))
+
+def pid_alive(pid):
+    """
+    Tell whether a process with the given id is running on this machine.
+    
+    Args:
+        pid (int): Process id
+        
+    Returns:
+        bool: True if the process exists
+    """
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def read_swap_marker(index_dir):
+    """
+    Read the swap marker of a store.
+    
+    Args:
+        index_dir (str): Store directory
+        
+    Returns:
+        dict: pid, source (tmp directory being swapped in) and state ("swapping" or "failed"),
+            or None when no swap is recorded
+    """
+    try:
+        with open(os.path.join(index_dir, SWAP_MARKER), "r", encoding="utf-8") as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        # Marcador antigo: só o PID do processo
+        return {"pid": int(text) if text.strip().isdigit() else None, "source": None, "state": "swapping"}
+
+def _write_swap_marker(index_dir, marker):
+    """Write the swap marker atomically, so it is never read half-written."""
+    path = os.path.join(index_dir, SWAP_MARKER)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(marker, f)
+    os.replace(path + ".tmp", path)
+
+def stale_swap(index_dir):
+    """
+    Tell whether a store's swap marker was left by a swap that failed or whose process died.
+    
+    Args:
+        index_dir (str): Store directory
+        
+    Returns:
+        bool: True if the swap will never finish on its own
+    """
+    marker = read_swap_marker(index_dir)
+    if marker is None:
+        return False
+    return marker.get("state") == "failed" or not pid_alive(marker.get("pid"))
+
+def _move_store_files(source_dir, index_dir):
+    """Move every entry left in source_dir into index_dir; safe to run again after an interruption."""
+    names = sorted(os.listdir(source_dir), key=lambda name: (name == "index.faiss", name == "index.pkl", name))
+    for name in names:
+        source = os.path.join(source_dir, name)
+        target = os.path.join(index_dir, name)
+        if os.path.isdir(source):
+            # Diretórios auxiliares (ex.: bm25/) são trocados por renomeação
+            old = target + ".old"
+            if os.path.exists(target):
+                shutil.rmtree(old, ignore_errors=True)
+                os.replace(target, old)
+            os.replace(source, target)
+        else:
+            os.replace(source, target)
+    os.rmdir(source_dir)
+    _remove_old_dirs(index_dir)
+
+def _remove_old_dirs(index_dir):
+    """Delete the previous versions of auxiliary directories left by a swap."""
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name.endswith(".old") and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+def replace_store_files(source_dir, index_dir):
+    """
+    Move a freshly written store from source_dir into index_dir.
+    
+    Each file is swapped with os.replace, so readers never see a partially
+    written file; index.faiss is replaced last. A marker file is present for
+    the whole swap, and loaders (see utils.index_cache.load_consistent) only
+    accept a load that started and ended without it and with the same
+    fingerprint of every store file, so a load never pairs files of two
+    versions. Processes that already loaded (or memory-mapped) the old files
+    keep using them.
+    
+    If the swap fails, the marker is kept and marked as failed, and one left
+    by a killed process names a dead PID; recover_store_swap then finishes
+    the swap from the files still in source_dir.
+    
+    Args:
+        source_dir (str): Directory with the new store files (removed afterwards)
+        index_dir (str): Live store directory
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    marker = {"pid": os.getpid(), "source": os.path.abspath(source_dir), "state": "swapping"}
+    _write_swap_marker(index_dir, marker)
+    try:
+        _move_store_files(source_dir, index_dir)
+    except BaseException:
+        # O store pode ter arquivos de duas versões: o marcador fica até a recuperação
+        _write_swap_marker(index_dir, dict(marker, state="failed"))
+        raise
+    os.remove(os.path.join(index_dir, SWAP_MARKER))
+
+def recover_store_swap(index_dir):
+    """
+    Finish a swap that failed or whose process died, so the store has one version again.
+    
+    The new files are all written before a swap starts, so the swap is rolled
+    forward: whatever is left in the marker's source directory is moved in.
+    The caller must hold the store's StoreWriteLock (utils.index_mutation).
+    
+    Args:
+        index_dir (str): Store directory
+        
+    Returns:
+        bool: True if an interrupted swap was found and finished
+    """
+    marker = read_swap_marker(index_dir)
+    if marker is None:
+        return False
+    source_dir = marker.get("source")
+    if source_dir and os.path.isdir(source_dir):
+        _move_store_files(source_dir, index_dir)
+    else:
+        _remove_old_dirs(index_dir)
+    os.remove(os.path.join(index_dir, SWAP_MARKER))
+    logger.warning("Troca interrompida de arquivos concluída em %s", index_dir)
+    return True
+
+def write_and_swap_store(index_path, write):
+    """
+    Write a new version of a store next to the live one and swap it into place.
+    
+    The files are written by `write` into "<store>.tmp" and moved in with
+    replace_store_files. The tmp directory is shared by every writer of the
+    store, so callers must hold the store's StoreWriteLock (utils.index_mutation).
     
+    Args:
+        index_path (str): Live store directory
+        write (callable): Function taking the tmp directory and writing the new files into it
+        
     Returns:
-        OpenAIEmbeddings: Embeddings object
+        The value returned by write
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is not set")
-    return OpenAIEmbeddings(openai_api_key=api_key)
+    # Uma troca anterior interrompida é concluída antes de o diretório temporário ser reaproveitado
+    recover_store_swap(index_path)
+    tmp_dir = index_path.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    result = write(tmp_dir)
+    replace_store_files(tmp_dir, index_path)
+    return result
 
-def load_vectorstore(docs, embeddings, index_dir):
+def load_vectorstore(docs, embeddings, index_dir, mmap=False, index_spec=None):
     """
     Load existing vector store or create a new one if force_rebuild is True.
     This function should only be used by create_vector_store.py for creating new indices.
@@ -28,6 +310,9 @@ def load_vectorstore(docs, embeddings, index_dir):
         embeddings: Embeddings object
         index_dir (str): Directory to save/load the index
         force_rebuild (bool): Force rebuilding the index
+        mmap (bool): Open the index memory-mapped and read-only
+        index_spec (dict, optional): Index type and parameters for a new index
+            (flat, ivf_flat, ivf_pq, hnsw, sq_fp16 or sq8); defaults to index_spec_from_env()
         
     Returns:
         tuple: (FAISS vector store object, status string)
@@ -39,13 +324,21 @@ def load_vectorstore(docs, embeddings, index_dir):
     if os.path.exists(index_file):
         try:
             # Load existing index
-            vectorstore = FAISS.load_local(
-                index_dir,
-                embeddings,
-                allow_dangerous_deserialization=True
-            )
-            return vectorstore, "loaded"
+            return load_faiss_store(index_dir, embeddings, mmap=mmap)
         except Exception as e:
             raise Exception(f"Erro ao carregar índice existente: {e}")
     
-   
+    if not docs:
+        return None, "missing"
+    
+    # Criar novo índice pelo pipeline de construção (exato ou aproximado, conforme o spec)
+    from utils.index_builder import build_store
+    build_store(
+        os.path.basename(os.path.normpath(index_dir)),
+        docs,
+        os.path.dirname(os.path.normpath(index_dir)),
+        embeddings=embeddings,
+        index_spec=index_spec
+    )
+    vectorstore, _ = load_faiss_store(index_dir, embeddings, mmap=mmap)
+    return vectorstore, "created"
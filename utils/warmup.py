@@ -0,0 +1,164 @@
+"""
+Background warm-up of a fresh process for the RAG application.
+
+start_warmup() imports the deferred heavy modules, creates the shared
+embeddings and LLM clients and loads the configured stores into the
+process-wide cache, all from a background thread, so the first search after
+a deploy or scale-up finds everything ready. warmup_status() reports the
+progress; the app, the HTTP API and the metrics exporter expose it as a
+readiness check.
+"""
+import logging
+import os
+import threading
+import time
+
+from utils.config import load_config
+from utils.fanout import fan_out
+from utils.lazy_imports import load_deferred_modules
+from utils.metrics import WARMUP_READY
+from utils.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+_status = {
+    "state": "idle",  # idle, warming, ready, failed
+    "stores_total": 0,
+    "stores_loaded": 0,
+    "errors": {},
+    "seconds": None,
+}
+_status_lock = threading.Lock()
+_thread = None
+
+
+def warmup_enabled():
+    """
+    Tell whether the background warm-up runs (WARMUP, default on).
+
+    Returns:
+        bool: True if enabled
+    """
+    return os.getenv("WARMUP", "1").lower() not in ("0", "false", "no", "")
+
+
+def configured_store_ids():
+    """
+    Return the IDs of the stores configured with VECTOR_STORE_ID_* variables.
+
+    Returns:
+        list: Store IDs, in variable name order
+    """
+    config = load_config()
+    return [config[key] for key in sorted(config) if key.startswith("VECTOR_STORE_ID_") and config[key]]
+
+
+def _update(**fields):
+    with _status_lock:
+        _status.update(fields)
+
+
+def warmup_status():
+    """
+    Return the progress of the warm-up.
+
+    Returns:
+        dict: state (idle, warming, ready, failed), stores_total, stores_loaded,
+            errors (store_id -> message) and seconds (total, once finished)
+    """
+    with _status_lock:
+        return dict(_status, errors=dict(_status["errors"]))
+
+
+def is_ready():
+    """
+    Tell whether the process can serve searches at full speed.
+
+    A process without warm-up (WARMUP=0) is always ready; stores that failed
+    to load do not block readiness, they are reported in warmup_status(). A
+    warm-up that failed before the stores (imports, embeddings or LLM client)
+    leaves the process not ready.
+
+    Returns:
+        bool: True when the warm-up succeeded or is disabled
+    """
+    return not warmup_enabled() or warmup_status()["state"] == "ready"
+
+
+def _run(index_dir, store_ids, hybrid):
+    # Importados aqui para não pesar na importação deste módulo
+    from utils.clients import get_shared_embeddings, get_shared_llm
+    from utils.index_cache import load_store_lexical_index
+    from utils.sharded_index import ShardedIndex
+
+    start = time.perf_counter()
+    try:
+        with stage("warmup"):
+            modules = load_deferred_modules()
+            logger.info("Aquecimento: %d módulos importados", len(modules))
+            embeddings = get_shared_embeddings()
+            get_shared_llm()
+
+            index = ShardedIndex(index_dir, embeddings)
+
+            def load(store_id):
+                vectorstore = index.load_shard(store_id)
+                if hybrid:
+                    load_store_lexical_index(vectorstore, os.path.join(index_dir, store_id))
+
+            tasks = {store_id: (lambda store_id=store_id: load(store_id)) for store_id in store_ids}
+            for outcome in fan_out(tasks):
+                with _status_lock:
+                    if outcome.error is None:
+                        _status["stores_loaded"] += 1
+                    else:
+                        _status["errors"][outcome.key] = f"{type(outcome.error).__name__}: {outcome.error}"
+                        logger.warning("Aquecimento: falha ao carregar %s: %s", outcome.key, outcome.error)
+    except Exception as e:
+        logger.exception("Aquecimento interrompido")
+        with _status_lock:
+            _status["errors"]["_"] = f"{type(e).__name__}: {e}"
+        _update(state="failed", seconds=time.perf_counter() - start)
+        WARMUP_READY.set(0)
+    else:
+        _update(state="ready", seconds=time.perf_counter() - start)
+        WARMUP_READY.set(1)
+        logger.info("Aquecimento concluído em %.1fs", time.perf_counter() - start)
+
+
+def start_warmup(index_dir=None, store_ids=None):
+    """
+    Start the background warm-up (once per process).
+
+    Stores come from the VECTOR_STORE_ID_* variables and are loaded into the
+    process-wide cache in parallel; with SEARCH_MODE=hybrid their BM25
+    indexes are loaded too. Stores beyond the cache budget (INDEX_CACHE_MAX_MB)
+    are loaded and then evicted as usual, so the budget should cover the
+    stores meant to stay warm.
+
+    Args:
+        index_dir (str, optional): Directory containing the stores; defaults to PATH_INDEX
+        store_ids (list, optional): Stores to load; defaults to every configured store
+
+    Returns:
+        bool: True if this call started the warm-up
+    """
+    global _thread
+    if not warmup_enabled():
+        return False
+    index_dir = index_dir or os.getenv("PATH_INDEX")
+    with _status_lock:
+        if _thread is not None:
+            return False
+        if not index_dir:
+            store_ids = []
+        elif store_ids is None:
+            store_ids = configured_store_ids()
+        store_ids = [store_id for store_id in store_ids
+                     if os.path.exists(os.path.join(index_dir, store_id, "index.faiss"))]
+        _status.update(state="warming", stores_total=len(store_ids))
+        WARMUP_READY.set(0)
+        hybrid = os.getenv("SEARCH_MODE", "semantic") == "hybrid"
+        _thread = threading.Thread(target=_run, args=(index_dir, store_ids, hybrid), name="rag-warmup", daemon=True)
+        _thread.start()
+    return True